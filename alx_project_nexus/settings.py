@@ -58,7 +58,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'product_api.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves static files before sessions, auth, request logging and the
+    # IP blocklist run
+    'product_api.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,7 +70,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'product_api.middleware.RequestLoggingMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    'product_api.middleware.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'alx_project_nexus.urls'
@@ -180,10 +184,34 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'product_api.tasks.flag_suspicious_ips',
         'schedule': crontab(minute=0, hour='*'),  # Every hour
     },
+    'enrich-request-logs': {
+        'task': 'product_api.tasks.enrich_request_logs',
+        'schedule': crontab(),  # Every minute
+    },
+    'expire-blocked-ips': {
+        'task': 'product_api.tasks.expire_blocked_ips',
+        'schedule': crontab(),  # Every minute
+    },
+    'rollup-request-logs': {
+        'task': 'product_api.tasks.rollup_request_logs',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'drop-expired-request-logs': {
+        'task': 'product_api.tasks.drop_expired_request_logs',
+        'schedule': crontab(minute=30, hour=0),  # Daily, after midnight
+    },
     'save-daily-sales': {
         'task': 'product_api.tasks.save_daily_sales_task',
         'schedule': crontab(minute=0, hour=0),  # runs at midnight
     },
+    'requeue-payment-webhooks': {
+        'task': 'product_api.tasks.requeue_payment_webhooks',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'rebuild-product-recommendations': {
+        'task': 'product_api.tasks.rebuild_product_recommendations',
+        'schedule': crontab(minute=0, hour=3),  # Nightly, off-peak
+    },
 }
 
 
@@ -193,6 +221,23 @@ CHAPA_TRANSACTION_MODEL = 'product_api.Transaction'
 CHAPA_RETURN_URL = "https://0911b83c8cae.ngrok-free.app/payment/success/"
 CHAPA_WEBHOOK_URL = "https://0911b83c8cae.ngrok-free.app/api/payment/webhook/"
 CHAPA_API_URL = "https://api.chapa.co"
+# Gateway client (see product_api/chapa.py): pooled connections, timeouts in
+# seconds, retries with jittered backoff and a circuit breaker that refuses
+# calls for CHAPA_BREAKER_RESET seconds after CHAPA_BREAKER_THRESHOLD
+# failures in a row. CHAPA_STUB answers every call in-process, for offline
+# development and load tests; nothing reaches Chapa.
+CHAPA_CONNECT_TIMEOUT = env.float("CHAPA_CONNECT_TIMEOUT", default=3.05)
+CHAPA_READ_TIMEOUT = env.float("CHAPA_READ_TIMEOUT", default=10.0)
+CHAPA_MAX_RETRIES = env.int("CHAPA_MAX_RETRIES", default=2)
+CHAPA_RETRY_BACKOFF = env.float("CHAPA_RETRY_BACKOFF", default=0.2)
+CHAPA_POOL_SIZE = env.int("CHAPA_POOL_SIZE", default=10)
+CHAPA_BREAKER_THRESHOLD = env.int("CHAPA_BREAKER_THRESHOLD", default=5)
+CHAPA_BREAKER_RESET = env.float("CHAPA_BREAKER_RESET", default=30.0)
+CHAPA_STUB = env.bool("CHAPA_STUB", default=False)
+CHAPA_STUB_LATENCY = env.float("CHAPA_STUB_LATENCY", default=0.0)
+# Seconds before a payment webhook whose settlement has not finished is
+# handed to another worker (see product_api/payments.py)
+PAYMENT_WEBHOOK_RETRY_AFTER = env.int("PAYMENT_WEBHOOK_RETRY_AFTER", default=300)
 
 
 CACHES = {
@@ -200,11 +245,121 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": env("REDIS_URL"),
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # DefaultClient that reports cache timings to PerformanceMiddleware
+            "CLIENT_CLASS": "product_api.perf.InstrumentedRedisClient",
         }
     }
 }
 
+# Lifetime of serialized catalog snapshots (see product_api/catalog.py);
+# writes switch readers to a new generation long before this expires
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", default=3600)
+# Rendered product list/detail bodies kept per process, and the smallest
+# body stored compressed (gzip, plus br when the brotli package is
+# installed); see product_api/prerender.py
+PRERENDER_LOCAL_SIZE = env.int("PRERENDER_LOCAL_SIZE", default=256)
+PRERENDER_MIN_COMPRESS = env.int("PRERENDER_MIN_COMPRESS", default=512)
+# Reviews included per product by ?expand=reviews on product list pages
+PRODUCT_LIST_REVIEWS = env.int("PRODUCT_LIST_REVIEWS", default=3)
+# Co-purchase neighbours kept per product, and the largest order counted
+# (see product_api/recommendations.py)
+RECOMMENDATION_TOP_K = env.int("RECOMMENDATION_TOP_K", default=20)
+RECOMMENDATION_MAX_BASKET = env.int("RECOMMENDATION_MAX_BASKET", default=50)
+# Rows the global sales account is split over (see product_api/counters.py)
+ACCOUNT_SHARDS = env.int("ACCOUNT_SHARDS", default=16)
+# Bucket boundaries of the products/facets/ price facet
+FACET_PRICE_EDGES = env.list("FACET_PRICE_EDGES", cast=int, default=[25, 50, 100, 250])
+
+# Full-text product search (see product_api/search.py). Chosen from the
+# database vendor unless set to a backend's dotted path.
+SEARCH_BACKEND = env("SEARCH_BACKEND", default=None)
+SEARCH_MAX_RESULTS = env.int("SEARCH_MAX_RESULTS", default=500)
+# products/suggest/ index: generation check interval and forced rebuild age
+# (popularity comes from orders, which do not move the catalog generation)
+SUGGEST_REFRESH_INTERVAL = env.float("SUGGEST_REFRESH_INTERVAL", default=5.0)
+SUGGEST_MAX_AGE = env.int("SUGGEST_MAX_AGE", default=900)
+
+# Buffered request logging (see product_api/logbuffer.py)
+REQUEST_LOG_BUFFER_SIZE = env.int("REQUEST_LOG_BUFFER_SIZE", default=10000)
+REQUEST_LOG_BATCH_SIZE = env.int("REQUEST_LOG_BATCH_SIZE", default=500)
+REQUEST_LOG_FLUSH_INTERVAL = env.float("REQUEST_LOG_FLUSH_INTERVAL", default=2.0)
+# Raw logs are kept in one table per day; older days are dropped
+REQUEST_LOG_RETENTION_DAYS = env.int("REQUEST_LOG_RETENTION_DAYS", default=30)
+# Routes that skip abuse counting and request logging (see
+# product_api/sampling.py). The blocklist still applies to them, except for
+# static files: WhiteNoise answers those before RequestLoggingMiddleware runs.
+REQUEST_LOG_BYPASS_PREFIXES = [
+    '/static/', '/media/', '/swagger', '/redoc', '/favicon.ico', '/health/',
+]
+# Fraction of requests logged per route: "<prefix>" or "<METHOD> <prefix>",
+# longest prefix wins. 4xx/5xx responses are always logged. Logged rows carry
+# 1/rate as their weight, so rollups still count every request.
+REQUEST_LOG_SAMPLING = {
+    'GET /api/products/': 0.01,
+    'GET /api/categories/': 0.01,
+    'GET /api/reviews/': 0.01,
+    '/admin': 1.0,
+    '/api/admin/': 1.0,
+    '/api/token/': 1.0,
+    '/api/register/': 1.0,
+}
+REQUEST_LOG_DEFAULT_SAMPLE_RATE = env.float("REQUEST_LOG_DEFAULT_SAMPLE_RATE", default=1.0)
+
+# Reverse proxies in front of the app that append to X-Forwarded-For; the
+# client IP is read that many hops from the right (see product_api/utils.py).
+# 0 ignores the header and uses REMOTE_ADDR.
+TRUSTED_PROXY_COUNT = env.int("TRUSTED_PROXY_COUNT", default=0)
+# django_ratelimit's key='ip' resolves the client the same way
+RATELIMIT_IP_META_KEY = 'product_api.utils.get_client_ip'
+
+# Seconds between checks of the blocklist version in the cache
+BLOCKLIST_REFRESH_INTERVAL = env.float("BLOCKLIST_REFRESH_INTERVAL", default=5.0)
+
+# Real-time abuse detection (see product_api/abuse.py)
+ABUSE_WINDOW_SECONDS = env.int("ABUSE_WINDOW_SECONDS", default=3600)
+ABUSE_BUCKET_SECONDS = env.int("ABUSE_BUCKET_SECONDS", default=60)
+ABUSE_REQUEST_THRESHOLD = env.int("ABUSE_REQUEST_THRESHOLD", default=100)
+# Path prefixes: '/admin' also covers '/admin/...'
+ABUSE_SENSITIVE_PATHS = ['/admin', '/login']
+ABUSE_SENSITIVE_THRESHOLD = env.int("ABUSE_SENSITIVE_THRESHOLD", default=1)
+# Seconds to block a flagged IP for; 0 disables auto-escalation
+ABUSE_AUTO_BLOCK_SECONDS = env.int("ABUSE_AUTO_BLOCK_SECONDS", default=0)
+
+# Token-bucket rate limits per URL name. `rate` is requests per s/m/h/d,
+# `burst` the bucket size (defaults to the rate) and `key` one of
+# ip, user (session user, then JWT subject, then IP) or jwt.
+RATE_LIMIT_POLICIES = {
+    'list-all-product': {'rate': '120/m', 'burst': 60, 'key': 'ip'},
+    'search-product': {'rate': '60/m', 'burst': 20, 'key': 'ip'},
+    'product-suggest': {'rate': '600/m', 'burst': 60, 'key': 'ip'},
+    'product-details': {'rate': '240/m', 'burst': 60, 'key': 'ip'},
+    'related-products': {'rate': '120/m', 'burst': 30, 'key': 'ip'},
+    'wishlist-checkout': {'rate': '10/m', 'burst': 3, 'key': 'user'},
+    'reservation-checkout': {'rate': '10/m', 'burst': 3, 'key': 'user'},
+    'verify-payment': {'rate': '60/m', 'key': 'ip'},
+    'verify-reserve-payment': {'rate': '60/m', 'key': 'ip'},
+    'register': {'rate': '10/h', 'key': 'ip'},
+}
+# Applied to every other named route; set to None to disable
+RATE_LIMIT_DEFAULT_POLICY = {'rate': '600/m', 'burst': 120, 'key': 'user'}
+
+# Request timings kept per endpoint for admin/performance/
+PERF_SAMPLE_SIZE = env.int("PERF_SAMPLE_SIZE", default=1000)
+
+# Serve the hot catalog reads from the native async views in
+# product_api/async_views.py. Enable when running under an ASGI server.
+ASYNC_READ_VIEWS = env.bool("ASYNC_READ_VIEWS", default=False)
+
+# Geolocation for request logs, resolved in batches by
+# tasks.enrich_request_logs. The mmap backend reads a file built with
+# `manage.py build_geoip_db`; product_api.geoip.IPInfoGeoBackend uses ipinfo
+GEOIP_BACKEND = env("GEOIP_BACKEND", default="product_api.geoip.MMapGeoBackend")
+GEOIP_DATABASE = env("GEOIP_DATABASE", default=os.path.join(BASE_DIR, 'geoip', 'ip-ranges.bin'))
+GEOIP_LRU_SIZE = env.int("GEOIP_LRU_SIZE", default=10000)
+GEOIP_REMOTE_CONCURRENCY = env.int("GEOIP_REMOTE_CONCURRENCY", default=8)
+GEO_ENRICH_BATCH_SIZE = env.int("GEO_ENRICH_BATCH_SIZE", default=500)
+IPINFO_ACCESS_TOKEN = env("IPINFO_ACCESS_TOKEN", default="7567b26db7c484")
+
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
@@ -47,8 +47,14 @@ def home(request):
     })
 
 
+# Liveness probe for load balancers; bypasses request logging
+def health(request):
+    return JsonResponse({"status": "ok"})
+
+
 urlpatterns = [
     path('', home, name="home"),
+    path('health/', health, name="health"),
     path('admin/', admin.site.urls),
     path('chapa-webhook/', include('django_chapa.urls')),
     path('api/', include('product_api.urls')),
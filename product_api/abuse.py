@@ -0,0 +1,161 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+PENDING_FLAGS_KEY = "abuse:pending"
+
+# Sliding-window counter kept as a hash of time buckets per key. Bumps the
+# current bucket, drops buckets that fell out of the window and returns the
+# window total for every key, all in one round-trip.
+SLIDING_WINDOW_SCRIPT = """
+local totals = {}
+local oldest = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    redis.call('HINCRBY', key, ARGV[1], 1)
+    local total = 0
+    local fields = redis.call('HGETALL', key)
+    for j = 1, #fields, 2 do
+        if tonumber(fields[j]) < oldest then
+            redis.call('HDEL', key, fields[j])
+        else
+            total = total + tonumber(fields[j + 1])
+        end
+    end
+    redis.call('EXPIRE', key, ARGV[3])
+    totals[i] = total
+end
+return totals
+"""
+
+
+def sensitive_prefix(path, prefixes):
+    """
+    The entry of `prefixes` that `path` falls under, matching whole path
+    segments: '/admin' covers '/admin' and '/admin/...', not '/administer'.
+    """
+    for prefix in prefixes:
+        base = prefix.rstrip('/')
+        if path == base or path.startswith(base + '/'):
+            return prefix
+    return None
+
+
+def sensitive_paths_q(prefixes, field='path'):
+    """The database side of sensitive_prefix(), as one Q object."""
+    condition = Q(pk__in=[])
+    for prefix in prefixes:
+        base = prefix.rstrip('/')
+        condition |= Q(**{field: base}) | Q(**{f'{field}__startswith': base + '/'})
+    return condition
+
+
+# Real-time abuse detection: counts requests per IP and hits on sensitive
+# paths per IP, and flags an IP the moment a threshold is crossed.
+class AbuseDetector:
+    def __init__(self, window_seconds=3600, bucket_seconds=60,
+                 request_threshold=100, sensitive_paths=(),
+                 sensitive_threshold=1):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.request_threshold = request_threshold
+        self.sensitive_paths = tuple(sensitive_paths)
+        self.sensitive_threshold = sensitive_threshold
+        self._script = None
+
+    @property
+    def redis(self):
+        return get_redis_connection("default")
+
+    def _counter_script(self):
+        if self._script is None:
+            self._script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+        return self._script
+
+    def record(self, ip, path):
+        """Count a request and flag `ip` if it crossed a threshold."""
+        bucket = int(time.time()) // self.bucket_seconds
+        oldest = bucket - self.window_seconds // self.bucket_seconds + 1
+
+        keys = [f"abuse:ip:{ip}"]
+        prefix = sensitive_prefix(path, self.sensitive_paths)
+        sensitive = prefix is not None
+        if sensitive:
+            # Hits anywhere under one sensitive prefix share a counter
+            keys.append(f"abuse:path:{ip}:{prefix}")
+
+        totals = self._counter_script()(
+            keys=keys, args=[bucket, oldest, self.window_seconds + self.bucket_seconds])
+
+        reason = None
+        if sensitive and totals[1] >= self.sensitive_threshold:
+            reason = f"Accessed sensitive path: {path}"
+        elif totals[0] > self.request_threshold:
+            reason = f"{totals[0]} requests in the past {self.window_seconds // 60} minutes"
+
+        if reason:
+            self.flag(ip, reason)
+        return totals
+
+    def flag(self, ip, reason):
+        from .tasks import persist_flagged_ips
+
+        # Only the first crossing within a window queues a write
+        redis = self.redis
+        if redis.set(f"abuse:flagged:{ip}", 1, nx=True, ex=self.window_seconds):
+            redis.hset(PENDING_FLAGS_KEY, ip, reason)
+            persist_flagged_ips.delay()
+
+
+def drain_pending_flags():
+    """Atomically take every queued {ip: reason} flag out of Redis."""
+    pipe = get_redis_connection("default").pipeline(transaction=True)
+    pipe.hgetall(PENDING_FLAGS_KEY)
+    pipe.delete(PENDING_FLAGS_KEY)
+    pending, _ = pipe.execute()
+    return {ip.decode(): reason.decode() for ip, reason in pending.items()}
+
+
+def upsert_suspicious_ips(reasons):
+    """Insert or update SuspiciousIP rows for {ip: reason} in one statement."""
+    from .models import SuspiciousIP
+
+    if not reasons:
+        return 0
+    SuspiciousIP.objects.bulk_create(
+        [SuspiciousIP(ip_address=ip, reason=reason) for ip, reason in reasons.items()],
+        update_conflicts=True,
+        unique_fields=['ip_address'],
+        update_fields=['reason', 'flagged_at'],
+    )
+    return len(reasons)
+
+
+def block_temporarily(ips, seconds):
+    """Escalate flagged IPs to a block that expires after `seconds`."""
+    from .models import BlockedIP
+    from .blocklist import bump_blocklist_version
+
+    already_blocked = set(BlockedIP.objects.filter(
+        ip_address__in=ips, prefix_length__isnull=True).values_list('ip_address', flat=True))
+    expires_at = timezone.now() + timedelta(seconds=seconds)
+    new_blocks = [BlockedIP(ip_address=ip, expires_at=expires_at)
+                  for ip in ips if ip not in already_blocked]
+    if new_blocks:
+        BlockedIP.objects.bulk_create(new_blocks)
+        # bulk_create skips post_save, so refresh the blocklist here
+        transaction.on_commit(bump_blocklist_version)
+    return len(new_blocks)
+
+
+abuse_detector = AbuseDetector(
+    window_seconds=getattr(settings, "ABUSE_WINDOW_SECONDS", 3600),
+    bucket_seconds=getattr(settings, "ABUSE_BUCKET_SECONDS", 60),
+    request_threshold=getattr(settings, "ABUSE_REQUEST_THRESHOLD", 100),
+    sensitive_paths=getattr(settings, "ABUSE_SENSITIVE_PATHS", ['/admin', '/login']),
+    sensitive_threshold=getattr(settings, "ABUSE_SENSITIVE_THRESHOLD", 1),
+)
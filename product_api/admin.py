@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (Users, Product, Category, Reviews, ProductImage,
                      Order, OrderItem, Reservation, RequestLog, Wishlist,
-                     Account, BlockedIP, SuspiciousIP)
+                     Account, BlockedIP, SuspiciousIP, RequestLogRollup,
+                     RequestLogPartition, PaymentWebhook)
 
 
 @admin.register(Users)
@@ -18,6 +19,14 @@ class ProductAdmin(admin.ModelAdmin):
                     'created_at', 'user_id']
     search_fields = ['name', 'description']
     list_filter = ['category', 'created_at']
+    readonly_fields = Product.RATING_FIELDS
+
+    # Write only what the form changed, never the rating aggregates
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
 
 
 @admin.register(Category)
@@ -62,11 +71,26 @@ class Reservation(admin.ModelAdmin):
     search_fields = ['product__name']
 
 
+# Legacy, unpartitioned request logs
 @admin.register(RequestLog)
 class RequestlogAdmin(admin.ModelAdmin):
     list_display = ['ip_address', 'timestamp', 'path', 'country', 'city']
-    list_filter = ['ip_address']
-    search_fields = ['id_address', 'city']
+    search_fields = ['ip_address']
+    show_full_result_count = False
+
+
+@admin.register(RequestLogRollup)
+class RequestLogRollupAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'ip_address', 'path', 'country', 'count']
+    list_filter = ['hour', 'country']
+    search_fields = ['ip_address', 'path']
+    date_hierarchy = 'hour'
+
+
+@admin.register(RequestLogPartition)
+class RequestLogPartitionAdmin(admin.ModelAdmin):
+    list_display = ['day', 'table_name', 'rolled_up_id', 'sealed', 'created_at']
+    readonly_fields = ['day', 'table_name', 'rolled_up_id', 'sealed', 'created_at']
 
 
 @admin.register(Wishlist)
@@ -82,7 +106,30 @@ class AccountAdmin(admin.ModelAdmin):
                     'total_transactions', 'total_stock_sold', 'updated_at']
     list_filter = ['updated_at']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
+    @admin.display(ordering='total_sales_amount')
+    def total_sales_amount(self, obj):
+        return obj.total_sales_amount
+
+    @admin.display(ordering='total_transactions')
+    def total_transactions(self, obj):
+        return obj.total_transactions
+
+    @admin.display(ordering='total_stock_sold')
+    def total_stock_sold(self, obj):
+        return obj.total_stock_sold
+
+
+@admin.register(PaymentWebhook)
+class PaymentWebhookAdmin(admin.ModelAdmin):
+    list_display = ['tx_ref', 'cart', 'status', 'attempts', 'received_at', 'updated_at']
+    list_filter = ['status', 'cart']
+    search_fields = ['tx_ref']
+
 
 @admin.register(BlockedIP)
 class BlockedIPAdmin(admin.ModelAdmin):
-    list_display = ['ip_address']
+    list_display = ['ip_address', 'prefix_length', 'expires_at']
+    search_fields = ['ip_address']
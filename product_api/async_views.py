@@ -0,0 +1,168 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .catalog import acached_payload, catalog_params
+from .conditional import (acatalog_not_modified, aproduct_not_modified,
+                          set_validators)
+from .prerender import response_store
+from .models import Category, Product
+from .recommendations import (RELATED_PRODUCTS_LIMIT, category_best_sellers,
+                              recommended_products)
+from .serializer import (CategorySerializer, ProductListSerializer,
+                         ProductSerializer, product_list_expansions)
+from .utils import product_detail_queryset, product_list_queryset
+from .views import CategoryView, ProductListView
+
+# Native async versions of the hot catalog reads, routed in place of the DRF
+# views when ASYNC_READ_VIEWS is on. Queries go through the async ORM with
+# every relation the serializers touch loaded up front, so serialization runs
+# on the event loop without further database access. Filtering, pagination
+# settings, serializers and catalog snapshots are shared with the DRF views,
+# so both paths return and cache the same payloads.
+
+
+# Django 4.2's method decorators wrap views in a sync function, so the
+# allowed methods are checked by hand
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def not_found(model):
+    return JsonResponse(
+        {"detail": f"No {model._meta.object_name} matches the given query."},
+        status=404)
+
+
+def drf_view(view_class, request, **initkwargs):
+    """Instantiate a DRF view around `request` to reuse its filter backends."""
+    view = view_class(**initkwargs)
+    view.setup(request)
+    view.request = Request(request)
+    view.format_kwarg = None
+    return view
+
+
+async def prerender(request, validators, payload):
+    """
+    Render `payload`, keep it in the response store and answer from it. The
+    store is keyed by ETag, so the bytes come from DRF's JSONRenderer, exactly
+    as the DRF views render them.
+    """
+    content = JSONRenderer().render(payload)
+    entry = await response_store.aput(validators[0], JSONRenderer.media_type, content)
+    return response_store.respond(request, entry)
+
+
+async def paginate(request, queryset, serializer_class, pagination_class):
+    """
+    Async counterpart of the keyset paginators: returns the {next, previous,
+    results} payload, or None for an invalid cursor.
+    """
+    paginator = pagination_class()
+    try:
+        page = await paginator.apaginate_queryset(queryset, request)
+    except NotFound:
+        return None
+    return paginator.get_paginated_data(
+        serializer_class(page, many=True, context={"request": request}).data)
+
+
+async def product_list(request):
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+
+    not_modified, validators = await acatalog_not_modified(request, "list", encoded=True)
+    if not_modified is not None:
+        return not_modified
+    entry = await response_store.aget(validators[0])
+    if entry is not None:
+        return set_validators(response_store.respond(request, entry), validators, request)
+
+    view = drf_view(ProductListView, request)
+    try:
+        queryset = view.filter_queryset(
+            product_list_queryset(product_list_expansions(request)))
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    payload = await acached_payload(
+        "list", catalog_params(request),
+        lambda: paginate(request, queryset, ProductListSerializer,
+                         ProductListView.pagination_class))
+    if payload is None:
+        return JsonResponse({"detail": "Invalid cursor"}, status=404)
+    return set_validators(await prerender(request, validators, payload), validators, request)
+
+
+async def product_details(request, pk):
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+    not_modified, validators = await aproduct_not_modified(request, pk, encoded=True)
+    if not_modified is not None:
+        return not_modified
+    entry = await response_store.aget(validators[0])
+    if entry is not None:
+        return set_validators(response_store.respond(request, entry), validators, request)
+
+    async def build():
+        try:
+            product = await product_detail_queryset().aget(pk=pk)
+        except Product.DoesNotExist:
+            return None
+        return ProductSerializer(product, context={"request": request}).data
+
+    payload = await acached_payload("detail", str(pk), build)
+    if payload is None:
+        return not_found(Product)
+    return set_validators(await prerender(request, validators, payload), validators, request)
+
+
+async def related_products(request, pk):
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+
+    async def build():
+        product = await Product.objects.filter(pk=pk).only("category").afirst()
+        if product is None:
+            return None
+        related = [obj async for obj in recommended_products(product.pk)]
+        if len(related) < RELATED_PRODUCTS_LIMIT:
+            related += [
+                obj async for obj in category_best_sellers(
+                    product, [p.pk for p in related],
+                    RELATED_PRODUCTS_LIMIT - len(related))
+            ]
+        if not related:
+            return {
+                "message": "No related products found in this category.",
+                "results": []
+            }
+        return ProductSerializer(related, many=True, context={"request": request}).data
+
+    payload = await acached_payload("related", str(pk), build)
+    if payload is None:
+        return not_found(Product)
+    return JsonResponse(payload, safe=False)
+
+
+async def category_list(request):
+    # Writes on the collection still go through the DRF viewset
+    if request.method not in SAFE_METHODS:
+        view = CategoryView.as_view({"get": "list", "post": "create"})
+        return await sync_to_async(view)(request)
+
+    not_modified, validators = await acatalog_not_modified(request, "categories")
+    if not_modified is not None:
+        return not_modified
+
+    view = drf_view(CategoryView, request, action="list")
+    try:
+        queryset = view.filter_queryset(Category.objects.order_by("category_id"))
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    payload = await paginate(
+        request, queryset, CategorySerializer, CategoryView.pagination_class)
+    if payload is None:
+        return JsonResponse({"detail": "Invalid cursor"}, status=404)
+    return set_validators(JsonResponse(payload), validators)
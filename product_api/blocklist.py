@@ -0,0 +1,130 @@
+import ipaddress
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.utils import ProgrammingError, OperationalError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BLOCKLIST_VERSION_KEY = "blocklist:version"
+
+
+# Binary trie over address bits. Each node is [zero_child, one_child, blocked];
+# a blocked node covers every address below it, so a lookup walks at most
+# prefix-length nodes.
+class PrefixTrie:
+    def __init__(self, max_bits):
+        self.max_bits = max_bits
+        self.root = [None, None, False]
+
+    def insert(self, network_int, prefix_length):
+        node = self.root
+        for i in range(prefix_length):
+            if node[2]:
+                return  # already covered by a shorter prefix
+            bit = (network_int >> (self.max_bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+        node[0] = node[1] = None
+        node[2] = True
+
+    def contains(self, address_int):
+        node = self.root
+        for i in range(self.max_bits):
+            if node[2]:
+                return True
+            node = node[(address_int >> (self.max_bits - 1 - i)) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+
+# Per-process index of blocked IPv4/IPv6 addresses and CIDR ranges
+class IPBlocklist:
+    def __init__(self, networks=()):
+        self.size = 0
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        for network in networks:
+            self.add(network)
+
+    def add(self, network):
+        network = ipaddress.ip_network(network, strict=False)
+        self._tries[network.version].insert(
+            int(network.network_address), network.prefixlen)
+        self.size += 1
+
+    def __contains__(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return self._tries[address.version].contains(int(address))
+
+
+def load_blocklist():
+    from .models import BlockedIP
+
+    blocklist = IPBlocklist()
+    active = BlockedIP.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+    for ip, prefix_length in active.values_list(
+            'ip_address', 'prefix_length').iterator():
+        try:
+            blocklist.add(f"{ip}/{prefix_length}" if prefix_length is not None else ip)
+        except ValueError:
+            logger.warning(f"Skipping invalid blocklist entry: {ip}/{prefix_length}")
+    return blocklist
+
+
+def get_blocklist_version():
+    return cache.get(BLOCKLIST_VERSION_KEY, 0)
+
+
+# Called whenever BlockedIP changes so every process reloads its index
+def bump_blocklist_version():
+    cache.add(BLOCKLIST_VERSION_KEY, 0, timeout=None)
+    return cache.incr(BLOCKLIST_VERSION_KEY)
+
+
+# Keeps the in-memory index in sync with the database. The cache version is
+# checked at most once per refresh interval and the table is only re-read
+# when that version has moved.
+class BlocklistCache:
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._blocklist = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._blocklist is not None and now - self._checked_at < self.refresh_interval:
+            return self._blocklist
+
+        with self._lock:
+            version = get_blocklist_version()
+            if self._blocklist is None or version != self._version:
+                try:
+                    self._blocklist = load_blocklist()
+                    self._version = version
+                except (ProgrammingError, OperationalError):
+                    # Database table not created yet
+                    return self._blocklist or IPBlocklist()
+            self._checked_at = now
+        return self._blocklist
+
+    def is_blocked(self, ip):
+        return ip in self.get()
+
+
+ip_blocklist = BlocklistCache(
+    refresh_interval=getattr(settings, "BLOCKLIST_REFRESH_INTERVAL", 5.0))
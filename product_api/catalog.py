@@ -0,0 +1,142 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_GENERATION_KEY = "catalog:generation"
+CATALOG_MODIFIED_KEY = "catalog:modified"
+CATALOG_CACHE_TIMEOUT = getattr(settings, "CATALOG_CACHE_TIMEOUT", 3600)
+
+
+# Serialized catalog payloads are cached under the current catalog
+# generation. Any write to products, reviews, images or categories bumps the
+# generation (after commit, see signals.py), which moves every reader to new
+# keys at once; old snapshots are never read again and simply expire.
+# Queryset .update() and bulk_* calls skip signals, so code using them must
+# call bump_catalog_generation(), and bump_product_versions() for the rows
+# touched, itself.
+
+def _seed(key):
+    # Seeded from the clock so a counter lost to eviction or a restart never
+    # comes back at a number whose snapshots may still be cached
+    cache.add(key, time.time_ns() // 1000, timeout=None)
+    return cache.get(key)
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _seed(key)
+        return cache.incr(key)
+
+
+def _seed_generation():
+    return _seed(CATALOG_GENERATION_KEY)
+
+
+def get_catalog_generation():
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        generation = _seed_generation()
+    return generation
+
+
+def bump_catalog_generation():
+    cache.set(CATALOG_MODIFIED_KEY, time.time(), timeout=None)
+    return _incr(CATALOG_GENERATION_KEY)
+
+
+# Each product also has its own version counter, moved by writes to that
+# product, its reviews or images, or its category. Product detail ETags are
+# built from it, so a client's copy of one product stays valid while the
+# rest of the catalog changes.
+
+def product_version_keys(pk):
+    return f"catalog:product:{pk}:version", f"catalog:product:{pk}:modified"
+
+
+def bump_product_versions(product_ids):
+    modified = {}
+    for pk in product_ids:
+        version_key, modified_key = product_version_keys(pk)
+        _incr(version_key)
+        modified[modified_key] = time.time()
+    cache.set_many(modified, timeout=None)
+
+
+def snapshot_key(kind, params, generation):
+    digest = hashlib.md5(repr(params).encode(), usedforsecurity=False).hexdigest()
+    return f"catalog:{generation}:{kind}:{digest}"
+
+
+def catalog_params(request):
+    """Host (pagination links are absolute) and the sorted query string."""
+    return request.get_host(), sorted(request.GET.lists())
+
+
+def cached_payload(kind, params, build):
+    """
+    Return the serialized payload for (kind, params) in the current catalog
+    generation, calling `build()` to produce and store it on a miss. A build
+    returning None is not cached.
+    """
+    key = snapshot_key(kind, params, get_catalog_generation())
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        if payload is not None:
+            cache.set(key, payload, CATALOG_CACHE_TIMEOUT)
+    return payload
+
+
+async def acached_payload(kind, params, build):
+    """Async cached_payload; `build` is a coroutine function."""
+    generation = await cache.aget(CATALOG_GENERATION_KEY)
+    if generation is None:
+        generation = await sync_to_async(_seed_generation)()
+    key = snapshot_key(kind, params, generation)
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build()
+        if payload is not None:
+            await cache.aset(key, payload, CATALOG_CACHE_TIMEOUT)
+    return payload
+
+
+def _validators(tag, modified):
+    """Strong ETag (unquoted) and Last-Modified for a conditional GET."""
+    etag = hashlib.md5(repr(tag).encode(), usedforsecurity=False).hexdigest()
+    if modified is not None:
+        modified = datetime.fromtimestamp(modified, tz=timezone.utc)
+    return etag, modified
+
+
+def catalog_validators(kind, params):
+    """Validators of a collection: any catalog write changes them."""
+    values = cache.get_many([CATALOG_GENERATION_KEY, CATALOG_MODIFIED_KEY])
+    generation = values.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        generation = _seed_generation()
+    return _validators((kind, generation, params), values.get(CATALOG_MODIFIED_KEY))
+
+
+def product_validators(pk, params):
+    """Validators of one product: only writes touching it change them."""
+    version_key, modified_key = product_version_keys(pk)
+    values = cache.get_many([version_key, modified_key])
+    version = values.get(version_key)
+    if version is None:
+        version = _seed(version_key)
+    return _validators(("product", str(pk), version, params), values.get(modified_key))
+
+
+async def acatalog_validators(kind, params):
+    return await sync_to_async(catalog_validators)(kind, params)
+
+
+async def aproduct_validators(pk, params):
+    return await sync_to_async(product_validators)(pk, params)
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from .perf import percentile, track_http
+
+logger = logging.getLogger(__name__)
+
+# Gateway errors worth another attempt; anything else below 500 is Chapa's
+# answer and is returned to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ChapaError(Exception):
+    """The gateway could not be reached or kept failing."""
+
+
+class CircuitOpen(ChapaError):
+    """Calls are refused until the gateway has had time to recover."""
+
+
+def never_sent(error):
+    """
+    True if a requests.ConnectionError means no connection was made, so
+    nothing reached the gateway. A connection dropped after the request went
+    out (RemoteDisconnected, ProtocolError) is a ConnectionError too.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+# Stops calling a gateway that keeps failing. After `threshold` failures in a
+# row every call is refused for `reset_after` seconds; then a single trial
+# call is let through, and its outcome closes or re-opens the circuit.
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+# Most recent call timings per gateway operation, in this process only:
+# every web and Celery worker keeps its own and they are not aggregated
+class GatewayStats:
+    def __init__(self, sample_size=1000):
+        self._samples = defaultdict(lambda: deque(maxlen=sample_size))
+        self._failures = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            self._samples[operation].append(seconds)
+            if not ok:
+                self._failures[operation] += 1
+
+    def summary(self):
+        """This process's calls only; ChapaClient.summary() adds its pid."""
+        with self._lock:
+            samples = {operation: sorted(values) for operation, values in self._samples.items()}
+            failures = dict(self._failures)
+
+        results = []
+        for operation, values in sorted(samples.items()):
+            timings = [v * 1000 for v in values]
+            results.append({
+                "operation": operation,
+                "count": len(values),
+                "failures": failures.get(operation, 0),
+                "p50_ms": round(percentile(timings, 0.50), 2),
+                "p95_ms": round(percentile(timings, 0.95), 2),
+                "p99_ms": round(percentile(timings, 0.99), 2),
+            })
+        return results
+
+
+# Chapa API client. One pooled keep-alive session is shared by every call, so
+# checkouts reuse TCP/TLS connections instead of opening one each. Calls have
+# connect and read timeouts and are retried a bounded number of times with
+# jittered exponential backoff; a POST is only retried when the connection
+# was never made, so a payment is not initialized twice. Calls are refused
+# while the circuit breaker is open.
+class ChapaClient:
+    def __init__(self, base_url, secret, connect_timeout=3.05, read_timeout=10.0,
+                 retries=2, backoff=0.2, pool_size=10, breaker=None, adapter=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = GatewayStats()
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret}",
+            "Content-Type": "application/json",
+        })
+        self.session.mount(self.base_url, adapter or HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size))
+
+    @classmethod
+    def from_settings(cls):
+        adapter = None
+        if getattr(settings, "CHAPA_STUB", False):
+            adapter = StubChapaAdapter(latency=getattr(settings, "CHAPA_STUB_LATENCY", 0.0))
+        return cls(
+            settings.CHAPA_API_URL, settings.CHAPA_SECRET,
+            connect_timeout=getattr(settings, "CHAPA_CONNECT_TIMEOUT", 3.05),
+            read_timeout=getattr(settings, "CHAPA_READ_TIMEOUT", 10.0),
+            retries=getattr(settings, "CHAPA_MAX_RETRIES", 2),
+            backoff=getattr(settings, "CHAPA_RETRY_BACKOFF", 0.2),
+            pool_size=getattr(settings, "CHAPA_POOL_SIZE", 10),
+            breaker=CircuitBreaker(
+                threshold=getattr(settings, "CHAPA_BREAKER_THRESHOLD", 5),
+                reset_after=getattr(settings, "CHAPA_BREAKER_RESET", 30.0)),
+            adapter=adapter,
+        )
+
+    def initialize(self, payload):
+        return self._request("initialize", "POST", "/v1/transaction/initialize", json=payload)
+
+    def verify(self, tx_ref):
+        return self._request("verify", "GET", f"/v1/transaction/verify/{tx_ref}")
+
+    def summary(self):
+        """Breaker state and call timings as seen by this process (pid)."""
+        return {
+            "scope": "process",
+            "pid": os.getpid(),
+            "circuit": self.breaker.state,
+            "operations": self.stats.summary(),
+        }
+
+    def _request(self, operation, method, path, **kwargs):
+        """Chapa's JSON reply; raises ChapaError once retries are used up."""
+        if not self.breaker.allow():
+            raise CircuitOpen(f"Chapa {operation} refused: circuit open")
+
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                with track_http():
+                    response = self.session.request(
+                        method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # A dropped connection may come after the gateway acted
+                error, retry = e, method == "GET" or never_sent(e)
+            except requests.RequestException as e:
+                # A read timeout may come after the gateway acted
+                error, retry = e, method == "GET"
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    try:
+                        data = response.json()
+                    except ValueError:
+                        data = None
+                    if isinstance(data, dict):
+                        self.stats.record(operation, time.perf_counter() - start, ok=True)
+                        self.breaker.success()
+                        return data
+                    error, retry = ChapaError(f"HTTP {response.status_code}: not JSON"), False
+                else:
+                    error, retry = ChapaError(f"HTTP {response.status_code}"), method == "GET"
+            self.stats.record(operation, time.perf_counter() - start, ok=False)
+
+            if not retry or attempt == self.retries:
+                break
+            # Full jitter, so clients that failed together do not retry together
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        self.breaker.failure()
+        logger.warning("Chapa %s failed after %d attempt(s): %s", operation, attempt + 1, error)
+        raise ChapaError(f"Chapa {operation} failed: {error}") from error
+
+
+# Answers the Chapa endpoints ChapaClient uses without leaving the process,
+# for offline development and load tests of checkout (CHAPA_STUB=True).
+# Initialized payments are kept in the shared cache, so a Celery worker can
+# verify what the web process initialized. Every payment succeeds.
+class StubChapaAdapter(BaseAdapter):
+    def __init__(self, latency=0.0, timeout=3600):
+        super().__init__()
+        self.latency = latency
+        self.timeout = timeout
+
+    def _key(self, tx_ref):
+        return f"chapa:stub:{tx_ref}"
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        path = urlsplit(request.url).path
+        if request.method == "POST" and path.endswith("/transaction/initialize"):
+            payload = json.loads(request.body)
+            cache.set(self._key(payload["tx_ref"]), payload, self.timeout)
+            return self._response(request, 200, {
+                "status": "success",
+                "message": "Hosted Link",
+                "data": {"checkout_url": f"https://checkout.chapa.invalid/{payload['tx_ref']}"},
+            })
+        if request.method == "GET" and "/transaction/verify/" in path:
+            tx_ref = path.rsplit("/", 1)[-1]
+            payload = cache.get(self._key(tx_ref))
+            if payload is None:
+                return self._response(request, 404, {
+                    "status": "failed", "message": "Invalid transaction or Transaction not found",
+                    "data": None,
+                })
+            return self._response(request, 200, {
+                "status": "success",
+                "message": "Payment details",
+                "data": {
+                    "tx_ref": tx_ref,
+                    "amount": payload["amount"],
+                    "currency": payload.get("currency", "ETB"),
+                    "status": "success",
+                    "customer": {"email": payload.get("email")},
+                },
+            })
+        return self._response(request, 404, {"status": "failed", "message": "Not found"})
+
+    def _response(self, request, status, body):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_chapa_client():
+    return ChapaClient.from_settings()
@@ -0,0 +1,86 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .catalog import (acatalog_validators, aproduct_validators, catalog_params,
+                      catalog_validators, product_validators)
+from .prerender import encoded_etag
+
+# Conditional GET for catalog reads. ETags are strong and built from the
+# catalog generation (collections) or the product's version counter
+# (details), both read from the cache, so a matching If-None-Match or
+# If-Modified-Since is answered with a 304 before any query or serializer
+# runs. The Accept header is part of the tag, as the browsable API and JSON
+# are different representations.
+
+
+def representation(request, kwargs):
+    return catalog_params(request), request.META.get("HTTP_ACCEPT", ""), sorted(
+        (name, str(value)) for name, value in kwargs.items())
+
+
+def _condition(get_validators, encoded):
+    # condition() asks for the ETag and Last-Modified separately; both come
+    # from one cache round trip, kept on the request (and used by
+    # prerendered() to key the response store)
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, "_catalog_validators"):
+            request._catalog_validators = get_validators(request, kwargs)
+        return request._catalog_validators
+
+    def etag(request, *args, **kwargs):
+        tag = validators(request, **kwargs)[0]
+        return encoded_etag(tag, request) if encoded else tag
+
+    return condition(
+        etag_func=etag,
+        last_modified_func=lambda request, *args, **kwargs: validators(request, **kwargs)[1],
+    )
+
+
+def catalog_condition(kind, encoded=False):
+    """
+    condition() for a collection view (or a viewset's list/retrieve).
+    `encoded` views may answer with a compressed body (see prerender.py).
+    """
+    return _condition(
+        lambda request, kwargs: catalog_validators(kind, representation(request, kwargs)),
+        encoded)
+
+
+def product_condition(encoded=False):
+    """condition() for a view of the product given by the `pk` URL kwarg."""
+    return _condition(
+        lambda request, kwargs: product_validators(kwargs["pk"], representation(request, kwargs)),
+        encoded)
+
+
+# Django 4.2's condition() only wraps sync views; the async views call these
+
+async def acatalog_not_modified(request, kind, encoded=False, **kwargs):
+    validators = await acatalog_validators(kind, representation(request, kwargs))
+    return _not_modified(request, *validators, encoded), validators
+
+
+async def aproduct_not_modified(request, pk, encoded=False):
+    validators = await aproduct_validators(pk, representation(request, {"pk": pk}))
+    return _not_modified(request, *validators, encoded), validators
+
+
+def _not_modified(request, etag, last_modified, encoded):
+    if encoded:
+        etag = encoded_etag(etag, request)
+    return get_conditional_response(
+        request, etag=quote_etag(etag),
+        last_modified=last_modified and int(last_modified.timestamp()))
+
+
+def set_validators(response, validators, request=None):
+    """Pass the request for views that may answer with a compressed body."""
+    etag, last_modified = validators
+    if request is not None:
+        etag = encoded_etag(etag, request)
+    response.headers.setdefault("ETag", quote_etag(etag))
+    if last_modified is not None and not response.has_header("Last-Modified"):
+        response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
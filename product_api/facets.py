@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+FACET_PRICE_EDGES = getattr(settings, "FACET_PRICE_EDGES", (25, 50, 100, 250))
+
+# "N stars & up" bands, matching ProductFilter's rating_min
+RATING_BANDS = (4, 3, 2, 1)
+
+
+def price_buckets(edges=FACET_PRICE_EDGES):
+    """(min, max) price ranges between the edges; max is exclusive."""
+    bounds = [None, *sorted(edges), None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _normalize(value):
+    if isinstance(value, Decimal):
+        return f"{value.normalize():f}"
+    return str(value)
+
+
+def facet_params(filterset):
+    """
+    The filterset's cleaned values, so query strings that select the same
+    products (parameter order, "10" vs "10.00", unknown parameters) share
+    one cache entry.
+    """
+    return sorted(
+        (name, _normalize(value)) for name, value in filterset.form.cleaned_data.items()
+        if value not in (None, ""))
+
+
+def _count(condition=None):
+    return Count("pk", filter=condition or None)
+
+
+# Counts for the catalog sidebar over an already filtered product queryset.
+# Every facet is a conditional Count in one aggregate query, so the products
+# are scanned once whatever the number of categories and buckets.
+def product_facets(queryset):
+    from .models import Category
+
+    categories = list(Category.objects.order_by("name").values_list("pk", "name"))
+    buckets = price_buckets()
+
+    aggregates = {
+        "total": _count(),
+        "in_stock": _count(Q(stock_quantity__gt=0)),
+    }
+    for i, (pk, _) in enumerate(categories):
+        aggregates[f"category_{i}"] = _count(Q(category_id=pk))
+    for i, (low, high) in enumerate(buckets):
+        condition = Q()
+        if low is not None:
+            condition &= Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f"price_{i}"] = _count(condition)
+    for band in RATING_BANDS:
+        aggregates[f"rating_{band}"] = _count(Q(rating_count__gt=0, rating_avg__gte=band))
+
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        "total": counts["total"],
+        "categories": [
+            {"category_id": str(pk), "name": name, "count": counts[f"category_{i}"]}
+            for i, (pk, name) in enumerate(categories)
+        ],
+        "price": [
+            {"min": low, "max": high, "count": counts[f"price_{i}"]}
+            for i, (low, high) in enumerate(buckets)
+        ],
+        "stock": {
+            "in_stock": counts["in_stock"],
+            "out_of_stock": counts["total"] - counts["in_stock"],
+        },
+        "rating": [
+            {"min": band, "count": counts[f"rating_{band}"]} for band in RATING_BANDS
+        ],
+    }
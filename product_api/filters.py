@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework.filters import BaseFilterBackend
 from .models import Product
+from .search import get_search_backend
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -8,12 +10,37 @@ class ProductFilter(django_filters.FilterSet):
     price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     category = django_filters.CharFilter(field_name='category__name', lookup_expr='icontains')
     in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    rating_min = django_filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    rating_count_min = django_filters.NumberFilter(field_name='rating_count', lookup_expr='gte')
 
     class Meta:
         model = Product
-        fields = ['name', 'price_min', 'price_max', 'category', 'in_stock']
+        fields = ['name', 'price_min', 'price_max', 'category', 'in_stock',
+                  'rating_min', 'rating_count_min']
 
     def filter_in_stock(self, queryset, name, value):
         if value:
             return queryset.filter(stock_quantity__gt=0)
         return queryset
+
+
+# Full-text search ranked by the configured search backend. Runs on the
+# queryset after ProductFilter, so its constraints still apply; results are
+# ordered by relevance unless an explicit ?ordering= is given.
+class RankedSearchFilter(BaseFilterBackend):
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().rank(queryset, query)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search, ranked by relevance',
+            'schema': {'type': 'string'},
+        }]
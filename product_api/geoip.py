@@ -0,0 +1,223 @@
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from cachetools import LRUCache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout of the range database built by `manage.py build_geoip_db`:
+#   header:    magic, record count, location count
+#   records:   sorted, non-overlapping (start, end, location index) triples;
+#              addresses are 16-byte big-endian IPv6 (IPv4 is stored mapped)
+#   locations: (offset, length) pairs into the string blob
+#   blob:      UTF-8 "country\x1fcity" entries
+GEOIP_MAGIC = b"NXGEOIP1"
+HEADER = struct.Struct(">8sII")
+RECORD = struct.Struct(">16s16sI")
+LOCATION = struct.Struct(">IH")
+FIELD_SEPARATOR = "\x1f"
+
+EMPTY_GEO = {"country": "", "city": ""}
+
+
+def pack_ip(ip):
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        address = ipaddress.IPv6Address(f"::ffff:{address}")
+    return address.packed
+
+
+def write_geoip_database(path, ranges):
+    """
+    Write (start_ip, end_ip, country, city) ranges to `path`.
+    Returns the number of ranges written.
+    """
+    records = sorted(
+        (pack_ip(start), pack_ip(end), country or "", city or "")
+        for start, end, country, city in ranges
+    )
+
+    locations = {}
+    packed_records = []
+    last_end = None
+    for start, end, country, city in records:
+        if end < start or (last_end is not None and start <= last_end):
+            logger.warning(
+                f"Skipping invalid or overlapping range "
+                f"{ipaddress.ip_address(start)}-{ipaddress.ip_address(end)}")
+            continue
+        index = locations.setdefault((country, city), len(locations))
+        packed_records.append(RECORD.pack(start, end, index))
+        last_end = end
+
+    blob = bytearray()
+    packed_locations = []
+    for country, city in locations:
+        entry = f"{country}{FIELD_SEPARATOR}{city}".encode("utf-8")
+        packed_locations.append(LOCATION.pack(len(blob), len(entry)))
+        blob += entry
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(GEOIP_MAGIC, len(packed_records), len(packed_locations)))
+        f.writelines(packed_records)
+        f.writelines(packed_locations)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(packed_records)
+
+
+# Base geolocation backend. `remote` backends are too slow for the request
+# path and are only used for background enrichment.
+class GeoBackend:
+    remote = False
+
+    def lookup(self, ip):
+        raise NotImplementedError
+
+    def lookup_many(self, ips):
+        return {ip: self.lookup(ip) for ip in ips}
+
+
+class NullGeoBackend(GeoBackend):
+    def lookup(self, ip):
+        return None
+
+
+# Reads the range database through mmap and binary-searches the records
+class MMapGeoBackend(GeoBackend):
+    def __init__(self, path=None):
+        self.path = path or settings.GEOIP_DATABASE
+        self._mm = None
+        self._record_count = 0
+        self._locations_start = 0
+        self._blob_start = 0
+        try:
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.warning(f"GeoIP database unavailable at {self.path}: {e}")
+            return
+
+        magic, self._record_count, location_count = HEADER.unpack_from(self._mm, 0)
+        if magic != GEOIP_MAGIC:
+            logger.warning(f"{self.path} is not a GeoIP range database")
+            self._mm.close()
+            self._mm = None
+            return
+        self._locations_start = HEADER.size + self._record_count * RECORD.size
+        self._blob_start = self._locations_start + location_count * LOCATION.size
+
+    def lookup(self, ip):
+        if self._mm is None:
+            return None
+        try:
+            key = pack_ip(ip)
+        except ValueError:
+            return None
+
+        # Find the last record whose start is <= key
+        mm = self._mm
+        lo, hi = 0, self._record_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            if mm[offset:offset + 16] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+
+        start, end, index = RECORD.unpack_from(mm, HEADER.size + (lo - 1) * RECORD.size)
+        if key > end:
+            return None
+
+        blob_offset, length = LOCATION.unpack_from(
+            mm, self._locations_start + index * LOCATION.size)
+        start = self._blob_start + blob_offset
+        country, city = mm[start:start + length].decode("utf-8").split(FIELD_SEPARATOR, 1)
+        return {"country": country, "city": city}
+
+
+# ipinfo.io lookups; remote, so only used for asynchronous enrichment
+class IPInfoGeoBackend(GeoBackend):
+    remote = True
+
+    def __init__(self, access_token=None):
+        import ipinfo
+
+        self.handler = ipinfo.getHandler(access_token or settings.IPINFO_ACCESS_TOKEN)
+
+    def lookup_many(self, ips):
+        # Resolve concurrently; each lookup is an HTTP round-trip
+        ips = list(ips)
+        workers = min(len(ips), getattr(settings, "GEOIP_REMOTE_CONCURRENCY", 8)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(ips, pool.map(self.lookup, ips)))
+
+    def lookup(self, ip):
+        try:
+            details = self.handler.getDetails(ip)
+        except Exception as e:
+            logger.warning(f"ipinfo lookup failed for {ip}: {e}")
+            return None
+        return {
+            "country": details.country_name or "",
+            "city": details.city or "",
+        }
+
+
+@lru_cache(maxsize=None)
+def get_geo_backend():
+    return import_string(settings.GEOIP_BACKEND)()
+
+
+# In-process LRU in front of the configured backend
+class GeoResolver:
+    def __init__(self, maxsize=10000):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return get_geo_backend()
+
+    def resolve(self, ip):
+        with self._lock:
+            geo = self._cache.get(ip)
+        if geo is not None:
+            return geo
+
+        geo = self.backend.lookup(ip) or EMPTY_GEO
+        with self._lock:
+            self._cache[ip] = geo
+        return geo
+
+    def resolve_many(self, ips):
+        results = {}
+        with self._lock:
+            for ip in ips:
+                geo = self._cache.get(ip)
+                if geo is not None:
+                    results[ip] = geo
+
+        misses = [ip for ip in ips if ip not in results]
+        if misses:
+            found = self.backend.lookup_many(misses)
+            with self._lock:
+                for ip in misses:
+                    geo = found.get(ip) or EMPTY_GEO
+                    self._cache[ip] = results[ip] = geo
+        return results
+
+
+geo_resolver = GeoResolver(maxsize=getattr(settings, "GEOIP_LRU_SIZE", 10000))
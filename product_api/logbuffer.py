@@ -0,0 +1,134 @@
+import atexit
+import logging
+import threading
+from collections import deque, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.db.utils import ProgrammingError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded in-process buffer for RequestLog rows.
+# The middleware pushes compact (ip, timestamp, path, country, city, weight)
+# tuples
+# and a daemon thread drains them with bulk_create into the day's partition
+# table, so requests never wait on a log INSERT.
+class RequestLogBuffer:
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=2.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.flushed = 0
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def push(self, record):
+        with self._lock:
+            if len(self._records) >= self.max_size:
+                # Buffer full: drop the new record instead of growing memory
+                self.dropped += 1
+                return False
+            self._records.append(record)
+            pending = len(self._records)
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _drain(self, limit):
+        with self._lock:
+            count = min(limit, len(self._records))
+            return [self._records.popleft() for _ in range(count)]
+
+    def flush(self):
+        from .partitions import ensure_partition
+
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+
+            by_day = defaultdict(list)
+            for record in batch:
+                by_day[timezone.localdate(record[1])].append(record)
+            failed = False
+            for day, records in by_day.items():
+                try:
+                    model = ensure_partition(day)
+                    model.objects.bulk_create([
+                        model(ip_address=ip, timestamp=timestamp, path=path,
+                              country=country, city=city, weight=weight)
+                        for ip, timestamp, path, country, city, weight in records
+                    ])
+                except (ProgrammingError, OperationalError) as e:
+                    # Table missing or database busy: give up on this day's
+                    # records; other days in the batch may already be written
+                    failed = True
+                    with self._lock:
+                        self.dropped += len(records)
+                    logger.warning(f"Dropped {len(records)} request logs for {day}: {e}")
+                    continue
+                written += len(records)
+            if failed:
+                break
+
+        with self._lock:
+            self.flushed += written
+        return written
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._records),
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+            }
+
+    def _ensure_flusher(self):
+        if self._thread is not None or not self.flush_interval:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="request-log-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Request log flush failed: {e}")
+            finally:
+                close_old_connections()
+
+
+request_log_buffer = RequestLogBuffer(
+    max_size=getattr(settings, "REQUEST_LOG_BUFFER_SIZE", 10000),
+    batch_size=getattr(settings, "REQUEST_LOG_BATCH_SIZE", 500),
+    flush_interval=getattr(settings, "REQUEST_LOG_FLUSH_INTERVAL", 2.0),
+)
+
+
+# Flush whatever is left when the worker process shuts down
+@atexit.register
+def _flush_on_exit():
+    if len(request_log_buffer):
+        try:
+            request_log_buffer.flush()
+        except Exception as e:
+            logger.error(f"Request log flush on shutdown failed: {e}")
@@ -4,24 +4,31 @@ import ipaddress
 
 
 class Command(BaseCommand):
-    help = 'Block an IP address by adding it to the BlockedIP model'
+    help = 'Block an IP address or CIDR range by adding it to the BlockedIP model'
 
     def add_arguments(self, parser):
-        parser.add_argument('ip_address', type=str, help='IP address to block')
+        parser.add_argument('ip_address', type=str,
+                            help='IP address or CIDR range (e.g. 10.0.0.0/8) to block')
 
     def handle(self, *args, **kwargs):
         ip = kwargs['ip_address']
 
-        # Validate IP format
+        # Validate IP or CIDR format
         try:
-            ipaddress.ip_address(ip)
+            network = ipaddress.ip_network(ip, strict=False)
         except ValueError:
             self.stdout.write(self.style.ERROR(f"Invalid IP address: {ip}"))
             return
 
-        # Add to BlockedIP model
-        obj, created = BlockedIP.objects.get_or_create(ip_address=ip)
+        # Single addresses are stored without a prefix length
+        prefix_length = network.prefixlen
+        if prefix_length == network.max_prefixlen:
+            prefix_length = None
+
+        # Add to BlockedIP model (the post_save signal refreshes the blocklist)
+        obj, created = BlockedIP.objects.get_or_create(
+            ip_address=str(network.network_address), prefix_length=prefix_length)
         if created:
-            self.stdout.write(self.style.SUCCESS(f"Blocked IP: {ip}"))
+            self.stdout.write(self.style.SUCCESS(f"Blocked IP: {obj}"))
         else:
-            self.stdout.write(self.style.WARNING(f"IP {ip} is already blocked."))
+            self.stdout.write(self.style.WARNING(f"IP {obj} is already blocked."))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from product_api.geoip import write_geoip_database
+import csv
+import os
+
+
+class Command(BaseCommand):
+    help = ('Build the memory-mapped GeoIP range database from a CSV file '
+            'with start_ip,end_ip,country,city columns')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', type=str, help='CSV file of IP ranges')
+        parser.add_argument('--output', type=str, default=settings.GEOIP_DATABASE,
+                            help='Where to write the database file')
+
+    def handle(self, *args, **kwargs):
+        csv_path = kwargs['csv_path']
+        output = kwargs['output']
+
+        try:
+            with open(csv_path, newline='', encoding='utf-8') as f:
+                rows = [row for row in csv.reader(f) if row]
+        except OSError as e:
+            raise CommandError(f"Could not read {csv_path}: {e}")
+
+        # Skip an optional header row
+        if rows and rows[0][0].strip().lower() in ('start_ip', 'start'):
+            rows = rows[1:]
+
+        ranges = []
+        for line, row in enumerate(rows, start=1):
+            if len(row) < 2:
+                self.stdout.write(self.style.WARNING(f"Skipping malformed row {line}"))
+                continue
+            row += [''] * (4 - len(row))
+            ranges.append((row[0].strip(), row[1].strip(), row[2].strip(), row[3].strip()))
+
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        try:
+            written = write_geoip_database(output, ranges)
+        except ValueError as e:
+            raise CommandError(f"Invalid IP range: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} ranges to {output}. Restart workers to load it."))
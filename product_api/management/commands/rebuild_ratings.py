@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from product_api.catalog import bump_catalog_generation, bump_product_versions
+from product_api.models import Product
+from product_api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the rating aggregates of every product from its reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products written per UPDATE batch')
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            updated = rebuild_ratings(batch_size=kwargs['batch_size'])
+            transaction.on_commit(bump_catalog_generation)
+            product_ids = list(Product.objects.values_list('pk', flat=True))
+            transaction.on_commit(lambda: bump_product_versions(product_ids))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} products."))
@@ -4,22 +4,30 @@ import ipaddress
 
 
 class Command(BaseCommand):
-    help = 'Unblock an IP address by removing it from the BlockedIP model'
+    help = 'Unblock an IP address or CIDR range by removing it from the BlockedIP model'
 
     def add_arguments(self, parser):
-        parser.add_argument('ip_address', type=str, help='IP address to unblock')
+        parser.add_argument('ip_address', type=str,
+                            help='IP address or CIDR range to unblock')
 
     def handle(self, *args, **kwargs):
         ip = kwargs['ip_address']
 
-        # Validate IP format
+        # Validate IP or CIDR format
         try:
-            ipaddress.ip_address(ip)
+            network = ipaddress.ip_network(ip, strict=False)
         except ValueError:
             self.stdout.write(self.style.ERROR(f"Invalid IP address: {ip}"))
             return
 
-        deleted, _ = BlockedIP.objects.filter(ip_address=ip).delete()
+        prefix_length = network.prefixlen
+        if prefix_length == network.max_prefixlen:
+            prefix_length = None
+
+        # The post_delete signal refreshes the blocklist
+        deleted, _ = BlockedIP.objects.filter(
+            ip_address=str(network.network_address),
+            prefix_length=prefix_length).delete()
         if deleted:
             self.stdout.write(self.style.SUCCESS(f"Unblocked IP: {ip}"))
         else:
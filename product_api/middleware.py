@@ -1,61 +1,235 @@
 from django.utils.timezone import now
-from django.http import HttpResponseForbidden
-from django.core.cache import cache
-from django.db.utils import ProgrammingError, OperationalError
-from .models import RequestLog, BlockedIP
-import ipinfo
+from django.http import HttpResponseForbidden, JsonResponse
+from django.conf import settings
+from django.db import connection
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .blocklist import ip_blocklist
+from .logbuffer import request_log_buffer
+from .abuse import abuse_detector
+from .throttling import rate_limiter, client_identity
+from .sampling import path_classifier
+from .utils import get_client_ip
+from .perf import (start_request_metrics, end_request_metrics,
+                   install_db_timer, endpoint_stats)
+from redis.exceptions import RedisError
+import logging
+import json
+import time
 
-access_token = "7567b26db7c484"
-ipinfo_handler = ipinfo.getHandler(access_token)
+logger = logging.getLogger(__name__)
+perf_logger = logging.getLogger('product_api.perf')
 
 
+# Runs natively under both WSGI and ASGI. The blocking work (blocklist
+# refresh, Redis counters) is done in one sync_to_async hop under ASGI, and
+# the rest of the chain is awaited without holding a thread.
 class RequestLoggingMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.process_request(request)
+        if response is None:
+            response = self.get_response(request)
+            self.process_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await sync_to_async(self.process_request)(request)
+        if response is None:
+            response = await self.get_response(request)
+            self.process_response(request, response)
+        return response
+
+    def process_request(self, request):
         # Extract IP address
-        ip_address = request.META.get("HTTP_X_FORWARDED_FOR")
-        if ip_address:
-            ip_address = ip_address.split(",")[0]
-        else:
-            ip_address = request.META.get("REMOTE_ADDR")
+        ip_address = get_client_ip(request)
+
+        # Block if IP matches an address or range in the in-memory blocklist
+        if ip_blocklist.is_blocked(ip_address):
+            return HttpResponseForbidden("Access denied.")
+
+        # Static, media, docs and health checks are neither counted nor logged
+        if path_classifier.is_bypassed(request.path):
+            return None
+
+        # Sliding-window abuse counters; flags offenders as soon as a
+        # threshold is crossed. Counted for every request, sampled or not.
+        try:
+            abuse_detector.record(ip_address, request.path)
+        except RedisError as e:
+            logger.warning(f"Abuse detection skipped: {e}")
+
+        request._request_log = (
+            ip_address,
+            now(),
+            request.path,
+            path_classifier.sample_weight(request.method, request.path),
+        )
+        return None
+
+    def process_response(self, request, response):
+        entry = getattr(request, "_request_log", None)
+        if entry is None:
+            return
+        ip_address, timestamp, path, weight = entry
+
+        # Log the request (written in batches by the buffer's flusher).
+        # Errors are kept even when sampled out: failed logins, 404 probes
+        # and throttled clients are what the security reports look at. Each
+        # row carries the number of requests it stands for, so rollups
+        # count sampled routes in full: 1/rate for a sampled success, 1 for
+        # an error, which is always logged.
+        # Country/city stay empty until tasks.enrich_request_logs runs.
+        if response.status_code >= 400:
+            weight = 1.0
+        if weight:
+            request_log_buffer.push((
+                ip_address,
+                timestamp,
+                path,
+                None,
+                None,
+                weight,
+            ))
+
+
+# Global token-bucket rate limiting, with policies per URL name
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        for header, value in getattr(request, "_ratelimit_headers", {}).items():
+            response[header] = value
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Same switch django_ratelimit uses, so tests can turn both off
+        if not getattr(settings, "RATELIMIT_ENABLE", True):
+            return None
+        if path_classifier.is_bypassed(request.path):
+            return None
+
+        match = request.resolver_match
+        policy = rate_limiter.policy_for(match.url_name if match else None)
+        if policy is None:
+            return None
 
-        # Block if IP is in BlockedIP
         try:
-            if BlockedIP.objects.filter(ip_address=ip_address).exists():
-                return HttpResponseForbidden("Access denied.")
-        except (ProgrammingError, OperationalError):
-            # Database table not created yet
-            pass
-
-        # Geolocation: check cache first
-        cache_key = f"geo:{ip_address}"
-        geo_data = cache.get(cache_key)
-
-        if not geo_data:
-            try:
-                details = ipinfo_handler.getDetails(ip_address)
-                geo_data = {
-                    "country": details.country_name or "",
-                    "city": details.city or "",
-                }
-                # Cache for 24 hours
-                cache.set(cache_key, geo_data, timeout=86400)
-            except Exception:
-                geo_data = {"country": "", "city": ""}
-
-        # Log the request
+            allowed, headers = rate_limiter.hit(
+                policy, client_identity(request, policy.key))
+        except RedisError as e:
+            # Fail open if Redis is unavailable
+            logger.warning(f"Rate limiting skipped: {e}")
+            return None
+
+        request._ratelimit_headers = headers
+        if not allowed:
+            return JsonResponse(
+                {"detail": "Request was throttled. Please try again later."},
+                status=429)
+        return None
+
+
+# Per-request timing: total, DB, cache and outbound HTTP time, reported as
+# Server-Timing headers, a structured log line and per-endpoint percentiles
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before the app registry was ready missed the
+        # connection_created hook
+        install_db_timer(connection)
+        metrics, token = start_request_metrics()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request_metrics(token)
+        return self.report(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics, token = start_request_metrics()
+        start = time.perf_counter()
         try:
-            RequestLog.objects.create(
-                ip_address=ip_address,
-                timestamp=now(),
-                path=request.path,
-                country=geo_data["country"],
-                city=geo_data["city"],
-            )
-        except (ProgrammingError, OperationalError):
-            # Skip logging if migrations not applied yet
-            pass
-
-        return self.get_response(request)
+            response = await self.get_response(request)
+        finally:
+            end_request_metrics(token)
+        return self.report(request, response, metrics, time.perf_counter() - start)
+
+    def report(self, request, response, metrics, total):
+        response["Server-Timing"] = metrics.server_timing(total)
+
+        # Router URLs are regexes, so strip their anchors from the route
+        match = request.resolver_match
+        if match:
+            endpoint = f"{request.method} /{match.route.replace('^', '').replace('$', '')}"
+        else:
+            endpoint = f"{request.method} (unresolved)"
+        endpoint_stats.record(endpoint, total, metrics)
+        perf_logger.info(json.dumps({
+            "endpoint": endpoint,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 2),
+            **metrics.as_dict(),
+        }))
+        return response
+
+
+# WhiteNoise is sync-only, which would force Django to run the whole chain
+# below it in a thread under ASGI. Static files are looked up in memory, so
+# only serving a hit needs a thread.
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0004_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockedip',
+            name='prefix_length',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='blockedip',
+            name='ip_address',
+            field=models.GenericIPAddressField(db_index=True),
+        ),
+    ]
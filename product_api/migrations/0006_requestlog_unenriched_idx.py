@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0005_blockedip_prefix_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requestlog',
+            index=models.Index(condition=models.Q(('country__isnull', True)), fields=['id'], name='requestlog_unenriched_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0006_requestlog_unenriched_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestLogPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('table_name', models.CharField(max_length=63, unique=True)),
+                ('rolled_up_id', models.BigIntegerField(default=0)),
+                ('sealed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField()),
+                ('path', models.CharField(max_length=2048)),
+                ('country', models.CharField(blank=True, default='', max_length=100)),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-hour'],
+                'indexes': [models.Index(fields=['hour', 'ip_address'], name='rollup_hour_ip_idx'), models.Index(fields=['ip_address', 'hour'], name='rollup_ip_hour_idx')],
+            },
+        ),
+    ]
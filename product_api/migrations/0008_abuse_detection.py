@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:32
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def dedupe_suspicious_ips(apps, schema_editor):
+    # Keep the oldest row per IP before ip_address becomes unique
+    SuspiciousIP = apps.get_model('product_api', 'SuspiciousIP')
+    keep = SuspiciousIP.objects.values('ip_address').annotate(first_id=Min('id')) \
+        .values_list('first_id', flat=True)
+    SuspiciousIP.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0007_requestlog_partitions_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockedip',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='suspiciousip',
+            name='flagged_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(dedupe_suspicious_ips, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='suspiciousip',
+            name='ip_address',
+            field=models.GenericIPAddressField(unique=True),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+# Aggregates for existing reviews, from one GROUP BY query. Written out here
+# rather than calling product_api.ratings, so the migration stays as it was
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('product_api', 'Product')
+    Reviews = apps.get_model('product_api', 'Reviews')
+
+    aggregates = Reviews.objects.order_by().values('product_id').annotate(
+        total=Sum('ratings'),
+        count=Count('pk'),
+        **{f'rating_{value}': Count('pk', filter=Q(ratings=value)) for value in range(1, 6)},
+    )
+    fields = ['rating_sum', 'rating_count', 'rating_avg'] + [
+        f'rating_{value}' for value in range(1, 6)]
+    batch = []
+    for row in aggregates:
+        product = Product(pk=row['product_id'], rating_sum=row['total'],
+                          rating_count=row['count'], rating_avg=row['total'] / row['count'])
+        for value in range(1, 6):
+            setattr(product, f'rating_{value}', row[f'rating_{value}'])
+        batch.append(product)
+    Product.objects.bulk_update(batch, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0008_abuse_detection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
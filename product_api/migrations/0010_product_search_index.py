@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+# The index lives outside the model: a tsvector column and GIN index on
+# Postgres, an FTS5 table on SQLite, nothing for the in-memory backend.
+# The DDL is written out here rather than taken from product_api.search, so
+# the migration keeps doing what it did when it was written.
+POSTGRES_INSTALL = [
+    "ALTER TABLE product_api_product ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS product_search_vector_gin "
+    "ON product_api_product USING GIN (search_vector)",
+    """
+    UPDATE product_api_product AS p SET search_vector =
+        setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(c.name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+    FROM product_api_category AS c
+    WHERE c.category_id = p.category_id
+    """,
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_vector_gin",
+    "ALTER TABLE product_api_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_api_product_fts USING fts5("
+    "product_id UNINDEXED, name, category, description, tokenize='porter unicode61')",
+    """
+    INSERT INTO product_api_product_fts (product_id, name, category, description)
+    SELECT p.product_id, p.name, coalesce(c.name, ''), coalesce(p.description, '')
+    FROM product_api_product AS p
+    LEFT JOIN product_api_category AS c ON c.category_id = p.category_id
+    """,
+]
+SQLITE_UNINSTALL = [
+    "DROP TABLE IF EXISTS product_api_product_fts",
+]
+
+
+def has_fts5(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+    except Exception:
+        return False
+
+
+def statements(connection, install):
+    if connection.vendor == 'postgresql':
+        return POSTGRES_INSTALL if install else POSTGRES_UNINSTALL
+    if connection.vendor == 'sqlite' and has_fts5(connection):
+        return SQLITE_INSTALL if install else SQLITE_UNINSTALL
+    return []
+
+
+def install_search_index(apps, schema_editor):
+    for sql in statements(schema_editor.connection, install=True):
+        schema_editor.execute(sql)
+
+
+def uninstall_search_index(apps, schema_editor):
+    for sql in statements(schema_editor.connection, install=False):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0009_product_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'product_id'], name='product_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'product_id'], name='product_price_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['created_at', 'reviews_id'], name='reviews_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['ratings', 'reviews_id'], name='reviews_ratings_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='transaction_user_keyset'),
+        ),
+    ]
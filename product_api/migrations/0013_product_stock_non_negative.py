@@ -0,0 +1,24 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+# Stock oversold before the constraint existed would stop it being added
+def clamp_negative_stock(apps, schema_editor):
+    Product = apps.get_model('product_api', 'Product')
+    Product.objects.filter(stock_quantity__lt=0).update(stock_quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0012_related_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('stock_quantity__gte', 0)), name='product_stock_non_negative'),
+        ),
+    ]
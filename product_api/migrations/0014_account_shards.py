@@ -0,0 +1,55 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Existing running totals become shard 0 of each account
+def move_totals_to_shards(apps, schema_editor):
+    Account = apps.get_model('product_api', 'Account')
+    AccountShard = apps.get_model('product_api', 'AccountShard')
+    AccountShard.objects.bulk_create([
+        AccountShard(account_id=account.pk, shard=0,
+                     total_sales_amount=account.total_sales_amount,
+                     total_transactions=account.total_transactions,
+                     total_stock_sold=account.total_stock_sold)
+        for account in Account.objects.all()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0013_product_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('total_sales_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_transactions', models.PositiveIntegerField(default=0)),
+                ('total_stock_sold', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='product_api.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='accountshard',
+            constraint=models.UniqueConstraint(fields=('account', 'shard'), name='account_shard'),
+        ),
+        migrations.RunPython(move_totals_to_shards, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='account',
+            name='total_sales_amount',
+        ),
+        migrations.RemoveField(
+            model_name='account',
+            name='total_stock_sold',
+        ),
+        migrations.RemoveField(
+            model_name='account',
+            name='total_transactions',
+        ),
+    ]
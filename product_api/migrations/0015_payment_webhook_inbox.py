@@ -0,0 +1,30 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0014_account_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_ref', models.CharField(max_length=100, unique=True)),
+                ('cart', models.CharField(choices=[('wishlist', 'Wishlist'), ('reservation', 'Reservation')], max_length=20)),
+                ('status', models.CharField(choices=[('received', 'Received'), ('processing', 'Processing'), ('settled', 'Settled'), ('failed', 'Failed')], default='received', max_length=20)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='payment_webhook_pending')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+# Day partitions copy RequestLog's columns when they are created, so the ones
+# that already exist get the column here; their rows were all logged in full
+def add_weight_to_partitions(apps, schema_editor):
+    RequestLogPartition = apps.get_model('product_api', 'RequestLogPartition')
+    connection = schema_editor.connection
+    tables = set(connection.introspection.table_names())
+    column_type = models.FloatField().db_type(connection)
+    for table_name in RequestLogPartition.objects.values_list('table_name', flat=True):
+        if table_name not in tables:
+            continue
+        with connection.cursor() as cursor:
+            columns = [c.name for c in connection.introspection.get_table_description(
+                cursor, table_name)]
+        if 'weight' not in columns:
+            schema_editor.execute(
+                f"ALTER TABLE {schema_editor.quote_name(table_name)} "
+                f"ADD COLUMN weight {column_type} DEFAULT 1 NOT NULL")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0015_payment_webhook_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='weight',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.RunPython(add_weight_to_partitions, migrations.RunPython.noop),
+    ]
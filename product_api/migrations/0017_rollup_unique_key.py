@@ -0,0 +1,34 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:35
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+# Overlapping rollup runs could leave several rows for one key; fold each
+# group into its first row before the constraint goes on
+def merge_duplicate_rollups(apps, schema_editor):
+    RequestLogRollup = apps.get_model('product_api', 'RequestLogRollup')
+    duplicates = RequestLogRollup.objects.order_by() \
+        .values('ip_address', 'path', 'country', 'hour') \
+        .annotate(rows=Count('pk'), first=Min('pk'), total=Sum('count')).filter(rows__gt=1)
+    for group in duplicates:
+        rows = RequestLogRollup.objects.filter(
+            ip_address=group['ip_address'], path=group['path'],
+            country=group['country'], hour=group['hour'])
+        rows.exclude(pk=group['first']).delete()
+        rows.update(count=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0016_requestlog_weight'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='requestlogrollup',
+            constraint=models.UniqueConstraint(fields=('ip_address', 'path', 'country', 'hour'), name='rollup_unique_key'),
+        ),
+    ]
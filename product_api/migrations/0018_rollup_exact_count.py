@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_api', '0017_rollup_unique_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlogrollup',
+            name='exact_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 import uuid
 
@@ -40,9 +44,34 @@ class Product(models.Model):
     user_id = models.ForeignKey(
         Users, on_delete=models.CASCADE, related_name='products')
 
+    # Review aggregates, kept current by the Reviews signals with F()
+    # updates (see product_api/ratings.py). Code that saves a loaded
+    # product passes update_fields, so it never writes a stale copy back
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0, db_index=True)
+
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'rating_1', 'rating_2',
+                     'rating_3', 'rating_4', 'rating_5', 'rating_avg')
+
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Products'
+        # (sort key, pk) indexes for keyset pagination
+        indexes = [
+            models.Index(fields=['created_at', 'product_id'], name='product_created_keyset'),
+            models.Index(fields=['price', 'product_id'], name='product_price_keyset'),
+        ]
+        # Backstop for the stock engine (see product_api/stock.py)
+        constraints = [
+            models.CheckConstraint(check=models.Q(stock_quantity__gte=0),
+                                   name='product_stock_non_negative'),
+        ]
 
     def __str__(self):
         return self.name
@@ -60,6 +89,12 @@ class Reviews(models.Model):
     ratings = models.IntegerField(choices=[(i, i)for i in range(1, 6)])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'reviews_id'], name='reviews_created_keyset'),
+            models.Index(fields=['ratings', 'reviews_id'], name='reviews_ratings_keyset'),
+        ]
+
     def __str__(self):
         return f'{self.product_id}: {self.ratings}'
 
@@ -115,20 +150,95 @@ class Transaction(models.Model):
     status = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='transaction_user_keyset'),
+        ]
+
+
+# Inbox of payment webhooks. A notification is recorded here and answered at
+# once; tasks.settle_payment_webhook verifies and settles it in the
+# background (see product_api/payments.py). tx_ref is unique, so repeated
+# notifications for one payment collapse into one row and one job.
+class PaymentWebhook(models.Model):
+    RECEIVED = 'received'
+    PROCESSING = 'processing'
+    SETTLED = 'settled'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(RECEIVED, 'Received'), (PROCESSING, 'Processing'),
+                      (SETTLED, 'Settled'), (FAILED, 'Failed')]
+
+    WISHLIST = 'wishlist'
+    RESERVATION = 'reservation'
+    CART_CHOICES = [(WISHLIST, 'Wishlist'), (RESERVATION, 'Reservation')]
+
+    tx_ref = models.CharField(max_length=100, unique=True)
+    cart = models.CharField(max_length=20, choices=CART_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RECEIVED)
+    payload = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='payment_webhook_pending'),
+        ]
 
-# Account Model
+    def __str__(self):
+        return f'{self.tx_ref}: {self.status}'
+
+
+class AccountQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each account with the sum of its counter shards."""
+        return self.annotate(
+            total_sales_amount=Coalesce(
+                Sum('shards__total_sales_amount'), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            total_transactions=Coalesce(
+                Sum('shards__total_transactions'), Value(0),
+                output_field=models.PositiveIntegerField()),
+            total_stock_sold=Coalesce(
+                Sum('shards__total_stock_sold'), Value(0),
+                output_field=models.PositiveIntegerField()),
+        )
+
+
+# Account Model; its running totals live in AccountShard rows
 class Account(models.Model):
     account_id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True
     )
+    # Last daily rollover
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AccountQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Account {self.account_id}"
+
+
+# One slice of an Account's sales totals. Checkouts add to a random shard, so
+# concurrent payments rarely wait on the same row lock; reads sum the shards
+# (see product_api/counters.py)
+class AccountShard(models.Model):
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
     total_sales_amount = models.DecimalField(
         max_digits=12, decimal_places=2, default=0)
     total_transactions = models.PositiveIntegerField(default=0)
     total_stock_sold = models.PositiveIntegerField(default=0)
-    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'shard'], name='account_shard'),
+        ]
 
     def __str__(self):
-        return f"Sales: {self.total_sales_amount}, Transactions: {self.total_transactions}, Stock Sold: {self.total_stock_sold}"
+        return f'{self.account_id} #{self.shard}'
 
 
 # Order Model
@@ -159,30 +269,113 @@ class OrderItem(models.Model):
         return self.order
 
 
+# Co-purchase neighbours of a product, rebuilt by the recommendations task
+# (see product_api/recommendations.py)
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='recommendations')
+    related = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='recommended_in')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.score:.3f})'
+
+
 # RequestLog Model
 class RequestLog(models.Model):
     ip_address = models.GenericIPAddressField()
     timestamp = models.DateTimeField()
     path = models.CharField(max_length=2048)
+    # NULL until tasks.enrich_request_logs resolves the IP
     country = models.CharField(max_length=100, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
+    # Requests this row stands for: 1/rate on sampled routes
+    # (see product_api/sampling.py)
+    weight = models.FloatField(default=1.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(country__isnull=True),
+                         name='requestlog_unenriched_idx'),
+        ]
 
     def __str__(self):
         return f"{self.ip_address} at {self.timestamp} -> {self.path}"
 
 
+# Registry of the per-day RequestLog partition tables
+class RequestLogPartition(models.Model):
+    day = models.DateField(unique=True)
+    table_name = models.CharField(max_length=63, unique=True)
+    # Highest partition row id already folded into RequestLogRollup
+    rolled_up_id = models.BigIntegerField(default=0)
+    # Set once a past day is fully enriched and rolled up
+    sealed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.table_name} ({self.day})"
+
+
+# Hourly request counts, maintained incrementally from the partitions
+class RequestLogRollup(models.Model):
+    ip_address = models.GenericIPAddressField()
+    path = models.CharField(max_length=2048)
+    country = models.CharField(max_length=100, blank=True, default='')
+    hour = models.DateTimeField()
+    # Requests, with sampled rows weighted by 1/rate: an estimate on sampled
+    # routes, for aggregate reporting
+    count = models.PositiveIntegerField(default=0)
+    # Requests from rows logged at rate 1, each counted once: exact, and what
+    # per-IP thresholds are checked against
+    exact_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-hour']
+        indexes = [
+            models.Index(fields=['hour', 'ip_address'], name='rollup_hour_ip_idx'),
+            models.Index(fields=['ip_address', 'hour'], name='rollup_ip_hour_idx'),
+        ]
+        # One row per key, so rollups can be upserted
+        constraints = [
+            models.UniqueConstraint(fields=['ip_address', 'path', 'country', 'hour'],
+                                    name='rollup_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.ip_address} {self.path} @ {self.hour}: {self.count}"
+
+
 # BlockedIp Model
 class BlockedIP(models.Model):
-    ip_address = models.GenericIPAddressField()
+    ip_address = models.GenericIPAddressField(db_index=True)
+    # Set for CIDR ranges, left empty for a single address
+    prefix_length = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Temporary blocks (e.g. auto-escalated abuse) expire; permanent ones don't
+    expires_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
+        if self.prefix_length is not None:
+            return f'{self.ip_address}/{self.prefix_length}'
         return self.ip_address
 
 
 # Model For Suspicious Ip logged
 class SuspiciousIP(models.Model):
-    ip_address = models.GenericIPAddressField()
+    ip_address = models.GenericIPAddressField(unique=True)
     reason = models.TextField()
+    flagged_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.ip_address}, {self.reason}'
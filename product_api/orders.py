@@ -0,0 +1,67 @@
+import logging
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+
+from .counters import record_sale
+from .stock import decrement_stock
+
+logger = logging.getLogger(__name__)
+
+CartLine = namedtuple("CartLine", "pk product_id quantity price")
+
+
+def cart_lines(cart):
+    """
+    Evaluate a Wishlist or Reservation queryset once into CartLines, reading
+    only the columns an order needs.
+    """
+    return [CartLine(*row) for row in cart.values_list(
+        "pk", "product_id", "quantity", "product__price")]
+
+
+def cart_totals(lines):
+    """(amount, units) of the lines, in one pass."""
+    amount, units = Decimal("0"), 0
+    for line in lines:
+        amount += line.price * line.quantity
+        units += line.quantity
+    return amount, units
+
+
+# Turns a paid cart into an Order. Whatever the size of the cart this is a
+# fixed number of statements: stock is taken by decrement_stock(), the order
+# lines go in as one bulk INSERT, the sale is added to one shard of the
+# global account and the cart lines that were ordered are deleted at once.
+def materialize_order(user, tx_ref, amount, status, cart, lines):
+    """
+    Create the Order, OrderItems and Transaction for `lines` (from
+    cart_lines(cart)) and empty them from `cart`. Raises InsufficientStock,
+    writing nothing, if any line is short.
+    """
+    from .models import Order, OrderItem, Transaction
+
+    subtotal, units = cart_totals(lines)
+    if subtotal != amount:
+        logger.warning("Order %s paid %s for a cart worth %s", tx_ref, amount, subtotal)
+
+    with transaction.atomic():
+        decrement_stock((line.product_id, line.quantity) for line in lines)
+
+        order = Order.objects.create(user=user, tx_ref=tx_ref, total_amount=amount)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line.product_id,
+                      price=line.price, quantity=line.quantity)
+            for line in lines
+        ])
+        # Checkout leaves a pending Transaction to poll; settle it
+        Transaction.objects.update_or_create(
+            tx_ref=tx_ref, defaults={"user": user, "amount": amount, "status": status})
+
+        record_sale(amount, units)
+
+        # Only the lines that were ordered; anything added to the cart since
+        # it was read stays for next time
+        cart.model.objects.filter(pk__in=[line.pk for line in lines]).delete()
+    return order
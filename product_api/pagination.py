@@ -1,61 +1,217 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
-# Product Pagination
-class ProductPagination(PageNumberPagination):
+def _cursor_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+# Keyset pagination: a page is read with WHERE (key, pk) > (last key, last pk)
+# ORDER BY key, pk LIMIT n, so every page costs one indexed range scan however
+# deep it is, and no COUNT(*) is run. The position travels in an opaque
+# cursor; rows inserted or deleted between requests never shift a page.
+class KeysetPagination(BasePagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 20
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
 
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'results': data
-        })
+    # Default sort key, and the keys a request may sort by through the view's
+    # OrderingFilter. The primary key is always added as the tie-breaker.
+    ordering = '-created_at'
+    ordering_fields = ('created_at',)
 
+    def get_page_size(self, request):
+        try:
+            requested = int(self._params(request)[self.page_size_query_param])
+            if requested > 0:
+                return min(requested, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
 
-# Reviews Pagination
-class ReviewsPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 20
+    def _params(self, request):
+        return getattr(request, 'query_params', request.GET)
 
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
+    def get_ordering(self, queryset):
+        # The first explicit ordering (from OrderingFilter or a ranked
+        # search) is kept when it is a key this paginator can seek on
+        for term in queryset.query.order_by[:1]:
+            if isinstance(term, str) and term.lstrip('-') in self.ordering_fields:
+                return term
+        return self.ordering
+
+    def decode_cursor(self, request, model):
+        token = self._params(request).get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if cursor['o'] != self.key:
+                raise ValueError('cursor was issued for another ordering')
+            pk = model._meta.pk.to_python(cursor['p'])
+            value = cursor['v']
+            if self.field != 'pk':
+                try:
+                    value = model._meta.get_field(self.field).to_python(value)
+                except FieldDoesNotExist:
+                    pass  # an annotation such as search_rank
+            return {'value': value, 'pk': pk, 'reverse': bool(cursor['r'])}
+        except (binascii.Error, ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        value = obj.pk if self.field == 'pk' else getattr(obj, self.field)
+        token = base64.urlsafe_b64encode(json.dumps({
+            'o': self.key,
+            'v': _cursor_value(value),
+            'p': _cursor_value(obj.pk),
+            'r': int(reverse),
+        }, separators=(',', ':')).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def page_queryset(self, queryset, request):
+        """Order and bound `queryset` for the requested page, unevaluated."""
+        self.request = request
+        self.limit = self.get_page_size(request)
+        self.key = self.get_ordering(queryset)
+        self.field = self.key.lstrip('-')
+        self.cursor = self.decode_cursor(request, queryset.model)
+
+        # Previous pages are read backwards from the first row and flipped
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+        descending = self.key.startswith('-') != self.reverse
+        prefix = '-' if descending else ''
+        if self.field == 'pk':
+            queryset = queryset.order_by(prefix + 'pk')
+        else:
+            queryset = queryset.order_by(prefix + self.field, prefix + 'pk')
+
+        if self.cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            after_pk = Q(**{f'pk__{lookup}': self.cursor['pk']})
+            if self.field != 'pk':
+                value = self.cursor['value']
+                after_pk = (Q(**{f'{self.field}__{lookup}': value})
+                            | (Q(**{self.field: value}) & after_pk))
+            queryset = queryset.filter(after_pk)
+        return queryset[:self.limit + 1]
+
+    def take(self, objects):
+        has_more = len(objects) > self.limit
+        objects = objects[:self.limit]
+        if self.reverse:
+            objects.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+        self.page = objects
+        return objects
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.take(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        page = self.page_queryset(queryset, request)
+        return self.take([obj async for obj in page])
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
-        })
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor taken from a next or previous link',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Results per page (at most {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+# Product Pagination
+class ProductPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'price', 'rating_avg', 'rating_count',
+                       'search_rank')
+
+
+# Reviews Pagination
+class ReviewsPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'ratings')
 
 
 # Category Pagination
-class CategoryPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 20
+class CategoryPagination(KeysetPagination):
+    ordering = 'name'
+    ordering_fields = ('name',)
 
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'results': data
-        })
 
+class TransactionPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'amount')
 
-class TransactionPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 20
 
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'results': data
-        })
+class RequestLogPagination(KeysetPagination):
+    page_size = 100
+    max_page_size = 500
+    ordering = '-hour'
+    ordering_fields = ('hour', 'count')
+
+
+class SuspiciousIPPagination(KeysetPagination):
+    page_size = 100
+    max_page_size = 500
+    ordering = '-flagged_at'
+    ordering_fields = ('flagged_at',)
@@ -0,0 +1,178 @@
+import threading
+from datetime import timedelta
+
+from django.apps.registry import Apps
+from django.db import connection, models, transaction, DatabaseError
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import RequestLog, RequestLogPartition, RequestLogRollup
+
+# Partition models live in their own registry so they never show up in
+# makemigrations, the admin or the global app registry.
+partition_apps = Apps()
+_partition_models = {}
+_lock = threading.Lock()
+
+# Rows newer than this are left for the next rollup pass so that batches
+# still being committed by other workers are not skipped.
+ROLLUP_SETTLE_DELAY = timedelta(seconds=60)
+
+
+def partition_table_name(day):
+    return f"{RequestLog._meta.db_table}_{day:%Y%m%d}"
+
+
+def partition_model(day):
+    """
+    Return an unmanaged model with RequestLog's fields bound to the table
+    for `day`. Model classes are built once per process and reused.
+    """
+    table_name = partition_table_name(day)
+    model = _partition_models.get(table_name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _partition_models.get(table_name)
+        if model is None:
+            suffix = f"{day:%Y%m%d}"
+            meta = type("Meta", (), {
+                "app_label": RequestLog._meta.app_label,
+                "db_table": table_name,
+                "managed": False,
+                "apps": partition_apps,
+                "indexes": [
+                    models.Index(fields=["timestamp"], name=f"rlp_{suffix}_ts"),
+                    models.Index(fields=["id"], condition=models.Q(country__isnull=True),
+                                 name=f"rlp_{suffix}_unenr"),
+                ],
+            })
+            attrs = {"__module__": __name__, "Meta": meta}
+            for field in RequestLog._meta.local_fields:
+                attrs[field.name] = field.clone()
+            model = type(f"RequestLog{suffix}", (models.Model,), attrs)
+            _partition_models[table_name] = model
+    return model
+
+
+def _create_partition_sql(model):
+    """
+    CREATE TABLE and CREATE INDEX statements for a partition, as generated
+    by the schema editor, made idempotent with IF NOT EXISTS.
+    """
+    # Only used to render SQL, so the editor is never entered: on SQLite
+    # entering it is refused inside the transactions partitions are created in
+    editor = connection.schema_editor(collect_sql=True)
+    sql, params = editor.table_sql(model)
+    statements = [(sql.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1), params)]
+    for index in model._meta.indexes:
+        sql = str(index.create_sql(model, editor))
+        statements.append((sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1), None))
+    return statements
+
+
+def _create_partition_table(model):
+    with connection.cursor() as cursor:
+        for sql, params in _create_partition_sql(model):
+            cursor.execute(sql, params)
+
+
+def ensure_partition(day):
+    """Create the partition table for `day` if needed and return its model."""
+    model = partition_model(day)
+    if RequestLogPartition.objects.filter(day=day).exists():
+        return model
+
+    table_name = model._meta.db_table
+    if table_name not in connection.introspection.table_names():
+        try:
+            with transaction.atomic():
+                _create_partition_table(model)
+        except DatabaseError:
+            # Another worker created it first
+            if table_name not in connection.introspection.table_names():
+                raise
+    RequestLogPartition.objects.get_or_create(
+        day=day, defaults={"table_name": table_name})
+    return model
+
+
+def drop_partition(partition):
+    """Drop a whole day of raw logs in O(1) with DROP TABLE."""
+    model = partition_model(partition.day)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DROP TABLE IF EXISTS {connection.ops.quote_name(model._meta.db_table)}")
+        partition.delete()
+
+
+def open_partitions():
+    """Partitions that may still receive enrichment or rollup work."""
+    return RequestLogPartition.objects.filter(sealed=False).order_by("day")
+
+
+def rollup_partition(partition):
+    """
+    Fold new, already enriched rows of `partition` into RequestLogRollup:
+    `count` sums the rows' sample weights, `exact_count` counts the rows
+    logged at rate 1. Returns the number of requests rolled up.
+    """
+    model = partition_model(partition.day)
+
+    # The partition row is locked and re-read first, so overlapping runs
+    # (a slow beat run and a manual one, say) queue here instead of both
+    # counting the same id range
+    with transaction.atomic():
+        locked = RequestLogPartition.objects.select_for_update().get(pk=partition.pk)
+        partition.rolled_up_id = locked.rolled_up_id
+        pending = model.objects.filter(id__gt=locked.rolled_up_id)
+
+        upper = pending.filter(
+            timestamp__lte=timezone.now() - ROLLUP_SETTLE_DELAY).aggregate(Max("id"))["id__max"]
+        first_unenriched = pending.filter(country__isnull=True).order_by("id") \
+            .values_list("id", flat=True).first()
+        if first_unenriched is not None and (upper is None or first_unenriched <= upper):
+            upper = first_unenriched - 1
+
+        if upper is None or upper <= locked.rolled_up_id:
+            if partition.day < timezone.localdate() and not pending.exists():
+                partition.sealed = True
+                partition.save(update_fields=["sealed"])
+            return 0
+
+        # GROUP BY (ip, path, country, hour) in the database
+        groups = list(
+            pending.filter(id__lte=upper)
+            .annotate(hour=TruncHour("timestamp"))
+            .values("ip_address", "path", "country", "hour")
+            .annotate(weighted=Sum("weight"), exact=Count("id", filter=Q(weight=1)))
+        )
+
+        existing = {
+            (r.ip_address, r.path, r.country, r.hour): (r.count, r.exact_count)
+            for r in RequestLogRollup.objects.select_for_update().filter(
+                hour__in={g["hour"] for g in groups},
+                ip_address__in={g["ip_address"] for g in groups})
+        }
+        rollups = {}
+        for g in groups:
+            key = (g["ip_address"], g["path"], g["country"] or "", g["hour"])
+            count, exact = rollups.get(key) or existing.get(key, (0, 0))
+            rollups[key] = (count + round(g["weighted"]), exact + g["exact"])
+
+        # Upserted on the (ip, path, country, hour) key
+        RequestLogRollup.objects.bulk_create(
+            [RequestLogRollup(ip_address=ip, path=path, country=country, hour=hour,
+                              count=count, exact_count=exact)
+             for (ip, path, country, hour), (count, exact) in rollups.items()],
+            update_conflicts=True,
+            unique_fields=["ip_address", "path", "country", "hour"],
+            update_fields=["count", "exact_count"],
+        )
+        RequestLogPartition.objects.filter(pk=partition.pk).update(rolled_up_id=upper)
+
+    partition.rolled_up_id = upper
+    return sum(round(g["weighted"]) for g in groups)
@@ -0,0 +1,169 @@
+import logging
+import re
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .chapa import ChapaError, get_chapa_client
+from .orders import cart_lines, materialize_order
+from .stock import InsufficientStock
+
+logger = logging.getLogger(__name__)
+
+# A claimed webhook whose worker has not finished after this many seconds is
+# assumed lost and handed out again
+PAYMENT_WEBHOOK_RETRY_AFTER = getattr(settings, "PAYMENT_WEBHOOK_RETRY_AFTER", 300)
+
+TX_REF_PATTERN = re.compile(r"^[\w-]{1,100}$")
+
+
+class PaymentRetry(Exception):
+    """The gateway could not be asked; settlement should be tried again."""
+
+
+def receive_webhook(tx_ref, cart, payload):
+    """
+    Record a payment webhook in the inbox and queue its settlement, unless
+    the tx_ref is already there. Returns (webhook, created).
+    """
+    from .models import PaymentWebhook
+    from .tasks import settle_payment_webhook
+
+    webhook, created = PaymentWebhook.objects.get_or_create(
+        tx_ref=tx_ref, defaults={"cart": cart, "payload": payload})
+    if created:
+        transaction.on_commit(lambda: settle_payment_webhook.delay(webhook.pk))
+    return webhook, created
+
+
+def stale_webhooks():
+    """Inbox entries that are not settled and nobody is working on."""
+    from .models import PaymentWebhook
+
+    stale = timezone.now() - timedelta(seconds=PAYMENT_WEBHOOK_RETRY_AFTER)
+    return PaymentWebhook.objects.filter(
+        Q(status=PaymentWebhook.RECEIVED) | Q(status=PaymentWebhook.PROCESSING),
+        updated_at__lt=stale,
+    )
+
+
+def claim_webhook(webhook_id):
+    """
+    Take the entry for settlement; False if it is done or another worker
+    has it. One UPDATE, so concurrent jobs for one tx_ref cannot both win.
+    """
+    from .models import PaymentWebhook
+
+    stale = timezone.now() - timedelta(seconds=PAYMENT_WEBHOOK_RETRY_AFTER)
+    return bool(PaymentWebhook.objects.filter(
+        Q(status=PaymentWebhook.RECEIVED)
+        | Q(status=PaymentWebhook.PROCESSING, updated_at__lt=stale),
+        pk=webhook_id,
+    ).update(status=PaymentWebhook.PROCESSING, attempts=F("attempts") + 1,
+             updated_at=timezone.now()))
+
+
+def _finish(webhook, status, error=""):
+    from .models import PaymentWebhook
+
+    PaymentWebhook.objects.filter(pk=webhook.pk).update(
+        status=status, error=error, updated_at=timezone.now())
+
+
+def fail_webhook(webhook, error):
+    """Give up on the entry and mark its pending Transaction failed."""
+    from .models import PaymentWebhook, Transaction
+
+    logger.warning("Payment %s not settled: %s", webhook.tx_ref, error)
+    _finish(webhook, PaymentWebhook.FAILED, error)
+    Transaction.objects.filter(tx_ref=webhook.tx_ref, status="pending").update(status="failed")
+
+
+def verify_with_gateway(tx_ref):
+    try:
+        return get_chapa_client().verify(tx_ref)
+    except ChapaError as e:
+        raise PaymentRetry(str(e))
+
+
+def payment_user(tx_ref, email):
+    """The buyer: from the pending Transaction, else the tx_ref or email."""
+    from .models import Transaction, Users
+
+    pending = Transaction.objects.select_related("user").filter(tx_ref=tx_ref).first()
+    if pending is not None:
+        return pending.user
+    parts = tx_ref.split("-")
+    user = None
+    if len(parts) > 1 and parts[1]:
+        user = Users.objects.filter(user_id__startswith=parts[1]).first()
+    if user is None and email:
+        user = Users.objects.filter(email=email).first()
+    return user
+
+
+# Settles one inbox entry: verify with Chapa, then materialize the buyer's
+# cart into an order. The order confirmation email goes out from the Order
+# post_save signal.
+def settle_webhook(webhook_id):
+    """
+    Returns the new Order, or None if the entry was not claimed or could not
+    be settled (it is then marked failed, with the reason). Raises
+    PaymentRetry, releasing the entry with the error, when the gateway cannot
+    be reached.
+    """
+    from .models import Order, PaymentWebhook, Reservation, Wishlist
+
+    if not claim_webhook(webhook_id):
+        return None
+    webhook = PaymentWebhook.objects.get(pk=webhook_id)
+
+    try:
+        result = verify_with_gateway(webhook.tx_ref)
+    except PaymentRetry as e:
+        _finish(webhook, PaymentWebhook.RECEIVED, str(e))
+        raise
+
+    if result.get("status") != "success" or "data" not in result:
+        fail_webhook(webhook, "Payment not successful")
+        return None
+
+    data = result["data"]
+    try:
+        amount = Decimal(str(data.get("amount", "0")))
+    except InvalidOperation:
+        fail_webhook(webhook, f"Invalid amount {data.get('amount')!r}")
+        return None
+
+    user = payment_user(webhook.tx_ref, (data.get("customer") or {}).get("email"))
+    if user is None:
+        fail_webhook(webhook, "User not found")
+        return None
+
+    model = Reservation if webhook.cart == PaymentWebhook.RESERVATION else Wishlist
+    cart = model.objects.filter(user=user)
+    lines = cart_lines(cart)
+    if not lines:
+        fail_webhook(webhook, f"The {webhook.cart} is empty")
+        return None
+
+    try:
+        order = materialize_order(user, webhook.tx_ref, amount, "success", cart, lines)
+    except InsufficientStock as e:
+        fail_webhook(webhook, str(e))
+        return None
+    except IntegrityError:
+        # Already settled by an earlier attempt that did not get to mark it
+        if not Order.objects.filter(tx_ref=webhook.tx_ref).exists():
+            raise
+        _finish(webhook, PaymentWebhook.SETTLED)
+        return None
+
+    _finish(webhook, PaymentWebhook.SETTLED)
+    logger.info("User %s verified payment %s, order %s created successfully.",
+                user.email, webhook.tx_ref, order.order_id)
+    return order
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django_redis.client import DefaultClient
+
+_current_metrics = ContextVar("request_metrics", default=None)
+
+
+# Timings collected while a single request is being handled
+class RequestMetrics:
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.cache_time = 0.0
+        self.cache_gets = 0
+        self.cache_sets = 0
+        self.http_time = 0.0
+        self.http_calls = 0
+
+    def server_timing(self, total):
+        return ", ".join([
+            f"total;dur={total * 1000:.1f}",
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="{self.cache_gets} gets, {self.cache_sets} sets"',
+            f'http;dur={self.http_time * 1000:.1f};desc="{self.http_calls} calls"',
+        ])
+
+    def as_dict(self):
+        return {
+            "db_ms": round(self.db_time * 1000, 2),
+            "db_queries": self.db_queries,
+            "cache_ms": round(self.cache_time * 1000, 2),
+            "cache_gets": self.cache_gets,
+            "cache_sets": self.cache_sets,
+            "http_ms": round(self.http_time * 1000, 2),
+            "http_calls": self.http_calls,
+        }
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _current_metrics.set(metrics)
+
+
+def end_request_metrics(token):
+    _current_metrics.reset(token)
+
+
+def current_metrics():
+    return _current_metrics.get()
+
+
+# connection.execute_wrapper hook timing every SQL query
+def db_timer(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.db_queries += 1
+
+
+# Installed on every database connection rather than per request: under ASGI
+# the async ORM runs queries on executor threads with their own connections,
+# and the request's metrics follow them there through the context variable.
+def install_db_timer(connection):
+    if db_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_timer)
+
+
+@contextmanager
+def track_http():
+    """Time an outbound HTTP call (payment gateway, geolocation, ...)."""
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.http_time += time.perf_counter() - start
+            metrics.http_calls += 1
+
+
+def _timed_cache_call(kind):
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            metrics = _current_metrics.get()
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.cache_time += time.perf_counter() - start
+                if kind == "get":
+                    metrics.cache_gets += 1
+                elif kind == "set":
+                    metrics.cache_sets += 1
+        return wrapper
+    return decorator
+
+
+# django_redis client that reports cache calls to the current request.
+# add() and set_many() go through set(), so they are counted there.
+class InstrumentedRedisClient(DefaultClient):
+    get = _timed_cache_call("get")(DefaultClient.get)
+    get_many = _timed_cache_call("get")(DefaultClient.get_many)
+    set = _timed_cache_call("set")(DefaultClient.set)
+    delete = _timed_cache_call("other")(DefaultClient.delete)
+    incr = _timed_cache_call("other")(DefaultClient.incr)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Per-endpoint reservoir of the most recent request timings in this process.
+# Nothing is shared between workers: under several gunicorn workers each one
+# reports only the requests it served itself.
+class EndpointStats:
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self._samples = defaultdict(lambda: deque(maxlen=self.sample_size))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, total, metrics):
+        with self._lock:
+            self._samples[endpoint].append((total, metrics.db_time, metrics.db_queries))
+
+    def summary(self):
+        """Percentiles of this process's samples only (see "pid" in the output)."""
+        with self._lock:
+            samples = {endpoint: list(values) for endpoint, values in self._samples.items()}
+
+        results = []
+        for endpoint, values in sorted(samples.items()):
+            totals = sorted(v[0] * 1000 for v in values)
+            db_times = sorted(v[1] * 1000 for v in values)
+            results.append({
+                "endpoint": endpoint,
+                "count": len(values),
+                "p50_ms": round(percentile(totals, 0.50), 2),
+                "p95_ms": round(percentile(totals, 0.95), 2),
+                "p99_ms": round(percentile(totals, 0.99), 2),
+                "db_p95_ms": round(percentile(db_times, 0.95), 2),
+                "avg_queries": round(sum(v[2] for v in values) / len(values), 2),
+            })
+        return results
+
+
+endpoint_stats = EndpointStats(
+    sample_size=getattr(settings, "PERF_SAMPLE_SIZE", 1000))
@@ -0,0 +1,154 @@
+import gzip
+import threading
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from cachetools import LRUCache
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .catalog import CATALOG_CACHE_TIMEOUT
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+PRERENDER_LOCAL_SIZE = getattr(settings, "PRERENDER_LOCAL_SIZE", 256)
+# Bodies smaller than this are not worth a Content-Encoding
+PRERENDER_MIN_COMPRESS = getattr(settings, "PRERENDER_MIN_COMPRESS", 512)
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Headers that describe the body, so they are never copied from the
+# response a stored body replaces
+BODY_HEADERS = {"content-type", "content-length", "content-encoding"}
+
+
+def negotiate_encoding(request):
+    """The best stored encoding the client accepts, or "identity"."""
+    accepted = {}
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    for coding in ENCODINGS:
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return "identity"
+
+
+def encoded_etag(etag, request):
+    """Strong ETags must differ per content-coding."""
+    coding = negotiate_encoding(request)
+    return etag if coding == "identity" else f"{etag}-{coding}"
+
+
+def compress(body):
+    encoded = {"identity": body}
+    if len(body) >= PRERENDER_MIN_COMPRESS:
+        encoded["gzip"] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body, quality=5)
+    return encoded
+
+
+# Final response bytes of hot catalog reads, in every encoding, keyed by the
+# resource's ETag. The ETag already carries the catalog generation or the
+# product's version, so a write makes readers look up new keys and an old
+# entry is never served; it just ages out. Lookups try a per-process LRU
+# before the shared cache, and a hit is written out as is, without running
+# serializers, renderers or compression.
+class ResponseStore:
+    def __init__(self, local_size=256, timeout=3600):
+        self.timeout = timeout
+        self._local = LRUCache(maxsize=local_size)
+        self._lock = threading.Lock()
+
+    def _key(self, etag):
+        return f"catalog:body:{etag}"
+
+    def get(self, etag):
+        with self._lock:
+            entry = self._local.get(etag)
+        if entry is None:
+            entry = cache.get(self._key(etag))
+            if entry is not None:
+                with self._lock:
+                    self._local[etag] = entry
+        return entry
+
+    def put(self, etag, content_type, body):
+        entry = {"content_type": content_type, "bodies": compress(body)}
+        cache.set(self._key(etag), entry, self.timeout)
+        with self._lock:
+            self._local[etag] = entry
+        return entry
+
+    async def aget(self, etag):
+        with self._lock:
+            entry = self._local.get(etag)
+        if entry is None:
+            entry = await sync_to_async(self.get)(etag)
+        return entry
+
+    async def aput(self, etag, content_type, body):
+        return await sync_to_async(self.put)(etag, content_type, body)
+
+    def respond(self, request, entry, headers=()):
+        coding = negotiate_encoding(request)
+        if coding not in entry["bodies"]:
+            coding = "identity"
+        response = HttpResponse(entry["bodies"][coding], content_type=entry["content_type"])
+        for name, value in headers:
+            if name.lower() not in BODY_HEADERS:
+                response.headers[name] = value
+        if coding != "identity":
+            response.headers["Content-Encoding"] = coding
+        response.headers["Content-Length"] = str(len(response.content))
+        patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+        return response
+
+
+response_store = ResponseStore(
+    local_size=PRERENDER_LOCAL_SIZE, timeout=CATALOG_CACHE_TIMEOUT)
+
+
+def prerendered(view):
+    """
+    Serve a DRF GET from the response store. Must sit inside the view's
+    catalog_condition()/product_condition(), whose validators key the
+    store; only JSON renderings are stored.
+    """
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        validators = getattr(request, "_catalog_validators", None)
+        renderer = getattr(request, "accepted_renderer", None)
+        if validators is None or getattr(renderer, "format", None) != "json":
+            return view(request, *args, **kwargs)
+
+        etag = validators[0]
+        entry = response_store.get(etag)
+        if entry is not None:
+            return response_store.respond(request, entry)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            # Store the bytes once rendered; an identity response goes out
+            # as rendered, otherwise the negotiated encoding replaces it
+            def store(rendered):
+                entry = response_store.put(etag, rendered["Content-Type"], rendered.content)
+                if negotiate_encoding(request) in entry["bodies"].keys() - {"identity"}:
+                    return response_store.respond(request, entry, rendered.items())
+                patch_vary_headers(rendered, ("Accept-Encoding",))
+            response.add_post_render_callback(store)
+        return response
+    return inner
@@ -0,0 +1,88 @@
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
+
+RATING_VALUES = range(1, 6)
+
+
+def rating_delta_updates(old_rating=None, new_rating=None):
+    """
+    UPDATE assignments that move one review from `old_rating` to `new_rating`
+    (None for a review being created or deleted). Everything is expressed
+    with F() so concurrent reviews never lose a count.
+    """
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+
+    # Every counter is floored at 0, so aggregates that have drifted (e.g.
+    # before rebuild_ratings ran) never go negative
+    updates = {}
+    if old_rating != new_rating:
+        if old_rating is not None:
+            updates[f"rating_{old_rating}"] = Greatest(F(f"rating_{old_rating}") - 1, 0)
+        if new_rating is not None:
+            updates[f"rating_{new_rating}"] = F(f"rating_{new_rating}") + 1
+    if not updates:
+        return updates
+
+    # SET expressions see the old row, so the average is computed from the
+    # old sum and count plus this change, clamped the same way
+    new_sum = Greatest(F("rating_sum") + sum_delta, 0)
+    updates["rating_sum"] = new_sum
+    updates["rating_count"] = Greatest(F("rating_count") + count_delta, 0)
+    updates["rating_avg"] = Case(
+        When(rating_count__gt=-count_delta, then=(
+            Cast(new_sum, FloatField()) / (F("rating_count") + count_delta))),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return updates
+
+
+def apply_rating_change(product_id, old_rating=None, new_rating=None):
+    from .models import Product
+
+    updates = rating_delta_updates(old_rating, new_rating)
+    if updates:
+        Product.objects.filter(pk=product_id).update(**updates)
+
+
+def rebuild_ratings(product_model=None, review_model=None, batch_size=500):
+    """
+    Recompute every product's rating aggregates from its reviews in one
+    GROUP BY query and write them back with bulk_update. Returns the number
+    of products updated.
+    """
+    if product_model is None:
+        from .models import Product as product_model
+    if review_model is None:
+        from .models import Reviews as review_model
+
+    aggregates = {
+        row["product_id"]: row
+        for row in review_model.objects.values("product_id").annotate(
+            total=Sum("ratings"),
+            count=Count("pk"),
+            **{f"rating_{value}": Count("pk", filter=Q(ratings=value))
+               for value in RATING_VALUES},
+        )
+    }
+
+    fields = ["rating_sum", "rating_count", "rating_avg"] + [
+        f"rating_{value}" for value in RATING_VALUES]
+    batch, updated = [], 0
+    for product in product_model.objects.only("pk", *fields).iterator(chunk_size=batch_size):
+        row = aggregates.get(product.pk, {})
+        product.rating_sum = row.get("total") or 0
+        product.rating_count = row.get("count", 0)
+        product.rating_avg = product.rating_sum / product.rating_count if product.rating_count else 0
+        for value in RATING_VALUES:
+            setattr(product, f"rating_{value}", row.get(f"rating_{value}", 0))
+        batch.append(product)
+        if len(batch) >= batch_size:
+            product_model.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    if batch:
+        product_model.objects.bulk_update(batch, fields)
+        updated += len(batch)
+    return updated
@@ -0,0 +1,99 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+
+RELATED_PRODUCTS_LIMIT = 6
+RECOMMENDATION_TOP_K = getattr(settings, "RECOMMENDATION_TOP_K", 20)
+# Very large orders (bulk buys, test data) relate everything to everything
+# and cost O(n^2) pairs, so they are left out of the pair counts
+RECOMMENDATION_MAX_BASKET = getattr(settings, "RECOMMENDATION_MAX_BASKET", 50)
+
+
+def order_baskets():
+    """The set of product ids in each order, streamed in order id order."""
+    from .models import OrderItem
+
+    rows = OrderItem.objects.order_by("order_id").values_list(
+        "order_id", "product_id").iterator(chunk_size=2000)
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        yield {product_id for _, product_id in items}
+
+
+def co_occurrence(baskets, max_basket=RECOMMENDATION_MAX_BASKET):
+    """
+    Sparse item-to-item co-occurrence: ({a: {b: orders with a and b}},
+    {a: orders with a}). Only pairs that actually occur are stored, so memory
+    follows the number of distinct co-purchases rather than products squared.
+    """
+    pairs = defaultdict(Counter)
+    orders = Counter()
+    for basket in baskets:
+        orders.update(basket)
+        if len(basket) < 2 or len(basket) > max_basket:
+            continue
+        for a in basket:
+            row = pairs[a]
+            for b in basket:
+                if a != b:
+                    row[b] += 1
+    return pairs, orders
+
+
+def top_neighbours(pairs, orders, top_k=RECOMMENDATION_TOP_K):
+    """
+    {product: [(neighbour, score), ...]} best first. Scores are cosine
+    similarities, count(a, b) / sqrt(orders(a) * orders(b)), so best sellers
+    do not end up as everyone's neighbour.
+    """
+    neighbours = {}
+    for a, row in pairs.items():
+        scored = (
+            (count / math.sqrt(orders[a] * orders[b]), count, str(b), b)
+            for b, count in row.items())
+        neighbours[a] = [(b, score) for score, _, _, b in heapq.nlargest(top_k, scored)]
+    return neighbours
+
+
+def rebuild_recommendations(top_k=RECOMMENDATION_TOP_K, max_basket=RECOMMENDATION_MAX_BASKET):
+    """Recompute every product's neighbours from the order history."""
+    from .catalog import bump_catalog_generation
+    from .models import RelatedProduct
+
+    pairs, orders = co_occurrence(order_baskets(), max_basket)
+    rows = [
+        RelatedProduct(product_id=product, related_id=related, score=score, rank=rank)
+        for product, ranked in top_neighbours(pairs, orders, top_k).items()
+        for rank, (related, score) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+        # Cached related-product payloads are keyed by catalog generation
+        transaction.on_commit(bump_catalog_generation)
+    return len(rows)
+
+
+# Querysets behind products/<pk>/related/, shared by the sync and async views:
+# precomputed neighbours first, topped up with the category's best sellers
+
+def recommended_products(product_id, limit=RELATED_PRODUCTS_LIMIT):
+    from .utils import product_detail_queryset
+
+    return product_detail_queryset().filter(
+        recommended_in__product=product_id).order_by("recommended_in__rank")[:limit]
+
+
+def category_best_sellers(product, exclude=(), limit=RELATED_PRODUCTS_LIMIT):
+    from .utils import product_detail_queryset
+
+    return product_detail_queryset().filter(category=product.category_id).exclude(
+        pk__in=[product.pk, *exclude],
+    ).annotate(
+        sold=Coalesce(Sum("orderitem__quantity"), Value(0)),
+    ).order_by("-sold", "-created_at")[:limit]
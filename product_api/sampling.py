@@ -0,0 +1,63 @@
+import random
+import re
+
+from django.conf import settings
+
+
+# Decides, per request, whether the request-logging pipeline runs at all and
+# how often it is recorded. Both rule sets are compiled into one regex each,
+# so classifying a request is a single match however many rules there are.
+class PathClassifier:
+    def __init__(self, bypass_prefixes=(), sampling=None, default_rate=1.0):
+        self.default_rate = default_rate
+
+        # Bypassed routes skip abuse counting and logging entirely
+        self._bypass = None
+        if bypass_prefixes:
+            self._bypass = re.compile("|".join(
+                re.escape(prefix) for prefix in sorted(bypass_prefixes, key=len, reverse=True)))
+
+        # Sampling rules are "<prefix>" or "<METHOD> <prefix>" and are matched
+        # against "<METHOD> <path>"; the longest prefix wins, and a rule with a
+        # method wins over one without for the same prefix
+        rules = []
+        for rule, rate in (sampling or {}).items():
+            method, _, prefix = rule.rpartition(" ")
+            rules.append((len(prefix), bool(method), method.upper(), prefix, rate))
+        rules.sort(reverse=True)
+
+        self._rates = [rate for *_, rate in rules]
+        self._sampling = None
+        if rules:
+            self._sampling = re.compile("|".join(
+                f"({re.escape(method) if method else '[A-Z]+'} {re.escape(prefix)})"
+                for _, _, method, prefix, _ in rules))
+
+    def is_bypassed(self, path):
+        return self._bypass is not None and self._bypass.match(path) is not None
+
+    def sample_rate(self, method, path):
+        if self._sampling is not None:
+            match = self._sampling.match(f"{method} {path}")
+            if match:
+                return self._rates[match.lastindex - 1]
+        return self.default_rate
+
+    def sample_weight(self, method, path):
+        """
+        How many requests a logged row for this request stands for (1/rate),
+        or 0 if the request is sampled out.
+        """
+        rate = self.sample_rate(method, path)
+        if rate >= 1:
+            return 1.0
+        if rate > 0 and random.random() < rate:
+            return 1 / rate
+        return 0.0
+
+
+path_classifier = PathClassifier(
+    bypass_prefixes=getattr(settings, "REQUEST_LOG_BYPASS_PREFIXES", ()),
+    sampling=getattr(settings, "REQUEST_LOG_SAMPLING", {}),
+    default_rate=getattr(settings, "REQUEST_LOG_DEFAULT_SAMPLE_RATE", 1.0),
+)
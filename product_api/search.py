@@ -0,0 +1,305 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+SEARCH_MAX_RESULTS = getattr(settings, "SEARCH_MAX_RESULTS", 500)
+
+FTS_TABLE = "product_api_product_fts"
+
+# Relative weight of each part of a product's text
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+SUFFIXES = ("ational", "ization", "fulness", "iveness", "ations", "ingly",
+            "ments", "ation", "ness", "ment", "ing", "ies", "ed", "es", "ly", "s")
+
+
+def stem(token):
+    """Light suffix-stripping stemmer for the in-memory index."""
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            if suffix == "ies":
+                token += "y"
+            break
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall((text or "").lower())]
+
+
+def product_documents(product_ids=None):
+    """(pk, name, description, category name) rows to index."""
+    from .models import Product
+
+    products = Product.objects.order_by()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.values_list("pk", "name", "description", "category__name").iterator()
+
+
+def rank_by_scores(queryset, scores):
+    """Restrict `queryset` to the scored products and annotate search_rank."""
+    if not scores:
+        return queryset.none()
+    return queryset.filter(pk__in=list(scores)).annotate(search_rank=Case(
+        *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+        output_field=FloatField(),
+    )).order_by("-search_rank")
+
+
+# Every backend keeps an inverted index of product text in step with the
+# catalog (see signals.py) and ranks a queryset against a user query. The
+# queryset may already carry ProductFilter constraints; they are kept. The
+# Postgres and SQLite index structures are created by migration 0010.
+class SearchBackend:
+    def index_products(self, product_ids):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def rank(self, queryset, query):
+        raise NotImplementedError
+
+
+# Postgres: a tsvector column on the product table behind a GIN index,
+# weighted name > category > description and ranked with ts_rank_cd
+class PostgresSearchBackend(SearchBackend):
+    CONFIG = "english"
+
+    def _table(self):
+        from .models import Product
+        return Product._meta.db_table
+
+    def _update(self, where="", params=()):
+        from .models import Category
+
+        table = self._table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE {table} AS p SET search_vector =
+                    setweight(to_tsvector(%s, coalesce(p.name, '')), 'A') ||
+                    setweight(to_tsvector(%s, coalesce(c.name, '')), 'B') ||
+                    setweight(to_tsvector(%s, coalesce(p.description, '')), 'C')
+                FROM {Category._meta.db_table} AS c
+                WHERE c.category_id = p.category_id {where}
+            """, [self.CONFIG] * 3 + list(params))
+
+    def index_products(self, product_ids):
+        self._update("AND p.product_id = ANY(%s)", [list(product_ids)])
+
+    def remove_products(self, product_ids):
+        pass  # the row, and its vector, are already gone
+
+    def rebuild(self):
+        self._update()
+
+    def rank(self, queryset, query):
+        table = self._table()
+        tsquery = f"websearch_to_tsquery('{self.CONFIG}', %s)"
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f"ts_rank_cd({table}.search_vector, {tsquery})", [query],
+                output_field=FloatField()),
+        ).extra(
+            where=[f"{table}.search_vector @@ {tsquery}"], params=[query],
+        ).order_by("-search_rank")
+
+
+# SQLite: an FTS5 table with the porter tokenizer, ranked with bm25()
+class SQLiteFTSBackend(SearchBackend):
+    def _db_id(self, pk):
+        from .models import Product
+        return Product._meta.pk.get_db_prep_value(pk, connection)
+
+    def index_products(self, product_ids):
+        self.remove_products(product_ids)
+        self._insert(product_documents(product_ids))
+
+    def _insert(self, documents):
+        rows = [(self._db_id(pk), name, category or "", description or "")
+                for pk, name, description, category in documents]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (product_id, name, category, description) "
+                    f"VALUES (%s, %s, %s, %s)", rows)
+
+    def remove_products(self, product_ids):
+        ids = [self._db_id(pk) for pk in product_ids]
+        if ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE product_id IN ({', '.join(['%s'] * len(ids))})",
+                    ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self._insert(product_documents())
+
+    def rank(self, queryset, query):
+        from .models import Product
+
+        terms = TOKEN_RE.findall(query.lower())
+        if not terms:
+            return queryset.none()
+        match = " ".join(f'"{term}"' for term in terms)
+        weights = ", ".join(str(FIELD_WEIGHTS[f]) for f in ("name", "category", "description"))
+        with connection.cursor() as cursor:
+            # bm25() is lower-is-better, so negate it for search_rank
+            cursor.execute(
+                f"SELECT product_id, -bm25({FTS_TABLE}, 0, {weights}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY 2 DESC LIMIT %s",
+                [match, SEARCH_MAX_RESULTS])
+            rows = cursor.fetchall()
+        to_python = Product._meta.pk.to_python
+        return rank_by_scores(queryset, {to_python(pk): score for pk, score in rows})
+
+
+# Pure-Python BM25 over an in-process inverted index, for databases with no
+# full-text support. Writes made in this process are applied immediately;
+# writes from other processes are picked up by a rebuild when the catalog
+# generation moves, checked at most once per refresh interval.
+class MemorySearchBackend(SearchBackend):
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._postings = defaultdict(dict)  # term -> {pk: weighted tf}
+        self._doc_terms = {}                # pk -> {term: weighted tf}
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def _document_terms(self, name, description, category):
+        terms = Counter()
+        for field, text in (("name", name), ("category", category),
+                            ("description", description)):
+            for token in tokenize(text):
+                terms[token] += FIELD_WEIGHTS[field]
+        return terms
+
+    def _remove(self, pk):
+        terms = self._doc_terms.pop(pk, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(pk, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(pk)
+
+    def _add(self, documents):
+        for pk, name, description, category in documents:
+            self._remove(pk)
+            terms = self._document_terms(name, description, category)
+            self._doc_terms[pk] = terms
+            for term, tf in terms.items():
+                self._postings[term][pk] = tf
+            length = sum(terms.values())
+            self._doc_lengths[pk] = length
+            self._total_length += length
+
+    def index_products(self, product_ids):
+        with self._lock:
+            for pk in product_ids:
+                self._remove(pk)
+            self._add(product_documents(product_ids))
+
+    def remove_products(self, product_ids):
+        with self._lock:
+            for pk in product_ids:
+                self._remove(pk)
+
+    def rebuild(self):
+        from .catalog import get_catalog_generation
+
+        with self._lock:
+            generation = get_catalog_generation()
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._total_length = 0.0
+            self._add(product_documents())
+            self._generation = generation
+
+    def _refresh(self):
+        from .catalog import get_catalog_generation
+
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._generation is None or get_catalog_generation() != self._generation:
+                self.rebuild()
+            self._checked_at = now
+
+    def scores(self, query):
+        """{pk: BM25 score} for products matching every term of `query`."""
+        self._refresh()
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._doc_lengths)
+            postings = [self._postings.get(term) for term in terms]
+            if not n or not terms or not all(postings):
+                return {}
+            avgdl = self._total_length / n
+
+            # Walk the rarest posting list and score its documents
+            postings.sort(key=len)
+            scores = {}
+            for pk in postings[0]:
+                if not all(pk in p for p in postings[1:]):
+                    continue
+                norm = self.K1 * (1 - self.B + self.B * self._doc_lengths[pk] / avgdl)
+                score = 0.0
+                for p in postings:
+                    idf = math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+                    score += idf * p[pk] * (self.K1 + 1) / (p[pk] + norm)
+                scores[pk] = score
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return dict(best[:SEARCH_MAX_RESULTS])
+
+    def rank(self, queryset, query):
+        return rank_by_scores(queryset, self.scores(query))
+
+
+def sqlite_has_fts5():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=1)
+def get_search_backend():
+    """SEARCH_BACKEND if set, otherwise the best backend for the database."""
+    backend = getattr(settings, "SEARCH_BACKEND", None)
+    if backend:
+        return import_string(backend)()
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    if connection.vendor == "sqlite" and sqlite_has_fts5():
+        return SQLiteFTSBackend()
+    return MemorySearchBackend()
@@ -6,7 +6,7 @@ from .models import (Product, Reviews, ProductImage,
                      Category, Wishlist, Reservation,
                      OrderItem, Order, Account, DailySales,
                      RequestLog, BlockedIP, SuspiciousIP,
-                     Transaction)
+                     Transaction, RequestLogRollup)
 from PIL import Image
 from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
                                                   TokenRefreshSerializer)
@@ -86,7 +86,8 @@ class ProductSerializer(serializers.ModelSerializer):
     # Accept UUID instead of full object
     category = serializers.StringRelatedField()
     reviews = ReviewSerializer(many=True, read_only=True)
-    avg_rating = serializers.FloatField(read_only=True)
+    avg_rating = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     # User will be set automatically in perform_create
     user_id = serializers.UUIDField(read_only=True)
     product_images = ProductImageSerializer(many=True, read_only=True)
@@ -105,8 +106,25 @@ class ProductSerializer(serializers.ModelSerializer):
             "product_images",
             "reviews",
             "avg_rating",
+            "rating_count",
+            "rating_histogram",
         ]
-        read_only_fields = ("product_id", "created_at", "user_id")
+        read_only_fields = ("product_id", "created_at", "user_id", "rating_count")
+
+    # Read from the denormalised aggregates; null until the first review
+    def get_avg_rating(self, obj):
+        return obj.rating_avg if obj.rating_count else None
+
+    def get_rating_histogram(self, obj):
+        return {value: getattr(obj, f"rating_{value}") for value in range(1, 6)}
+
+    # Only write back the fields the request changed; the rating aggregates
+    # on the instance may already be stale
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
     def validate_price(self, value):
         if value <= 0:
@@ -219,7 +237,12 @@ class OrderSerializer(serializers.ModelSerializer):
         return value
 
 
+# Expects Account.objects.with_totals()
 class AccountSerializer(serializers.ModelSerializer):
+    total_sales_amount = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True)
+    total_transactions = serializers.IntegerField(read_only=True)
+    total_stock_sold = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Account
@@ -241,6 +264,13 @@ class RequestlogSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RequestLogRollupSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = RequestLogRollup
+        fields = ['ip_address', 'path', 'country', 'hour', 'count', 'exact_count']
+
+
 class BlockedIPSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -262,3 +292,57 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ['tx_ref', 'user', 'amount', 'created_at', 'status']
         read_only_fields = ['status']
+
+
+# Query parameters of product list pages: ?fields=name,price keeps only the
+# named fields, ?expand=reviews,images adds the nested relations
+PRODUCT_EXPANSIONS = {'reviews': 'reviews', 'images': 'product_images'}
+
+
+def query_list(request, param):
+    if request is None:
+        return set()
+    value = getattr(request, 'query_params', request.GET).get(param, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def product_list_expansions(request):
+    """Relations to expand, leaving out any that ?fields= excludes."""
+    fields = query_list(request, 'fields')
+    return {
+        PRODUCT_EXPANSIONS[name] for name in query_list(request, 'expand')
+        if name in PRODUCT_EXPANSIONS and (not fields or PRODUCT_EXPANSIONS[name] in fields)
+    }
+
+
+# Compact product shape for list pages; the detail view keeps ProductSerializer
+class ProductListSerializer(ProductSerializer):
+    reviews = ReviewSerializer(many=True, read_only=True, source='latest_reviews')
+
+    class Meta(ProductSerializer.Meta):
+        fields = [
+            "product_id",
+            "name",
+            "price",
+            "stock_quantity",
+            "image_url",
+            "category",
+            "avg_rating",
+            "rating_count",
+            "product_images",
+            "reviews",
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expand = product_list_expansions(request)
+        for name in PRODUCT_EXPANSIONS.values():
+            if name not in expand:
+                self.fields.pop(name)
+
+        # Unknown names are ignored; nothing known leaves the full shape
+        keep = query_list(request, 'fields') & set(self.fields)
+        if keep:
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
@@ -1,9 +1,17 @@
 from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.backends.signals import connection_created
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from .models import Reservation, Product, Order
+from django.db import transaction
+from functools import partial
+from .models import (Reservation, Product, Order, BlockedIP, Reviews,
+                     ProductImage, Category)
 from .tasks import send_low_stock_email, send_order_confirmation_email
-from django.core.cache import cache
+from .blocklist import bump_blocklist_version
+from .catalog import bump_catalog_generation, bump_product_versions
+from .ratings import apply_rating_change
+from .search import get_search_backend
+from .perf import install_db_timer
 
 
 STOCK_THRESHOLD = 5
@@ -28,11 +36,114 @@ def notify_low_stock(sender, instance, created, **kwargs):
                 product.name, product.stock_quantity, 'admin@yourdomain.com')
 
 
-# Signal to clear Cache Automatically when Product model is Updated
+# Signals to keep Product's rating aggregates in step with its reviews. They
+# are connected before the catalog and version bumps below: outside a
+# transaction on_commit runs at once, and a reader must not cache the old
+# aggregates under the new generation or ETag.
+@receiver(pre_save, sender=Reviews)
+def remember_old_rating(sender, instance, **kwargs):
+    instance._old_rating = None
+    if not instance._state.adding:
+        instance._old_rating = Reviews.objects.filter(pk=instance.pk) \
+            .values_list('product_id', 'ratings').first()
+
+
+@receiver(post_save, sender=Reviews)
+def add_review_rating(sender, instance, **kwargs):
+    old = getattr(instance, '_old_rating', None)
+    if old is not None and old[0] != instance.product_id_id:
+        # Review moved to another product
+        apply_rating_change(old[0], old_rating=old[1])
+        old = None
+    apply_rating_change(
+        instance.product_id_id, old[1] if old else None, instance.ratings)
+
+
+@receiver(post_delete, sender=Reviews)
+def remove_review_rating(sender, instance, **kwargs):
+    apply_rating_change(instance.product_id_id, old_rating=instance.ratings)
+
+
+# Signal to move catalog readers to a new snapshot generation whenever
+# anything they serialize changes (stock updates at checkout included).
+# Bumped after commit so no reader can cache pre-commit rows under the
+# new generation.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Reviews)
+@receiver(post_delete, sender=Reviews)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_generation)
+
+
+# Signals to move the version counter of each product whose detail payload
+# changed; its ETag is built from it. The ids are read now, as a deleted
+# instance has lost its pk by the time the transaction commits.
+def bump_versions_on_commit(product_ids):
+    transaction.on_commit(partial(bump_product_versions, list(product_ids)))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def version_product(sender, instance, **kwargs):
+    bump_versions_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Reviews)
+@receiver(post_delete, sender=Reviews)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def version_parent_product(sender, instance, **kwargs):
+    product_ids = {instance.product_id_id}
+    # A review moved to another product changes the old one too
+    old = getattr(instance, '_old_rating', None)
+    if old is not None:
+        product_ids.add(old[0])
+    bump_versions_on_commit(product_ids)
+
+
+@receiver(post_save, sender=Category)
+def version_category_products(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions_on_commit(instance.products.values_list('pk', flat=True))
+
+
+# Signal to make every process reload its in-memory blocklist. Bumped after
+# commit, so no process reloads the old rows under the new version.
+@receiver(post_save, sender=BlockedIP)
+@receiver(post_delete, sender=BlockedIP)
+def refresh_blocklist(sender, **kwargs):
+    transaction.on_commit(bump_blocklist_version)
+
+
+# Signals to keep the full-text search index in step with the catalog. They
+# run inside the writing transaction, so the index commits with the rows.
 @receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index_products([instance.pk])
+
+
 @receiver(post_delete, sender=Product)
-def clear_property_cache(sender, **kwargs):
-    cache.delete('all_properties')
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    if not created:
+        product_ids = list(instance.products.values_list('pk', flat=True))
+        if product_ids:
+            get_search_backend().index_products(product_ids)
+
+
+# Time every SQL query for the request that issued it
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    install_db_timer(connection)
 
 
 # signal to Send email confirmation Message for orders Created
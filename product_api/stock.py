@@ -0,0 +1,116 @@
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from .catalog import bump_catalog_generation, bump_product_versions
+
+
+class InsufficientStock(Exception):
+    """
+    Raised with one entry per line that cannot be filled; with none if stock
+    kept changing under the order and no single line can be blamed.
+    """
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        if not shortfalls:
+            super().__init__("Stock changed while the order was placed")
+            return
+        first = shortfalls[0]
+        if first["name"] is None:
+            message = f"Product {first['product_id']} does not exist"
+        else:
+            message = f"Product '{first['name']}' only has {first['available']} items available"
+        super().__init__(message)
+
+
+class _StockChanged(Exception):
+    pass
+
+
+def merge_lines(lines):
+    """{product_id: total quantity} from (product_id, quantity) pairs."""
+    wanted = Counter()
+    for product_id, quantity in lines:
+        wanted[product_id] += quantity
+    return wanted
+
+
+def shortfalls(wanted, stock):
+    """
+    Lines of `wanted` that `stock` ({product_id: (name, quantity)}) cannot
+    fill, with what was asked for and what is left.
+    """
+    report = []
+    for product_id, requested in wanted.items():
+        name, available = stock.get(product_id, (None, 0))
+        if requested > available:
+            report.append({
+                "product_id": str(product_id),
+                "name": name,
+                "requested": requested,
+                "available": available,
+            })
+    return report
+
+
+# Takes stock for a whole cart in two statements, whatever its size: the
+# product rows are locked in primary-key order (so two carts sharing products
+# always queue on the same row first and cannot deadlock), checked, then
+# decremented by one UPDATE whose WHERE clause re-checks every line. The
+# stock_quantity >= 0 constraint on Product backs this up at the database.
+def decrement_stock(lines):
+    """
+    Remove (product_id, quantity) lines from stock and return
+    {product_id: remaining}. Must run inside transaction.atomic(); raises
+    InsufficientStock, leaving stock untouched, if any line is short.
+    """
+    wanted = merge_lines(lines)
+    if not wanted:
+        return {}
+
+    try:
+        remaining = _take_stock(wanted)
+    except _StockChanged:
+        # Only possible without row locks (SQLite): another checkout moved
+        # stock between the check and the UPDATE, whose savepoint undid the
+        # partial update. Check and take again against the stock as it is now
+        try:
+            remaining = _take_stock(wanted)
+        except _StockChanged:
+            raise InsufficientStock([])
+
+    # .update() skips signals, so move catalog readers on ourselves
+    transaction.on_commit(bump_catalog_generation)
+    transaction.on_commit(partial(bump_product_versions, list(wanted)))
+    return remaining
+
+
+def _take_stock(wanted):
+    """
+    One locked check-and-decrement of `wanted`; raises _StockChanged if the
+    guarded UPDATE did not match every line.
+    """
+    from .models import Product
+
+    locked = Product.objects.select_for_update().filter(pk__in=list(wanted)) \
+        .order_by("pk").values_list("pk", "name", "stock_quantity")
+    stock = {pk: (name, quantity) for pk, name, quantity in locked}
+    report = shortfalls(wanted, stock)
+    if report:
+        raise InsufficientStock(report)
+
+    guard = Q()
+    for product_id, quantity in wanted.items():
+        guard |= Q(pk=product_id, stock_quantity__gte=quantity)
+    with transaction.atomic():
+        updated = Product.objects.filter(guard).update(stock_quantity=Case(
+            *[When(pk=product_id, then=F("stock_quantity") - quantity)
+              for product_id, quantity in wanted.items()],
+            default=F("stock_quantity"),
+        ))
+        if updated != len(wanted):
+            raise _StockChanged
+    return {pk: stock[pk][1] - quantity for pk, quantity in wanted.items()}
@@ -0,0 +1,184 @@
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+
+SUGGEST_MAX_RESULTS = 10
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def levenshtein(a, b, limit):
+    """Edit distance between a and b, or limit + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def prefix_distance(query, text, limit):
+    """
+    Smallest edit distance between `query` and the start of `text` at any
+    word boundary, allowing the match to be one character shorter or longer.
+    """
+    best = limit + 1
+    starts = [0] + [m.start() + 1 for m in re.finditer(" ", text)]
+    for start in starts:
+        for length in (len(query), len(query) + 1, len(query) - 1):
+            candidate = text[start:start + length]
+            best = min(best, levenshtein(query, candidate, min(limit, best)))
+            if best == 0:
+                return best
+    return best
+
+
+# Autocomplete over product and category names. Every word start of every
+# name is inserted into a character trie whose nodes keep the K most popular
+# entries below them, so a prefix lookup is a walk of len(query) nodes. When
+# the prefix finds too little, a trigram index proposes misspelled matches,
+# which are checked with a bounded edit distance.
+class SuggestIndex:
+    MAX_DEPTH = 24
+    TRIGRAM_CANDIDATES = 50
+
+    def __init__(self, entries, top_k=SUGGEST_MAX_RESULTS):
+        self.top_k = top_k
+        # entries: dicts with type, id, name and popularity; most popular first
+        self.entries = sorted(entries, key=lambda e: (-e["popularity"], e["name"]))
+        self._texts = [normalize(e["name"]) for e in self.entries]
+        self._root = [{}, []]
+        self._trigrams = {}
+
+        for index, text in enumerate(self._texts):
+            starts = [0] + [m.start() + 1 for m in re.finditer(" ", text)]
+            for start in starts:
+                node = self._root
+                for char in text[start:start + self.MAX_DEPTH]:
+                    node = node[0].setdefault(char, [{}, []])
+                    # Entries arrive most popular first, so the first K are the best K
+                    if len(node[1]) < self.top_k and index not in node[1]:
+                        node[1].append(index)
+            for gram in trigrams(text):
+                self._trigrams.setdefault(gram, []).append(index)
+
+    def _prefix_matches(self, query):
+        node = self._root
+        for char in query[:self.MAX_DEPTH]:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        if len(query) <= self.MAX_DEPTH:
+            return list(node[1])
+        return [i for i in node[1] if query in self._texts[i]]
+
+    def _fuzzy_matches(self, query, exclude):
+        limit = max(1, len(query) // 4)
+        overlap = Counter()
+        for gram in trigrams(query):
+            for index in self._trigrams.get(gram, ()):
+                if index not in exclude:
+                    overlap[index] += 1
+        matches = []
+        for index, _ in overlap.most_common(self.TRIGRAM_CANDIDATES):
+            distance = prefix_distance(query, self._texts[index], limit)
+            if distance <= limit:
+                matches.append((distance, index))
+        return matches
+
+    def suggest(self, query, limit=SUGGEST_MAX_RESULTS):
+        query = normalize(query)
+        if not query:
+            return []
+        ranked = [(0, index) for index in self._prefix_matches(query)]
+        if len(ranked) < limit:
+            ranked += self._fuzzy_matches(query, {index for _, index in ranked})
+
+        # Closest spelling first, then most ordered
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        return [
+            {**self.entries[index], "distance": distance}
+            for distance, index in ranked[:limit]
+        ]
+
+
+def build_suggest_index():
+    from .models import Category, OrderItem, Product
+
+    orders = dict(
+        OrderItem.objects.order_by().values("product")
+        .annotate(orders=Count("order", distinct=True))
+        .values_list("product", "orders"))
+
+    entries, category_orders = [], Counter()
+    for pk, name, category_id in Product.objects.order_by().values_list(
+            "pk", "name", "category_id").iterator():
+        popularity = orders.get(pk, 0)
+        category_orders[category_id] += popularity
+        entries.append({"type": "product", "id": str(pk), "name": name,
+                        "popularity": popularity})
+    for pk, name in Category.objects.order_by().values_list("pk", "name"):
+        entries.append({"type": "category", "id": str(pk), "name": name,
+                        "popularity": category_orders[pk]})
+    return SuggestIndex(entries)
+
+
+# Per-process index, rebuilt when the catalog generation moves (checked at
+# most once per refresh interval) and at least every max_age seconds so
+# popularity follows new orders
+class SuggestService:
+    def __init__(self, refresh_interval=5.0, max_age=900):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._index = None
+        self._generation = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        from .catalog import get_catalog_generation
+
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < self.refresh_interval:
+            return self._index
+
+        with self._lock:
+            generation = get_catalog_generation()
+            if (self._index is None or generation != self._generation
+                    or now - self._built_at > self.max_age):
+                self._index = build_suggest_index()
+                self._generation = generation
+                self._built_at = now
+            self._checked_at = now
+        return self._index
+
+    def suggest(self, query, limit=SUGGEST_MAX_RESULTS):
+        return self.get().suggest(query, limit)
+
+
+product_suggester = SuggestService(
+    refresh_interval=getattr(settings, "SUGGEST_REFRESH_INTERVAL", 5.0),
+    max_age=getattr(settings, "SUGGEST_MAX_AGE", 900),
+)
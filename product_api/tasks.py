@@ -1,9 +1,20 @@
 from celery import shared_task
 from django.core.mail import send_mail
 from smtplib import SMTPException
-from . models import RequestLog, SuspiciousIP
-from django.utils.timezone import now, timedelta
-from .models import DailySales, Account
+from . models import BlockedIP
+from django.utils.timezone import now, timedelta, localdate
+from django.conf import settings
+from django.db.models import Case, When, Value, Sum, Min
+from django.db import transaction
+from .models import DailySales, RequestLogPartition, RequestLogRollup
+from .geoip import geo_resolver
+from .partitions import (partition_model, open_partitions, rollup_partition,
+                         drop_partition)
+from .abuse import (drain_pending_flags, upsert_suspicious_ips,
+                    block_temporarily, sensitive_paths_q)
+from .recommendations import rebuild_recommendations
+from .counters import rollover_account
+from .payments import PaymentRetry, settle_webhook, stale_webhooks
 from datetime import date
 
 
@@ -22,40 +33,109 @@ def send_low_stock_email(self, product_name, stock_quantity, recipient):
         raise self.retry(exc=exc)
 
 
-SENSITIVE_PATHS = ['/admin', '/login']
+SENSITIVE_PATHS = getattr(settings, "ABUSE_SENSITIVE_PATHS", ['/admin', '/login'])
+# The real-time detector's threshold, restated per hour for the rollups
+ABUSE_WINDOW_SECONDS = getattr(settings, "ABUSE_WINDOW_SECONDS", 3600)
+HOURLY_REQUEST_THRESHOLD = round(
+    getattr(settings, "ABUSE_REQUEST_THRESHOLD", 100) * 3600 / ABUSE_WINDOW_SECONDS)
 
 
-# Task to Flag Suspicious IP
+# Task to persist IPs flagged in real time by the abuse detector
+@shared_task
+def persist_flagged_ips():
+    reasons = drain_pending_flags()
+    upsert_suspicious_ips(reasons)
+
+    # Optionally escalate to a temporary block
+    block_seconds = getattr(settings, "ABUSE_AUTO_BLOCK_SECONDS", 0)
+    if reasons and block_seconds:
+        block_temporarily(list(reasons), block_seconds)
+    return len(reasons)
+
+
+# Task to remove temporary blocks that have expired
+@shared_task
+def expire_blocked_ips():
+    # Queryset delete sends post_delete, which refreshes the blocklist
+    deleted, _ = BlockedIP.objects.filter(expires_at__lte=now()).delete()
+    return deleted
+
+
+# Task to Flag Suspicious IP. Real-time detection happens in the middleware;
+# this hourly pass reconciles against the rollups with GROUP BY queries. The
+# volume rule only counts requests logged at rate 1: a weighted estimate from
+# a handful of sampled rows is far too noisy to hold one IP to a threshold.
+# Traffic on sampled routes is left to the real-time detector, which counts
+# every request.
 @shared_task
 def flag_suspicious_ips():
-    one_hour_ago = now() - timedelta(hours=1)
+    # Rollups are hourly, so look at the last complete hour only
+    until = now().replace(minute=0, second=0, microsecond=0)
+    since = until - timedelta(hours=1)
+    recent = RequestLogRollup.objects.filter(hour__gte=since, hour__lt=until)
+    reasons = {}
 
-    # Get all logs from the past hour
-    recent_logs = RequestLog.objects.filter(timestamp__gte=one_hour_ago)
+    # Flag IPs over the abuse detector's request threshold
+    heavy = recent.values('ip_address').annotate(total=Sum('exact_count')) \
+        .filter(total__gt=HOURLY_REQUEST_THRESHOLD)
+    for row in heavy:
+        reasons[row['ip_address']] = f"{row['total']} requests in the hour from {since:%H:%M}"
 
-    # Count requests per IP
-    ip_counts = {}
-    flagged_ips = set()
+    # Check for sensitive path access (takes precedence as the reason)
+    sensitive = recent.filter(sensitive_paths_q(SENSITIVE_PATHS)) \
+        .values('ip_address').annotate(path=Min('path'))
+    for row in sensitive:
+        reasons[row['ip_address']] = f"Accessed sensitive path: {row['path']}"
 
-    for log in recent_logs:
-        ip = log.ip_address
-        ip_counts[ip] = ip_counts.get(ip, 0) + 1
+    return upsert_suspicious_ips(reasons)
 
-        # Check for sensitive path access
-        if log.path in SENSITIVE_PATHS:
-            flagged_ips.add(ip)
-            SuspiciousIP.objects.get_or_create(
-                ip_address=ip,
-                defaults={'reason': f"Accessed sensitive path: {log.path}"}
-            )
 
-    # Flag IPs exceeding 100 requests/hour
-    for ip, count in ip_counts.items():
-        if count > 100 and ip not in flagged_ips:
-            SuspiciousIP.objects.get_or_create(
-                ip_address=ip,
-                defaults={'reason': f"{count} requests in the past hour"}
+# Task to fill in country/city for logged requests in bulk
+@shared_task
+def enrich_request_logs(batch_size=None, max_batches=20):
+    batch_size = batch_size or getattr(settings, "GEO_ENRICH_BATCH_SIZE", 500)
+    enriched = 0
+
+    for partition in open_partitions():
+        model = partition_model(partition.day)
+        for _ in range(max_batches):
+            rows = list(model.objects.filter(country__isnull=True)
+                        .order_by('id').values_list('id', 'ip_address')[:batch_size])
+            if not rows:
+                break
+
+            # Each distinct IP is resolved once per batch
+            ips = list({ip for _, ip in rows})
+            resolved = geo_resolver.resolve_many(ips)
+
+            # One UPDATE per batch, mapping ip -> country/city with CASE
+            model.objects.filter(id__in=[pk for pk, _ in rows]).update(
+                country=Case(*[When(ip_address=ip, then=Value(geo["country"]))
+                               for ip, geo in resolved.items()], default=Value("")),
+                city=Case(*[When(ip_address=ip, then=Value(geo["city"]))
+                            for ip, geo in resolved.items()], default=Value("")),
             )
+            enriched += len(rows)
+
+    return enriched
+
+
+# Task to fold new request logs into the hourly rollups
+@shared_task
+def rollup_request_logs():
+    return sum(rollup_partition(partition) for partition in open_partitions())
+
+
+# Task to drop raw request log partitions past the retention window
+@shared_task
+def drop_expired_request_logs():
+    retention_days = getattr(settings, "REQUEST_LOG_RETENTION_DAYS", 30)
+    cutoff = localdate() - timedelta(days=retention_days)
+    dropped = []
+    for partition in RequestLogPartition.objects.filter(day__lt=cutoff):
+        drop_partition(partition)
+        dropped.append(partition.table_name)
+    return dropped
 
 
 # Task to Send order confirmation email
@@ -72,24 +152,43 @@ def send_order_confirmation_email(order_id, user_email):
     )
 
 
+# Task to recompute co-purchase recommendations from the order history
+@shared_task
+def rebuild_product_recommendations():
+    return rebuild_recommendations()
+
+
 # Task to save Daily sales and Reset Account for a New Day
 @shared_task
 def save_daily_sales_task():
-    try:
-        account = Account.objects.get(
-            account_id="00000000-0000-0000-0000-000000000001")
-    except Account.DoesNotExist:
-        return "Global account not found"
-
-    DailySales.objects.create(
-        date=date.today(),
-        total_sales_amount=account.total_sales_amount,
-        total_transactions=account.total_transactions,
-        total_stock_sold=account.total_stock_sold
-    )
-    # Reset global account for new day
-    account.total_sales_amount = 0
-    account.total_transactions = 0
-    account.total_stock_sold = 0
-    account.save()
+    # Move the day's totals out of the account shards and into DailySales
+    # in one transaction; sales made meanwhile count towards the new day
+    with transaction.atomic():
+        totals = rollover_account()
+        if totals is None:
+            return "Global account not found"
+        DailySales.objects.create(date=date.today(), **totals)
     return f"Saved daily sales for {date.today()}"
+
+
+# Task to verify and settle a payment webhook from the inbox
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def settle_payment_webhook(self, webhook_id):
+    try:
+        order = settle_webhook(webhook_id)
+    except PaymentRetry as e:
+        # Out of retries the entry stays RECEIVED, and requeue_payment_webhooks
+        # tries it again later; only the gateway's answer fails a payment
+        if self.request.retries >= self.max_retries:
+            return None
+        raise self.retry(exc=e)
+    return str(order.order_id) if order else None
+
+
+# Task to requeue inbox entries whose settlement job was lost
+@shared_task
+def requeue_payment_webhooks():
+    webhook_ids = list(stale_webhooks().values_list("pk", flat=True))
+    for webhook_id in webhook_ids:
+        settle_payment_webhook.delay(webhook_id)
+    return len(webhook_ids)
@@ -2,7 +2,59 @@ from django.test import TestCase
 from django.test.utils import override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
-from product_api.models import Users, Category, Product
+from django.utils import timezone
+from product_api.models import (Users, Category, Product, RequestLogRollup,
+                                RequestLogPartition, SuspiciousIP, BlockedIP,
+                                Reviews, Order, OrderItem, Wishlist, AccountShard,
+                                DailySales, Transaction, PaymentWebhook)
+from django.core.management import call_command
+from product_api.logbuffer import RequestLogBuffer
+from product_api.blocklist import IPBlocklist, get_blocklist_version
+from product_api.geoip import MMapGeoBackend, write_geoip_database
+from product_api.tasks import (enrich_request_logs, rollup_request_logs,
+                               drop_expired_request_logs, persist_flagged_ips,
+                               rebuild_product_recommendations, flag_suspicious_ips,
+                               settle_payment_webhook, requeue_payment_webhooks)
+from product_api.abuse import AbuseDetector, drain_pending_flags
+from product_api.throttling import RatePolicy, rate_limiter
+from product_api.utils import get_client_ip
+from django_redis import get_redis_connection
+from product_api.partitions import ensure_partition, partition_model, rollup_partition
+from product_api import async_views
+from product_api.middleware import RequestLoggingMiddleware
+from product_api.sampling import PathClassifier
+from product_api.search import MemorySearchBackend
+from product_api.suggest import SuggestIndex
+from product_api.prerender import response_store
+from product_api.stock import InsufficientStock, _StockChanged, decrement_stock
+from product_api.orders import cart_lines, materialize_order
+from product_api.counters import (GLOBAL_ACCOUNT_ID, account_totals, ensure_shards,
+                                  record_sale)
+from product_api.tasks import save_daily_sales_task
+from product_api.payments import PaymentRetry, settle_webhook
+from product_api.chapa import (ChapaClient, ChapaError, CircuitBreaker, CircuitOpen,
+                                StubChapaAdapter)
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from datetime import timedelta
+from unittest import mock
+import requests
+from http.client import RemoteDisconnected
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from decimal import Decimal
+import gzip
+import json
+import os
+import tempfile
+
+
+def clear_catalog_cache():
+    redis = get_redis_connection("default")
+    for key in redis.scan_iter("*catalog:*"):
+        redis.delete(key)
 
 
 # Test for User Registration, Login
@@ -28,6 +80,7 @@ class UserTests(TestCase):
 @override_settings(RATELIMIT_ENABLE=False)
 class CategoryProductTests(TestCase):
     def setUp(self):
+        clear_catalog_cache()
         self.client = APIClient()
         self.user = Users.objects.create_user(
             username="tester", password="password123"
@@ -91,3 +144,1052 @@ class CategoryProductTests(TestCase):
         response = self.client.get("/api/products/")
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
         self.assertGreaterEqual(len(response.data), 1)
+
+    def test_catalog_snapshot_follows_stock_changes(self):
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        product = Product.objects.create(
+            name="Backpack", description="Laptop backpack", price="30.00",
+            stock_quantity=5, category=category, user_id=self.user)
+        url = f"/api/products/{product.pk}/"
+        client = APIClient()
+        self.assertEqual(client.get(url).json()["stock_quantity"], 5)
+
+        # Cached: the database is not queried again
+        Product.objects.filter(pk=product.pk).update(stock_quantity=4)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).json()["stock_quantity"], 5)
+
+        product.stock_quantity = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(client.get(url).json()["stock_quantity"], 3)
+        self.assertEqual(client.get("/api/products/").json()["results"][0]["stock_quantity"], 3)
+
+
+# Test for the denormalised rating aggregates
+@override_settings(RATELIMIT_ENABLE=False)
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = Users.objects.create_user(username="rater", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        self.product, self.other = [
+            Product.objects.create(
+                name=name, description="Bag", price="30.00", stock_quantity=5,
+                category=category, user_id=self.user)
+            for name in ("Backpack", "Tote")
+        ]
+
+    def test_reviews_update_aggregates_incrementally(self):
+        first = Reviews.objects.create(
+            product_id=self.product, user_id=self.user, comment="ok", ratings=4)
+        Reviews.objects.create(
+            product_id=self.product, user_id=self.user, comment="great", ratings=5)
+        first.ratings = 2
+        first.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (7, 2))
+        self.assertEqual((self.product.rating_2, self.product.rating_4, self.product.rating_5), (1, 0, 1))
+        self.assertAlmostEqual(self.product.rating_avg, 3.5)
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_avg), (1, 5.0))
+
+        response = APIClient().get("/api/products/", {"ordering": "-rating_avg"})
+        names = [row["name"] for row in response.json()["results"]]
+        self.assertEqual(names, ["Backpack", "Tote"])
+        self.assertIsNone(response.json()["results"][1]["avg_rating"])
+
+    def test_list_is_compact_with_sparse_fields_and_capped_expansions(self):
+        for i in range(5):
+            Reviews.objects.create(
+                product_id=self.product, user_id=self.user, comment=f"review {i}", ratings=4)
+
+        client = APIClient()
+        row = client.get("/api/products/").json()["results"][0]
+        self.assertNotIn("reviews", row)
+        self.assertNotIn("description", row)
+
+        response = client.get("/api/products/", {"fields": "name,price"})
+        self.assertEqual(set(response.json()["results"][0]), {"name", "price"})
+
+        # One query for the page, one per expanded relation
+        with self.assertNumQueries(3):
+            response = client.get("/api/products/", {"expand": "reviews,images"})
+        backpack = next(r for r in response.json()["results"] if r["name"] == "Backpack")
+        self.assertEqual([r["comment"] for r in backpack["reviews"]],
+                         ["review 4", "review 3", "review 2"])
+        self.assertEqual(backpack["product_images"], [])
+
+        # The detail view keeps every review
+        detail = client.get(f"/api/products/{self.product.pk}/").json()
+        self.assertEqual(len(detail["reviews"]), 5)
+
+    def test_product_writes_leave_the_aggregates_to_the_reviews(self):
+        admin = Users.objects.create_superuser(username="owner", password="password123")
+        Product.objects.filter(pk=self.product.pk).update(user_id=admin)
+        client = APIClient()
+        client.force_authenticate(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.patch(f"/api/products/{self.product.pk}/update/", {"price": "25.00"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1, updates)
+        self.assertNotIn("rating_", updates[0])
+
+        # Counters that have drifted to 0 do not go negative
+        review = Reviews.objects.create(
+            product_id=self.product, user_id=self.user, comment="ok", ratings=4)
+        Product.objects.filter(pk=self.product.pk).update(rating_4=0, rating_sum=0, rating_count=0)
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.rating_4, self.product.rating_sum, self.product.rating_count,
+             self.product.rating_avg), (0, 0, 0, 0.0))
+
+    def test_aggregates_are_written_before_the_catalog_moves(self):
+        seen = []
+
+        def bump():
+            seen.append(Product.objects.get(pk=self.product.pk).rating_count)
+
+        # Outside a transaction on_commit callbacks run straight away
+        with mock.patch("product_api.signals.bump_catalog_generation", bump), \
+                mock.patch("django.db.transaction.on_commit", lambda func: func()):
+            Reviews.objects.create(
+                product_id=self.product, user_id=self.user, comment="ok", ratings=4)
+        self.assertEqual(seen, [1])
+
+    def test_rebuild_ratings_command(self):
+        Reviews.objects.create(
+            product_id=self.other, user_id=self.user, comment="meh", ratings=3)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_3=0, rating_avg=0)
+
+        call_command("rebuild_ratings", stdout=open(os.devnull, "w"))
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.rating_count, self.other.rating_3, self.other.rating_avg), (1, 1, 3.0))
+
+
+# Test for ranked full-text product search
+@override_settings(RATELIMIT_ENABLE=False)
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        user = Users.objects.create_user(username="seller", password="password123")
+        bags = Category.objects.create(name="Bags", description="Carry bags")
+        shoes = Category.objects.create(name="Shoes", description="Footwear")
+        for name, description, category, price in [
+            ("Running shoes", "Light trainers for running", shoes, "80.00"),
+            ("Trail runner", "Shoes for running on trails", shoes, "120.00"),
+            ("Gym bag", "Holds your running kit", bags, "30.00"),
+            ("Laptop backpack", "Padded laptop sleeve", bags, "45.00"),
+        ]:
+            Product.objects.create(name=name, description=description, price=price,
+                                   stock_quantity=5, category=category, user_id=user)
+
+    def search(self, **params):
+        response = APIClient().get("/api/products/search/", params)
+        return [row["name"] for row in response.json()["results"]]
+
+    def test_ranks_by_relevance_and_keeps_filters(self):
+        results = self.search(search="running shoes")
+        self.assertEqual(results[0], "Running shoes")
+        self.assertNotIn("Laptop backpack", results)
+
+        self.assertNotIn("Trail runner", self.search(search="running", price_max="100"))
+
+        # The index follows edits
+        product = Product.objects.get(name="Laptop backpack")
+        product.description = "Padded sleeve, good for running commutes"
+        product.save()
+        self.assertIn("Laptop backpack", self.search(search="running"))
+
+    def test_memory_backend_bm25(self):
+        backend = MemorySearchBackend()
+        with mock.patch("product_api.catalog.get_catalog_generation", return_value=1):
+            scores = backend.scores("running")
+        names = dict(Product.objects.values_list("pk", "name"))
+        ranked = [names[pk] for pk in scores]
+        self.assertEqual(set(ranked), {"Running shoes", "Trail runner", "Gym bag"})
+        self.assertEqual(ranked[0], "Running shoes")
+
+
+# Test for conditional GET on catalog reads
+@override_settings(RATELIMIT_ENABLE=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = Users.objects.create_user(username="seller", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        self.product, self.other = [
+            Product.objects.create(name=name, description=name, price="10.00",
+                                   stock_quantity=5, category=category, user_id=self.user)
+            for name in ("Backpack", "Tote")
+        ]
+
+    def revalidate(self, url):
+        client = APIClient()
+        etag = client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_not_modified_until_the_resource_changes(self):
+        detail = f"/api/products/{self.product.pk}/"
+        other = f"/api/products/{self.other.pk}/"
+        etags = {url: self.revalidate(url)
+                 for url in (detail, other, "/api/products/", "/api/categories/", "/api/reviews/")}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reviews.objects.create(product_id=self.product, user_id=self.user,
+                                   comment="ok", ratings=4)
+
+        client = APIClient()
+        for url in (detail, "/api/products/", "/api/reviews/"):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response["ETag"], etags[url])
+        # Other products keep their ETag
+        self.assertEqual(client.get(other, HTTP_IF_NONE_MATCH=etags[other]).status_code, 304)
+
+        modified = client.get(detail)["Last-Modified"]
+        self.assertEqual(client.get(detail, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+
+
+# Test for the pre-rendered response store
+@override_settings(RATELIMIT_ENABLE=False)
+class ResponseStoreTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        response_store._local.clear()
+        user = Users.objects.create_user(username="seller", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        for i in range(4):
+            Product.objects.create(name=f"Bag {i}", description="Bag", price="10.00",
+                                   stock_quantity=5, category=category, user_id=user)
+
+    def test_serves_stored_bytes_in_the_negotiated_encoding(self):
+        client = APIClient()
+        plain = client.get("/api/products/")
+        compressed = client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed["ETag"], plain["ETag"][:-1] + '-gzip"')
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+        # A hit runs neither queries nor renderers
+        with self.assertNumQueries(0), mock.patch(
+                "rest_framework.renderers.JSONRenderer.render", side_effect=AssertionError):
+            again = client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(again.content, compressed.content)
+        self.assertEqual(again["ETag"], compressed["ETag"])
+
+
+# Test for keyset pagination
+@override_settings(RATELIMIT_ENABLE=False)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        user = Users.objects.create_user(username="seller", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        # Equal prices exercise the primary key tie-breaker
+        for i in range(7):
+            Product.objects.create(name=f"Bag {i}", description="Bag", price=str(10 + i // 2),
+                                   stock_quantity=5, category=category, user_id=user)
+
+    def walk(self, **params):
+        client = APIClient()
+        response = client.get("/api/products/", {"page_size": 3, **params})
+        pages = [response.json()]
+        while pages[-1]["next"]:
+            pages.append(client.get(pages[-1]["next"]).json())
+        return pages
+
+    def test_cursor_walks_every_row_once_in_order(self):
+        pages = self.walk(ordering="price")
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 1])
+        self.assertNotIn("count", pages[0])
+        self.assertIsNone(pages[0]["previous"])
+
+        rows = [row for page in pages for row in page["results"]]
+        self.assertEqual(len({row["product_id"] for row in rows}), 7)
+        prices = [float(row["price"]) for row in rows]
+        self.assertEqual(prices, sorted(prices))
+
+        # The previous link returns the page before
+        previous = APIClient().get(pages[2]["previous"]).json()
+        self.assertEqual(previous["results"], pages[1]["results"])
+
+    def test_default_order_is_newest_first(self):
+        names = [row["name"] for page in self.walk() for row in page["results"]]
+        self.assertEqual(names, [f"Bag {i}" for i in reversed(range(7))])
+
+    def test_rejects_tampered_or_foreign_cursors(self):
+        self.assertEqual(APIClient().get("/api/products/", {"cursor": "nope"}).status_code, 404)
+        cursor = self.walk(ordering="price")[0]["next"].split("cursor=")[1]
+        response = APIClient().get("/api/products/", {"cursor": cursor, "ordering": "-created_at"})
+        self.assertEqual(response.status_code, 404)
+
+
+# Test for the faceted navigation counts
+@override_settings(RATELIMIT_ENABLE=False)
+class ProductFacetsTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        user = Users.objects.create_user(username="seller", password="password123")
+        bags = Category.objects.create(name="Bags", description="Carry bags")
+        shoes = Category.objects.create(name="Shoes", description="Footwear")
+        for name, category, price, stock in [
+            ("Tote", bags, "20.00", 5), ("Backpack", bags, "45.00", 0),
+            ("Sneakers", shoes, "80.00", 3), ("Boots", shoes, "300.00", 1),
+        ]:
+            product = Product.objects.create(
+                name=name, description=name, price=price, stock_quantity=stock,
+                category=category, user_id=user)
+        Reviews.objects.create(product_id=product, user_id=user, comment="ok", ratings=4)
+
+    def test_counts_every_facet_in_one_query_and_caches_by_filters(self):
+        client = APIClient()
+        # Categories, then one aggregate over the products
+        with self.assertNumQueries(2):
+            facets = client.get("/api/products/facets/").json()
+        self.assertEqual(facets["total"], 4)
+        self.assertEqual([(c["name"], c["count"]) for c in facets["categories"]],
+                         [("Bags", 2), ("Shoes", 2)])
+        self.assertEqual([b["count"] for b in facets["price"]], [1, 1, 1, 0, 1])
+        self.assertEqual(facets["stock"], {"in_stock": 3, "out_of_stock": 1})
+        self.assertEqual(facets["rating"][0], {"min": 4, "count": 1})
+
+        facets = client.get("/api/products/facets/", {"price_max": "100", "in_stock": "true"}).json()
+        self.assertEqual(facets["total"], 2)
+
+        # Same selection, differently spelled: served from the cache
+        with self.assertNumQueries(0):
+            client.get("/api/products/facets/", {"in_stock": "True", "price_max": "100.00"})
+
+        self.assertEqual(client.get("/api/products/facets/", {"price_max": "x"}).status_code, 400)
+
+
+# Test for co-purchase recommendations
+@override_settings(RATELIMIT_ENABLE=False)
+class RecommendationTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = Users.objects.create_user(username="buyer", password="password123")
+        bags = Category.objects.create(name="Bags", description="Carry bags")
+        shoes = Category.objects.create(name="Shoes", description="Footwear")
+        self.products = {
+            name: Product.objects.create(
+                name=name, description=name, price="10.00", stock_quantity=50,
+                category=category, user_id=self.user)
+            for name, category in [("Backpack", bags), ("Tote", bags), ("Duffel", bags),
+                                   ("Sneakers", shoes), ("Socks", shoes)]
+        }
+
+    def order(self, *names):
+        order = Order.objects.create(
+            user=self.user, tx_ref=f"tx-{Order.objects.count()}", total_amount="10.00")
+        for name in names:
+            OrderItem.objects.create(order=order, product=self.products[name], price="10.00")
+
+    def related(self, name):
+        response = APIClient().get(f"/api/products/{self.products[name].pk}/related/")
+        return [row["name"] for row in response.json()]
+
+    def test_co_purchases_rank_first_then_category_best_sellers(self):
+        self.order("Sneakers", "Socks")
+        self.order("Sneakers", "Socks")
+        self.order("Sneakers", "Backpack")
+        self.order("Duffel", "Duffel")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebuild_product_recommendations(), 4)
+        self.assertEqual(self.related("Sneakers"), ["Socks", "Backpack"])
+
+        # Never co-purchased: same category, best sellers first
+        self.assertEqual(self.related("Tote"), ["Duffel", "Backpack"])
+
+
+# Test for the set-based stock engine
+class StockEngineTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        user = Users.objects.create_user(username="seller", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        self.tote, self.duffel = [
+            Product.objects.create(name=name, description=name, price="10.00",
+                                   stock_quantity=stock, category=category, user_id=user)
+            for name, stock in (("Tote", 5), ("Duffel", 2))
+        ]
+
+    def stock(self):
+        return dict(Product.objects.values_list("name", "stock_quantity"))
+
+    def test_decrements_every_line_in_two_statements(self):
+        # Repeated lines are merged
+        lines = [(self.tote.pk, 2), (self.duffel.pk, 2), (self.tote.pk, 1)]
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            remaining = decrement_stock(lines)
+        statements = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(remaining, {self.tote.pk: 2, self.duffel.pk: 0})
+        self.assertEqual(self.stock(), {"Tote": 2, "Duffel": 0})
+
+    def test_shortfall_reports_every_short_line_and_takes_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised, transaction.atomic():
+            decrement_stock([(self.tote.pk, 1), (self.duffel.pk, 3)])
+        self.assertEqual(raised.exception.shortfalls, [{
+            "product_id": str(self.duffel.pk), "name": "Duffel",
+            "requested": 3, "available": 2,
+        }])
+        self.assertEqual(self.stock(), {"Tote": 5, "Duffel": 2})
+
+    def test_stock_cannot_go_negative(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.filter(pk=self.tote.pk).update(stock_quantity=-1)
+
+    def test_stock_moving_under_the_update_is_retried_once(self):
+        lines = [(self.tote.pk, 2)]
+        with mock.patch("product_api.stock._take_stock",
+                        side_effect=[_StockChanged, {self.tote.pk: 3}]) as take:
+            with transaction.atomic():
+                self.assertEqual(decrement_stock(lines), {self.tote.pk: 3})
+        self.assertEqual(take.call_count, 2)
+
+        with mock.patch("product_api.stock._take_stock", side_effect=_StockChanged), \
+                self.assertRaises(InsufficientStock) as raised, transaction.atomic():
+            decrement_stock(lines)
+        self.assertEqual(raised.exception.shortfalls, [])
+        self.assertEqual(str(raised.exception), "Stock changed while the order was placed")
+
+
+# Test for order materialization
+class OrderMaterializationTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = Users.objects.create_user(username="buyer", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        self.products = [
+            Product.objects.create(name=f"Bag {i}", description="Bag", price="10.00",
+                                   stock_quantity=10, category=category, user_id=self.user)
+            for i in range(4)
+        ]
+        ensure_shards()
+
+    def checkout(self, tx_ref, count):
+        for product in self.products[:count]:
+            Wishlist.objects.create(user=self.user, product=product, quantity=2)
+        cart = Wishlist.objects.filter(user=self.user)
+        lines = cart_lines(cart)
+        with CaptureQueriesContext(connection) as queries:
+            order = materialize_order(self.user, tx_ref, Decimal(20 * count), "success", cart, lines)
+        return order, [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+
+    def test_writes_the_order_in_a_fixed_number_of_statements(self):
+        order, small = self.checkout("wl-1", 1)
+        self.assertEqual(order.items.count(), 1)
+
+        order, large = self.checkout("wl-2", 4)
+        self.assertEqual(len(large), len(small), large)
+        self.assertEqual(sorted(order.items.values_list("quantity", "price")),
+                         [(2, Decimal("10.00"))] * 4)
+        self.assertEqual(order.total_amount, Decimal("80.00"))
+        self.assertTrue(Transaction.objects.filter(tx_ref="wl-2", amount=80).exists())
+        self.assertFalse(Wishlist.objects.filter(user=self.user).exists())
+
+        self.assertEqual(account_totals(), {
+            "total_sales_amount": Decimal("100.00"),
+            "total_transactions": 2,
+            "total_stock_sold": 10,
+        })
+
+    def test_short_cart_writes_nothing(self):
+        Wishlist.objects.create(user=self.user, product=self.products[0], quantity=11)
+        cart = Wishlist.objects.filter(user=self.user)
+        with self.assertRaises(InsufficientStock):
+            materialize_order(self.user, "wl-3", Decimal("110"), "success", cart, cart_lines(cart))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(account_totals()["total_transactions"], 0)
+        self.assertEqual(cart.count(), 1)
+
+
+# Test for the sharded global account
+class AccountShardTests(TestCase):
+    def test_sales_spread_over_shards_and_read_as_one_account(self):
+        for shard in range(4):
+            with mock.patch("product_api.counters.random.randrange", return_value=shard):
+                record_sale(Decimal("12.50"), 3)
+        self.assertEqual(AccountShard.objects.filter(total_transactions=1).count(), 4)
+
+        admin = Users.objects.create_superuser(username="boss", password="password123")
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get("/api/admin/global-accounts/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [account] = response.data
+        self.assertEqual(account["account_id"], GLOBAL_ACCOUNT_ID)
+        self.assertEqual(account["total_sales_amount"], "50.00")
+        self.assertEqual(account["total_transactions"], 4)
+        self.assertEqual(account["total_stock_sold"], 12)
+
+    def test_daily_rollover_moves_totals_out_of_the_shards(self):
+        record_sale(Decimal("20.00"), 2)
+        record_sale(Decimal("5.00"), 1)
+        save_daily_sales_task()
+
+        daily = DailySales.objects.get()
+        self.assertEqual((daily.total_sales_amount, daily.total_transactions,
+                          daily.total_stock_sold), (Decimal("25.00"), 2, 3))
+        self.assertEqual(account_totals()["total_transactions"], 0)
+
+        record_sale(Decimal("7.00"), 1)
+        self.assertEqual(account_totals()["total_sales_amount"], Decimal("7.00"))
+
+
+# Test for the payment webhook inbox
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = Users.objects.create_user(
+            username="buyer", password="password123", email="buyer@example.com")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        product = Product.objects.create(name="Tote", description="Tote", price="10.00",
+                                         stock_quantity=5, category=category, user_id=self.user)
+        Wishlist.objects.create(user=self.user, product=product, quantity=2)
+        self.tx_ref = f"wl-{str(self.user.user_id)[:8]}-1700000000"
+        Transaction.objects.create(user=self.user, tx_ref=self.tx_ref, amount="20.00",
+                                   status="pending")
+
+    def gateway(self, **response):
+        client = mock.Mock()
+        client.verify.return_value = response
+        return mock.patch("product_api.payments.get_chapa_client", return_value=client)
+
+    def test_duplicate_webhooks_queue_one_settlement(self):
+        with mock.patch("product_api.tasks.settle_payment_webhook.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                response = self.client.post("/api/chapa-webhook/", {"tx_ref": self.tx_ref})
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        webhook = PaymentWebhook.objects.get()
+        delay.assert_called_once_with(webhook.pk)
+        self.assertEqual(response.json(), {"tx_ref": self.tx_ref, "status": "received"})
+
+        response = self.client.post("/api/chapa-webhook/", {"tx_ref": "wl-1; DROP"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_worker_settles_the_pending_transaction_once(self):
+        webhook = PaymentWebhook.objects.create(tx_ref=self.tx_ref, cart=PaymentWebhook.WISHLIST)
+        with self.gateway(status="success", data={"amount": "20.00"}):
+            order = settle_webhook(webhook.pk)
+            self.assertIsNone(settle_webhook(webhook.pk))
+
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(Transaction.objects.get(tx_ref=self.tx_ref).status, "success")
+        webhook.refresh_from_db()
+        self.assertEqual((webhook.status, webhook.attempts), (PaymentWebhook.SETTLED, 1))
+
+    def test_unreachable_gateway_releases_the_webhook_for_retry(self):
+        webhook = PaymentWebhook.objects.create(tx_ref=self.tx_ref, cart=PaymentWebhook.WISHLIST)
+        client = mock.Mock()
+        client.verify.side_effect = ChapaError("down")
+        with mock.patch("product_api.payments.get_chapa_client", return_value=client), \
+                self.assertRaises(PaymentRetry):
+            settle_webhook(webhook.pk)
+        webhook.refresh_from_db()
+        self.assertEqual(webhook.status, PaymentWebhook.RECEIVED)
+
+        with self.gateway(status="failed", message="declined"):
+            self.assertIsNone(settle_webhook(webhook.pk))
+        webhook.refresh_from_db()
+        self.assertEqual(webhook.status, PaymentWebhook.FAILED)
+        self.assertEqual(Transaction.objects.get(tx_ref=self.tx_ref).status, "failed")
+        self.assertFalse(Order.objects.exists())
+
+    def test_exhausted_retries_leave_the_webhook_for_requeue(self):
+        webhook = PaymentWebhook.objects.create(tx_ref=self.tx_ref, cart=PaymentWebhook.WISHLIST)
+        client = mock.Mock()
+        client.verify.side_effect = ChapaError("down")
+        with mock.patch("product_api.payments.get_chapa_client", return_value=client):
+            result = settle_payment_webhook.apply(
+                args=[webhook.pk], retries=settle_payment_webhook.max_retries)
+        self.assertIsNone(result.get())
+
+        webhook.refresh_from_db()
+        self.assertEqual(webhook.status, PaymentWebhook.RECEIVED)
+        self.assertIn("down", webhook.error)
+        self.assertEqual(Transaction.objects.get(tx_ref=self.tx_ref).status, "pending")
+
+        PaymentWebhook.objects.filter(pk=webhook.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1))
+        with mock.patch("product_api.tasks.settle_payment_webhook.delay") as delay:
+            self.assertEqual(requeue_payment_webhooks(), 1)
+        delay.assert_called_once_with(webhook.pk)
+
+
+# Test for the Chapa gateway client
+class ChapaClientTests(TestCase):
+    def client_for(self, adapter, **kwargs):
+        return ChapaClient("https://chapa.test", "secret", backoff=0, adapter=adapter, **kwargs)
+
+    def test_stub_gateway_initializes_and_verifies(self):
+        client = self.client_for(StubChapaAdapter())
+        data = client.initialize({"tx_ref": "wl-stub-1", "amount": "30.00", "email": "a@b.c"})
+        self.assertEqual(data["status"], "success")
+        self.assertIn("wl-stub-1", data["data"]["checkout_url"])
+
+        data = client.verify("wl-stub-1")
+        self.assertEqual((data["status"], data["data"]["amount"]), ("success", "30.00"))
+        self.assertEqual(client.verify("wl-unknown")["status"], "failed")
+        summary = client.summary()
+        self.assertEqual((summary["scope"], summary["pid"]), ("process", os.getpid()))
+        self.assertEqual([row["count"] for row in summary["operations"]], [1, 2])
+
+    def test_retries_then_opens_the_circuit(self):
+        adapter = mock.Mock()
+        adapter.send.side_effect = requests.ConnectionError("refused")
+        client = self.client_for(adapter, retries=2, breaker=CircuitBreaker(threshold=1))
+
+        with self.assertRaises(ChapaError):
+            client.verify("wl-1")
+        self.assertEqual(adapter.send.call_count, 3)
+        with self.assertRaises(CircuitOpen):
+            client.verify("wl-1")
+        self.assertEqual(adapter.send.call_count, 3)
+        self.assertEqual(client.summary()["circuit"], "open")
+
+    def test_post_is_not_retried_once_the_request_was_sent(self):
+        adapter = mock.Mock()
+        adapter.send.side_effect = requests.ReadTimeout("slow")
+        client = self.client_for(adapter, retries=2)
+        with self.assertRaises(ChapaError):
+            client.initialize({"tx_ref": "wl-2", "amount": "1.00"})
+        self.assertEqual(adapter.send.call_count, 1)
+
+    def test_post_is_not_retried_when_the_connection_drops_after_sending(self):
+        adapter = mock.Mock()
+        adapter.send.side_effect = requests.ConnectionError(ProtocolError(
+            "Connection aborted.", RemoteDisconnected("Remote end closed connection")))
+        client = self.client_for(adapter, retries=2)
+        with self.assertRaises(ChapaError):
+            client.initialize({"tx_ref": "wl-3", "amount": "1.00"})
+        self.assertEqual(adapter.send.call_count, 1)
+
+        # Refused before connecting: safe to try again
+        adapter.send.side_effect = requests.ConnectionError(MaxRetryError(
+            None, "/v1/transaction/initialize", NewConnectionError(None, "refused")))
+        with self.assertRaises(ChapaError):
+            client.initialize({"tx_ref": "wl-3", "amount": "1.00"})
+        self.assertEqual(adapter.send.call_count, 4)
+
+
+# Test for the autocomplete index
+@override_settings(RATELIMIT_ENABLE=False)
+class ProductSuggestTests(TestCase):
+    def test_prefix_and_typo_matches_ranked_by_popularity(self):
+        index = SuggestIndex([
+            {"type": "product", "id": "1", "name": "Laptop backpack", "popularity": 2},
+            {"type": "product", "id": "2", "name": "Backgammon set", "popularity": 9},
+            {"type": "category", "id": "3", "name": "Bags", "popularity": 4},
+        ])
+        # Prefix hits by popularity, then close misspellings
+        self.assertEqual([r["name"] for r in index.suggest("bac")],
+                         ["Backgammon set", "Laptop backpack", "Bags"])
+        self.assertEqual(index.suggest("bakpack")[0]["name"], "Laptop backpack")
+        self.assertEqual(index.suggest("bakpack")[0]["distance"], 1)
+        self.assertEqual(index.suggest("xyz"), [])
+
+    def test_endpoint_serves_catalog_names(self):
+        clear_catalog_cache()
+        user = Users.objects.create_user(username="seller", password="password123")
+        category = Category.objects.create(name="Bags", description="Carry bags")
+        Product.objects.create(name="Laptop backpack", description="Bag", price="45.00",
+                               stock_quantity=5, category=category, user_id=user)
+
+        response = APIClient().get("/api/products/suggest/", {"q": "ba"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({r["name"] for r in response.data["results"]},
+                         {"Bags", "Laptop backpack"})
+
+
+# Test for the buffered RequestLog writer
+class RequestLogBufferTests(TestCase):
+    def test_flush_writes_in_batches_and_counts_drops(self):
+        # A past day, so rows flushed by the app's own buffer thread during
+        # the test run never land in the partition being counted
+        timestamp = timezone.now() - timedelta(days=2)
+        buffer = RequestLogBuffer(max_size=3, batch_size=2, flush_interval=0)
+        for i in range(4):
+            buffer.push(("127.0.0.1", timestamp, f"/api/{i}/", "", "", 1.0))
+
+        self.assertEqual(buffer.stats()["dropped"], 1)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(partition_model(timezone.localdate(timestamp)).objects.count(), 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_day_only_drops_its_own_records(self):
+        from product_api import partitions
+
+        good = timezone.now() - timedelta(days=2)
+        bad = timezone.now() - timedelta(days=3)
+        buffer = RequestLogBuffer(max_size=10, batch_size=10, flush_interval=0)
+        for timestamp in (good, good, bad):
+            buffer.push(("127.0.0.1", timestamp, "/api/", "", "", 1.0))
+
+        real_ensure = partitions.ensure_partition
+
+        def ensure(day):
+            if day == timezone.localdate(bad):
+                raise OperationalError("database is locked")
+            return real_ensure(day)
+
+        with mock.patch("product_api.partitions.ensure_partition", side_effect=ensure):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.stats()["dropped"], 1)
+        self.assertEqual(partition_model(timezone.localdate(good)).objects.count(), 2)
+
+
+# Test for the in-memory IP blocklist
+class IPBlocklistTests(TestCase):
+    def test_matches_exact_addresses_and_cidr_ranges(self):
+        blocklist = IPBlocklist(["203.0.113.7", "10.0.0.0/8", "2001:db8::/32"])
+
+        self.assertIn("203.0.113.7", blocklist)
+        self.assertIn("10.20.30.40", blocklist)
+        self.assertIn("::ffff:10.1.1.1", blocklist)
+        self.assertIn("2001:db8:1::1", blocklist)
+        self.assertNotIn("203.0.113.8", blocklist)
+        self.assertNotIn("11.0.0.1", blocklist)
+        self.assertNotIn("not-an-ip", blocklist)
+
+    def test_version_moves_only_after_commit(self):
+        version = get_blocklist_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            BlockedIP.objects.create(ip_address="203.0.113.9")
+            self.assertEqual(get_blocklist_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_blocklist_version(), version + 1)
+
+
+# Test for the memory-mapped GeoIP database
+class GeoIPDatabaseTests(TestCase):
+    def test_lookup_binary_searches_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ranges.bin")
+            write_geoip_database(path, [
+                ("41.0.0.0", "41.255.255.255", "Nigeria", "Lagos"),
+                ("8.8.8.0", "8.8.8.255", "United States", "Mountain View"),
+                ("2001:db8::", "2001:db8::ffff", "Ethiopia", "Addis Ababa"),
+            ])
+            backend = MMapGeoBackend(path)
+
+            self.assertEqual(backend.lookup("41.58.1.1"),
+                             {"country": "Nigeria", "city": "Lagos"})
+            self.assertEqual(backend.lookup("8.8.8.8")["city"], "Mountain View")
+            self.assertEqual(backend.lookup("2001:db8::1")["country"], "Ethiopia")
+            self.assertIsNone(backend.lookup("9.9.9.9"))
+            self.assertIsNone(backend.lookup("1.1.1.1"))
+            backend._mm.close()
+
+
+# Test for deferred geo-enrichment of request logs
+class EnrichRequestLogsTests(TestCase):
+    def test_resolves_each_ip_once_and_updates_rows(self):
+        # Kept off today's partition, which the app's buffer thread writes to
+        day = timezone.localdate() - timedelta(days=2)
+        RequestLog = ensure_partition(day)
+        for ip in ["41.58.1.1", "41.58.1.1", "8.8.8.8"]:
+            RequestLog.objects.create(ip_address=ip, timestamp=timezone.now(), path="/api/")
+
+        backend = mock.Mock()
+        backend.lookup_many.side_effect = lambda ips: {
+            ip: {"country": "Nigeria", "city": "Lagos"} for ip in ips if ip.startswith("41.")}
+        with mock.patch("product_api.geoip.get_geo_backend", return_value=backend), \
+                mock.patch("product_api.geoip.geo_resolver._cache", {}), \
+                mock.patch("product_api.tasks.open_partitions",
+                           return_value=RequestLogPartition.objects.filter(day=day)):
+            self.assertEqual(enrich_request_logs(), 3)
+
+        self.assertCountEqual(backend.lookup_many.call_args[0][0], ["41.58.1.1", "8.8.8.8"])
+        self.assertEqual(RequestLog.objects.filter(country="Nigeria").count(), 2)
+        self.assertEqual(RequestLog.objects.get(ip_address="8.8.8.8").country, "")
+        self.assertFalse(RequestLog.objects.filter(country__isnull=True).exists())
+
+
+# Test for request log partitions, rollups and retention
+class RequestLogPartitionTests(TestCase):
+    def test_rollup_counts_enriched_rows_once(self):
+        # Kept off today's partition, which the app's buffer thread writes to
+        hour_ago = timezone.now() - timedelta(days=2)
+        model = ensure_partition(timezone.localdate(hour_ago))
+        for ip, country in [("1.1.1.1", "Nigeria"), ("1.1.1.1", "Nigeria"),
+                            ("2.2.2.2", "Kenya"), ("3.3.3.3", None)]:
+            model.objects.create(ip_address=ip, timestamp=hour_ago,
+                                 path="/api/products/", country=country)
+
+        self.assertEqual(rollup_request_logs(), 3)
+        self.assertEqual(rollup_request_logs(), 0)
+        rollup = RequestLogRollup.objects.get(ip_address="1.1.1.1")
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.hour.minute, 0)
+        self.assertFalse(RequestLogRollup.objects.filter(ip_address="3.3.3.3").exists())
+
+    def test_overlapping_rollups_count_rows_once(self):
+        day = timezone.localdate() - timedelta(days=2)
+        model = ensure_partition(day)
+        logged_at = timezone.now() - timedelta(days=2)
+        model.objects.bulk_create([
+            model(ip_address="1.1.1.1", timestamp=logged_at, path="/api/", country="")
+            for _ in range(3)])
+        model.objects.create(ip_address="1.1.1.1", timestamp=logged_at, path="/api/", country=None)
+
+        # Both runs read the partition before either had rolled it up
+        first, second = [RequestLogPartition.objects.get(day=day) for _ in range(2)]
+        self.assertEqual(rollup_partition(first), 3)
+        self.assertEqual(rollup_partition(second), 0)
+
+        model.objects.filter(country__isnull=True).update(country="")
+        self.assertEqual(rollup_partition(first), 1)
+        self.assertEqual(RequestLogRollup.objects.get(ip_address="1.1.1.1").count, 4)
+
+    def test_retention_drops_old_partitions(self):
+        old_day = timezone.localdate() - timedelta(days=60)
+        ensure_partition(old_day)
+        ensure_partition(timezone.localdate())
+
+        dropped = drop_expired_request_logs()
+
+        self.assertEqual(dropped, [partition_model(old_day)._meta.db_table])
+        self.assertEqual(list(RequestLogPartition.objects.values_list('day', flat=True)),
+                         [timezone.localdate()])
+
+
+# Test for real-time abuse detection
+@override_settings(ABUSE_AUTO_BLOCK_SECONDS=600)
+class AbuseDetectionTests(TestCase):
+    def setUp(self):
+        redis = get_redis_connection("default")
+        for key in redis.scan_iter("abuse:*"):
+            redis.delete(key)
+
+    def test_flags_ip_once_threshold_is_crossed(self):
+        detector = AbuseDetector(request_threshold=2, sensitive_paths=['/login'])
+        with mock.patch("product_api.tasks.persist_flagged_ips.delay") as delay:
+            for _ in range(3):
+                detector.record("198.51.100.1", "/api/products/")
+            detector.record("198.51.100.2", "/login")
+            detector.record("198.51.100.3", "/api/products/")
+        self.assertEqual(delay.call_count, 2)
+
+        self.assertEqual(persist_flagged_ips(), 2)
+        self.assertEqual(
+            set(SuspiciousIP.objects.values_list("ip_address", flat=True)),
+            {"198.51.100.1", "198.51.100.2"})
+        self.assertIn("/login", SuspiciousIP.objects.get(ip_address="198.51.100.2").reason)
+        self.assertEqual(BlockedIP.objects.filter(expires_at__isnull=False).count(), 2)
+
+    def test_sensitive_paths_match_by_prefix(self):
+        detector = AbuseDetector(sensitive_paths=['/admin'])
+        with mock.patch("product_api.tasks.persist_flagged_ips.delay") as delay:
+            detector.record("198.51.100.4", "/administer/")
+            detector.record("198.51.100.5", "/admin/product_api/users/")
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(drain_pending_flags(), {
+            "198.51.100.5": "Accessed sensitive path: /admin/product_api/users/"})
+
+    def test_hourly_reconciliation_reads_the_last_complete_hour(self):
+        top = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for ip, path, hour, count in [
+            ("198.51.100.6", "/api/products/", top - timedelta(hours=1), 150),
+            # 120 in total, but never over 100 within one hour
+            ("198.51.100.7", "/api/products/", top - timedelta(hours=1), 60),
+            ("198.51.100.7", "/api/products/", top - timedelta(hours=2), 60),
+            # The current hour is still filling up
+            ("198.51.100.8", "/api/products/", top, 500),
+            ("198.51.100.9", "/admin/login/", top - timedelta(hours=1), 1),
+        ]:
+            RequestLogRollup.objects.create(ip_address=ip, path=path, country="",
+                                            hour=hour, count=count, exact_count=count)
+        self.assertEqual(flag_suspicious_ips(), 2)
+        self.assertEqual(
+            set(SuspiciousIP.objects.values_list("ip_address", flat=True)),
+            {"198.51.100.6", "198.51.100.9"})
+
+    def test_sampled_rows_are_reported_but_not_held_to_the_hourly_threshold(self):
+        # On a route logged at 1% a light client (2 requests) and a burst
+        # (200 requests) each leave two rows worth 100. Kept two days back,
+        # off the partition the app's buffer writes to
+        top = (timezone.now() - timedelta(days=2)).replace(minute=0, second=0, microsecond=0)
+        logged_at = top - timedelta(minutes=30)
+        classifier = PathClassifier(sampling={"GET /api/products/": 0.01})
+        buffer = RequestLogBuffer(flush_interval=0)
+        middleware = RequestLoggingMiddleware(lambda request: HttpResponse())
+        draws = [0.0, 0.0] + [0.0 if i % 100 == 0 else 0.5 for i in range(200)]
+        with mock.patch("product_api.middleware.path_classifier", classifier), \
+                mock.patch("product_api.middleware.abuse_detector",
+                           AbuseDetector(request_threshold=100)), \
+                mock.patch("product_api.middleware.request_log_buffer", buffer), \
+                mock.patch("product_api.middleware.now", return_value=logged_at), \
+                mock.patch("product_api.sampling.random.random", side_effect=draws), \
+                mock.patch("product_api.tasks.persist_flagged_ips.delay"):
+            for ip, requests in (("198.51.100.11", 2), ("198.51.100.10", 200)):
+                for _ in range(requests):
+                    middleware(RequestFactory().get("/api/products/", REMOTE_ADDR=ip))
+        self.assertEqual(buffer.flush(), 4)
+
+        # The burst is caught by the real-time detector, which sees every request
+        self.assertEqual(list(drain_pending_flags()), ["198.51.100.10"])
+
+        day = timezone.localdate(logged_at)
+        partition_model(day).objects.update(country="")
+        with mock.patch("product_api.tasks.open_partitions",
+                        return_value=RequestLogPartition.objects.filter(day=day)):
+            self.assertEqual(rollup_request_logs(), 400)
+        self.assertEqual(
+            RequestLogRollup.objects.get(ip_address="198.51.100.11").exact_count, 0)
+        with mock.patch("product_api.tasks.now", return_value=top + timedelta(minutes=5)):
+            self.assertEqual(flag_suspicious_ips(), 0)
+        self.assertFalse(SuspiciousIP.objects.exists())
+
+
+# Test for the global token-bucket rate limiter
+@override_settings(RATELIMIT_ENABLE=True)
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        redis = get_redis_connection("default")
+        for key in redis.scan_iter("throttle:*"):
+            redis.delete(key)
+
+    def test_sheds_requests_over_the_bucket_with_headers(self):
+        policy = RatePolicy("list-all-product", rate="2/m")
+        with mock.patch.dict(rate_limiter.policies, {"list-all-product": policy}):
+            responses = [self.client.get("/api/products/") for _ in range(3)]
+
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertEqual(responses[0]["RateLimit-Limit"], "2")
+        self.assertEqual(responses[1]["RateLimit-Remaining"], "0")
+        self.assertIn("Retry-After", responses[2])
+
+    def test_forged_forwarded_for_does_not_get_a_fresh_bucket(self):
+        policy = RatePolicy("list-all-product", rate="2/m")
+        with mock.patch.dict(rate_limiter.policies, {"list-all-product": policy}), \
+                mock.patch("product_api.utils.TRUSTED_PROXY_COUNT", 1):
+            responses = [
+                self.client.get("/api/products/",
+                                HTTP_X_FORWARDED_FOR=f"198.51.100.{i}, 203.0.113.5")
+                for i in range(3)
+            ]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="198.51.100.1",
+                                       REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(get_client_ip(request), "203.0.113.5")
+        with mock.patch("product_api.utils.TRUSTED_PROXY_COUNT", 1):
+            self.assertEqual(get_client_ip(request), "198.51.100.1")
+
+
+# Test for Server-Timing instrumentation
+@override_settings(RATELIMIT_ENABLE=False)
+class PerformanceMiddlewareTests(TestCase):
+    def test_reports_server_timing_and_endpoint_percentiles(self):
+        response = self.client.get("/api/categories/")
+        timing = response["Server-Timing"]
+        self.assertIn("total;dur=", timing)
+        self.assertIn("db;dur=", timing)
+        self.assertIn("cache;dur=", timing)
+
+        admin = Users.objects.create_superuser(username="boss", password="password123")
+        client = APIClient()
+        client.force_authenticate(admin)
+        stats = client.get("/api/admin/performance/").data["endpoints"]
+        self.assertIn("GET /api/categories/", [row["endpoint"] for row in stats])
+
+
+# Test for the request-log path classifier
+class PathClassifierTests(TestCase):
+    def test_bypass_and_longest_prefix_sampling(self):
+        classifier = PathClassifier(
+            bypass_prefixes=["/static/", "/health/"],
+            sampling={"GET /api/products/": 0.01, "/api/": 0.5, "/api/products/": 0.2},
+            default_rate=1.0)
+
+        self.assertTrue(classifier.is_bypassed("/static/css/site.css"))
+        self.assertFalse(classifier.is_bypassed("/api/static/"))
+        self.assertEqual(classifier.sample_rate("GET", "/api/products/42/"), 0.01)
+        self.assertEqual(classifier.sample_rate("POST", "/api/products/create/"), 0.2)
+        self.assertEqual(classifier.sample_rate("GET", "/api/token/"), 0.5)
+        self.assertEqual(classifier.sample_rate("GET", "/admin/"), 1.0)
+
+    def test_sampled_out_requests_still_count_and_log_errors(self):
+        classifier = PathClassifier(bypass_prefixes=["/health/"],
+                                    sampling={"/api/": 0.0})
+        middleware = RequestLoggingMiddleware(lambda request: HttpResponse(status=404))
+        request_factory = RequestFactory()
+        with mock.patch("product_api.middleware.path_classifier", classifier), \
+                mock.patch("product_api.middleware.abuse_detector") as detector, \
+                mock.patch("product_api.middleware.request_log_buffer") as buffer:
+            middleware(request_factory.get("/health/"))
+            self.assertFalse(detector.record.called)
+
+            middleware(request_factory.get("/api/missing/"))
+            detector.record.assert_called_once()
+            self.assertEqual(buffer.push.call_args[0][0][2], "/api/missing/")
+
+
+# Test for the native async read path
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.factory = AsyncRequestFactory()
+        user = Users.objects.create_user(username="seller", password="password123")
+        self.category = Category.objects.create(name="Bags", description="Carry bags")
+        self.products = [
+            Product.objects.create(
+                name=f"Backpack {i}", description="Laptop backpack", price="30.00",
+                stock_quantity=5, category=self.category, user_id=user)
+            for i in range(3)
+        ]
+
+    async def test_product_reads_use_the_async_orm(self):
+        response = await async_views.product_details(
+            self.factory.get("/api/products/x/"), pk=self.products[0].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Backpack 0", response.content)
+
+        response = await async_views.related_products(
+            self.factory.get("/api/products/x/related/"), pk=self.products[0].pk)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+        response = await async_views.category_list(
+            self.factory.get("/api/categories/", {"search": "bag"}))
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+    @override_settings(RATELIMIT_ENABLE=False)
+    def test_prerendered_bodies_match_the_drf_views(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(name="Sac à dos", price="30.50")
+        for path, view, kwargs in [
+            (f"/api/products/{product.pk}/", async_views.product_details, {"pk": product.pk}),
+            ("/api/products/", async_views.product_list, {}),
+        ]:
+            clear_catalog_cache()
+            response_store._local.clear()
+            drf = self.client.get(path)
+            clear_catalog_cache()
+            response_store._local.clear()
+            native = async_to_sync(view)(self.factory.get(path), **kwargs)
+            self.assertEqual(native.content, drf.content)
+            self.assertEqual(native["Content-Type"], drf["Content-Type"])
+
+    async def test_middleware_runs_in_async_mode(self):
+        async def view(request):
+            return HttpResponse("ok")
+
+        middleware = RequestLoggingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.factory.get("/api/products/"))
+        self.assertEqual(response.status_code, 200)
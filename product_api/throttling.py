@@ -0,0 +1,122 @@
+import math
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .utils import get_client_ip
+
+# Atomic token bucket. Refills the bucket for the time elapsed since the last
+# call, takes `cost` tokens if available and returns {allowed, tokens left}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / 1000 * rate)
+
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parse '120/m' style rates into (requests, period seconds)."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip().lower()[0]]
+
+
+class RatePolicy:
+    def __init__(self, name, rate, key='ip', burst=None):
+        self.name = name
+        count, period = parse_rate(rate)
+        self.capacity = burst or count
+        self.refill_rate = count / period  # tokens per second
+        self.key = key
+
+    def __repr__(self):
+        return f"<RatePolicy {self.name} {self.capacity} @ {self.refill_rate:.3f}/s by {self.key}>"
+
+
+def jwt_subject(request):
+    """Return the verified user id claim from a Bearer token, if any."""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    parts = header.split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        token = JWTAuthentication().get_validated_token(parts[1])
+    except (InvalidToken, TokenError):
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+def client_identity(request, key):
+    """Build the bucket identity for a policy keyed by ip, user or jwt."""
+    if key in ('user', 'jwt'):
+        user = getattr(request, 'user', None)
+        if key == 'user' and user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        subject = jwt_subject(request)
+        if subject:
+            return f"jwt:{subject}"
+    return f"ip:{get_client_ip(request)}"
+
+
+class TokenBucketLimiter:
+    def __init__(self, policies, default=None):
+        self.policies = {
+            name: RatePolicy(name, **options) for name, options in policies.items()}
+        self.default = RatePolicy('default', **default) if default else None
+        self._script = None
+
+    def policy_for(self, url_name):
+        return self.policies.get(url_name, self.default)
+
+    def _bucket_script(self):
+        if self._script is None:
+            self._script = get_redis_connection("default").register_script(
+                TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    def hit(self, policy, identity, cost=1):
+        """
+        Take `cost` tokens from the bucket. Returns (allowed, headers) with
+        the RateLimit-* headers describing the bucket afterwards.
+        """
+        key = f"throttle:{policy.name}:{identity}"
+        allowed, tokens = self._bucket_script()(
+            keys=[key],
+            args=[policy.capacity, policy.refill_rate, int(time.time() * 1000), cost])
+        tokens = float(tokens)
+
+        headers = {
+            'RateLimit-Limit': str(policy.capacity),
+            'RateLimit-Remaining': str(int(tokens)),
+            'RateLimit-Reset': str(math.ceil((policy.capacity - tokens) / policy.refill_rate)),
+        }
+        if not allowed:
+            headers['Retry-After'] = str(math.ceil((cost - tokens) / policy.refill_rate))
+        return bool(allowed), headers
+
+
+rate_limiter = TokenBucketLimiter(
+    getattr(settings, "RATE_LIMIT_POLICIES", {}),
+    default=getattr(settings, "RATE_LIMIT_DEFAULT_POLICY", None),
+)
@@ -1,5 +1,6 @@
 # product_api/urls.py
 
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -12,23 +13,41 @@ from .views import (
     ProductImageListView, verify_payment, GlobalAccountListView,
     DailySalesListView, BlockedIPListView, RequestLogListView,
     SuspiciousIPListView, ReservationCheckoutView, verify_Reserve_payment,
-    RelatedProductViews, UserDetailViews, UserListView, TransactionListView)
+    RelatedProductViews, UserDetailViews, UserListView, TransactionListView,
+    PerformanceStatsView, ProductSuggestView, ProductFacetsView)
 from .auth import (CustomTokenObtainPairView, CustomTokenRefreshView,
                    LogoutView, RegisterView)
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'categories', CategoryView, basename='category')
 router.register(r'reservations', ReservationViewSet, basename='reservation')
 router.register(r'orderitems', OrderItemViewSet, basename='orderitems')
 
-urlpatterns = [
+# Hot catalog reads: native async views under ASGI, DRF views otherwise
+if settings.ASYNC_READ_VIEWS:
+    product_list_view = async_views.product_list
+    product_details_view = async_views.product_details
+    related_products_view = async_views.related_products
+    async_urlpatterns = [
+        path('categories/', async_views.category_list, name='category-list'),
+    ]
+else:
+    product_list_view = ProductListView.as_view()
+    product_details_view = ProductDetailsView.as_view()
+    related_products_view = RelatedProductViews.as_view()
+    async_urlpatterns = []
+
+urlpatterns = async_urlpatterns + [
     # Product URLs
     path('products/create/', ProductCreateView.as_view(), name='product-create'),
-    path('products/', ProductListView.as_view(), name='list-all-product'),
+    path('products/', product_list_view, name='list-all-product'),
     path('products/search/', ProductSearchView.as_view(), name='search-product'),
-    path('products/<int:pk>/', ProductDetailsView.as_view(), name='product-details'),
-    path('products/<int:pk>/update/', ProductUpdateView.as_view(), name='product-update'),
-    path('products/<int:pk>/delete/', ProductDeleteView.as_view(), name='product-delete'),
+    path('products/suggest/', ProductSuggestView.as_view(), name='product-suggest'),
+    path('products/facets/', ProductFacetsView.as_view(), name='product-facets'),
+    path('products/<uuid:pk>/', product_details_view, name='product-details'),
+    path('products/<uuid:pk>/update/', ProductUpdateView.as_view(), name='product-update'),
+    path('products/<uuid:pk>/delete/', ProductDeleteView.as_view(), name='product-delete'),
     path('products/image/upload/', ProductImageUploadView.as_view(), name='product-image-upload'),
     path('Product/image/', ProductImageListView.as_view(), name='get-all-images'),
 
@@ -69,8 +88,9 @@ urlpatterns = [
     path('admin/suspicious-ip/', SuspiciousIPListView.as_view(), name='suspicious-ip'),
     path('admin/blocked-ip/', BlockedIPListView.as_view(), name='blocked-ip'),
     path('admin/request-log/', RequestLogListView.as_view(), name='request-log'),
+    path('admin/performance/', PerformanceStatsView.as_view(), name='performance-stats'),
 
     # Related Product View
-    path("products/<uuid:pk>/related/", RelatedProductViews.as_view(), name="related-products"),
+    path("products/<uuid:pk>/related/", related_products_view, name="related-products"),
     path('transactions/', TransactionListView.as_view(), name='transactions'),
 ]
@@ -1,23 +1,51 @@
-from .models import Product
-from django.core.cache import cache
+from .models import Product, Reviews
 import logging
+from django.conf import settings
+from django.db.models import Prefetch
 from django_redis import get_redis_connection
-from django.db.models import Avg
 
+PRODUCT_LIST_REVIEWS = getattr(settings, 'PRODUCT_LIST_REVIEWS', 3)
+TRUSTED_PROXY_COUNT = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
 
-# Caching All products View at Low level
-def get_all_products():
-    products = cache.get('all_products')
-    if products is None:
-        products = Product.objects.prefetch_related(
-            'reviews__user_id').annotate(avg_rating=Avg('reviews__ratings'))
-        cache.set('all_products', products, timeout=3600)
-    return products
+
+# Product queryset for list pages, loading only the relations that
+# ProductListSerializer will expand. Reviews are capped to the latest
+# PRODUCT_LIST_REVIEWS per product by a sliced (windowed) prefetch.
+def product_list_queryset(expand=()):
+    queryset = Product.objects.select_related('category')
+    if 'product_images' in expand:
+        queryset = queryset.prefetch_related('product_images')
+    if 'reviews' in expand:
+        latest = Reviews.objects.select_related('user_id').order_by(
+            '-created_at', '-reviews_id')[:PRODUCT_LIST_REVIEWS]
+        queryset = queryset.prefetch_related(
+            Prefetch('reviews', queryset=latest, to_attr='latest_reviews'))
+    return queryset
+
+
+# Single-product reads (detail, related products)
+def product_detail_queryset():
+    return Product.objects.select_related('category', 'user_id').prefetch_related(
+        'product_images', 'reviews__user_id')
 
 
 logger = logging.getLogger(__name__)
 
 
+# Client IP. Each of the TRUSTED_PROXY_COUNT proxies in front of the app
+# appends the address it received the request from to X-Forwarded-For, so
+# the client is that many hops from the right; anything further left was
+# sent by the client and can be forged. With no trusted proxy the header is
+# ignored.
+def get_client_ip(request):
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if TRUSTED_PROXY_COUNT and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.META.get("REMOTE_ADDR")
+
+
 # Logging Redis Cache Metrics
 def get_redis_cache_metrics():
     try:
@@ -4,38 +4,45 @@ from django.core.exceptions import PermissionDenied
 from .models import (Product, ProductImage, Reviews,
                      Reservation, Wishlist, Category,
                      Order, OrderItem, Users, Account,
-                     DailySales, BlockedIP, RequestLog, SuspiciousIP,
-                     Transaction)
+                     DailySales, BlockedIP, RequestLogRollup, SuspiciousIP,
+                     Transaction, PaymentWebhook)
 from .serializer import (
-    ProductSerializer, ProductImageSerializer, WishlistSerializer,
+    ProductSerializer, ProductListSerializer, ProductImageSerializer,
+    WishlistSerializer, product_list_expansions,
     ReservationSerializer, CategorySerializer, ReviewSerializer,
     OrderItemSerializer, OrderSerializer, AccountSerializer,
     DailySalesSerializer, SupiciousIPSerializer, BlockedIPSerializer,
-    RequestlogSerializer, UserSerializer, TransactionSerializer)
-from .filters import ProductFilter
+    RequestLogRollupSerializer, UserSerializer, TransactionSerializer)
+from .filters import ProductFilter, RankedSearchFilter
 from .pagination import (ProductPagination, ReviewsPagination,
-                         CategoryPagination, TransactionPagination)
+                         CategoryPagination, TransactionPagination,
+                         RequestLogPagination, SuspiciousIPPagination)
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
-import requests
 from django.conf import settings
-from .utils import get_all_products
-from django.views.decorators.cache import cache_page
+from .utils import product_list_queryset, product_detail_queryset
+from .catalog import cached_payload, catalog_params
+from .conditional import catalog_condition, product_condition
+from .prerender import prerendered
 from django.utils.decorators import method_decorator
 import logging
-from decimal import Decimal
-from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework.exceptions import APIException
-from django.core.cache import cache
+from rest_framework.exceptions import APIException, ValidationError
+from .perf import endpoint_stats
+from .suggest import product_suggester, SUGGEST_MAX_RESULTS
+from .facets import facet_params, product_facets
+from .payments import TX_REF_PATTERN, receive_webhook
+from .chapa import ChapaError, get_chapa_client
+from .recommendations import (RELATED_PRODUCTS_LIMIT, category_best_sellers,
+                              recommended_products)
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -73,35 +80,91 @@ class ProductCreateView(generics.CreateAPIView):
         serializer.save(user_id=self.request.user)
 
 
-# product List View
+# product List View, served from the catalog snapshot cache
 @method_decorator(csrf_exempt, name='dispatch')
-@method_decorator(cache_page(60 * 15), name='dispatch')
+@method_decorator(catalog_condition('list', encoded=True), name='get')
+@method_decorator(prerendered, name='get')
 class ProductListView(generics.ListAPIView):
-    serializer_class = ProductSerializer
+    serializer_class = ProductListSerializer
     pagination_class = ProductPagination
     permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = ProductFilter
+    ordering_fields = ['price', 'created_at', 'rating_avg', 'rating_count']
 
     def get_queryset(self):
-        return get_all_products()
+        return product_list_queryset(product_list_expansions(self.request))
+
+    def list(self, request, *args, **kwargs):
+        payload = cached_payload(
+            'list', catalog_params(request),
+            lambda: super(ProductListView, self).list(request, *args, **kwargs).data)
+        return Response(payload)
 
 
 class ProductSearchView(generics.ListAPIView):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
+    serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter,
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter,
                        filters.OrderingFilter]
-    search_fields = ['name', 'description', 'category__name']
-    ordering_fields = ['price', 'created_at']
+    filterset_class = ProductFilter
+    ordering_fields = ['price', 'created_at', 'rating_avg', 'rating_count']
     pagination_class = ProductPagination
 
+    def get_queryset(self):
+        return product_list_queryset(product_list_expansions(self.request))
+
+
+# Sidebar counts for the current ProductFilter selection, cached per
+# normalised filter set in the catalog generation
+class ProductFacetsView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        filterset = ProductFilter(
+            request.query_params, queryset=Product.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        payload = cached_payload(
+            'facets', facet_params(filterset), lambda: product_facets(filterset.qs))
+        return Response(payload)
 
+
+# Autocomplete for the search box, served from an in-memory index
+class ProductSuggestView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Prefix typed so far'),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ])
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGEST_MAX_RESULTS)),
+                        SUGGEST_MAX_RESULTS)
+        except ValueError:
+            limit = SUGGEST_MAX_RESULTS
+        return Response({
+            'query': query,
+            'results': product_suggester.suggest(query, limit),
+        })
+
+
+@method_decorator(product_condition(encoded=True), name='get')
+@method_decorator(prerendered, name='get')
 class ProductDetailsView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    queryset = product_detail_queryset()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
 
+    def retrieve(self, request, *args, **kwargs):
+        payload = cached_payload(
+            'detail', str(kwargs['pk']),
+            lambda: super(ProductDetailsView, self).retrieve(request, *args, **kwargs).data)
+        return Response(payload)
+
 
 class ProductUpdateView(generics.UpdateAPIView):
     queryset = Product.objects.all()
@@ -140,6 +203,8 @@ class ProductImageListView(generics.ListAPIView):
 
 
 # Category Views
+@method_decorator(catalog_condition('categories'), name='list')
+@method_decorator(catalog_condition('categories'), name='retrieve')
 class CategoryView(viewsets.ModelViewSet):
     queryset = Category.objects.all().order_by('category_id')
     serializer_class = CategorySerializer
@@ -148,6 +213,7 @@ class CategoryView(viewsets.ModelViewSet):
                        filters.OrderingFilter]
     search_fields = ['name', 'description']
     filterset_fields = ['name']
+    ordering_fields = ['name']
     pagination_class = CategoryPagination
 
 
@@ -161,13 +227,15 @@ class ReviewsCreateView(generics.CreateAPIView):
         serializer.save(user_id=self.request.user)
 
 
+@method_decorator(catalog_condition('reviews'), name='get')
 class ReviewsListView(generics.ListAPIView):
-    queryset = Reviews.objects.all().order_by('reviews_id')
+    queryset = Reviews.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = ReviewsPagination
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['product_id']  # Enables ?product=UUID filtering
+    ordering_fields = ['created_at', 'ratings']
 
 
 # Order Views
@@ -186,6 +254,9 @@ class TransactionListView(generics.ListAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = TransactionPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['tx_ref', 'status']
+    ordering_fields = ['created_at', 'amount']
 
     def get_queryset(self):
         return Transaction.objects.filter(user=self.request.user)
@@ -278,21 +349,18 @@ class WishlistCheckoutView(APIView):
             }
         }
 
-        headers = {
-            "Authorization": f"Bearer {settings.CHAPA_SECRET}",
-            "Content-Type": "application/json"
-        }
         logger.info("Chapa payload: %s", payload)
         try:
-            response = requests.post(
-                f"{settings.CHAPA_API_URL}/v1/transaction/initialize", json=payload, headers=headers)
-            data = response.json()
+            data = get_chapa_client().initialize(payload)
 
             if data.get("status") != "success":
                 return Response(
                     {'error': data.get("message", "Failed to initiate payment")}, status=500)
 
             checkout_url = data["data"]["checkout_url"]
+            # Polled through TransactionListView until the webhook settles it
+            Transaction.objects.create(
+                user=user, tx_ref=tx_ref, amount=total_amount, status="pending")
             return Response({
                 "checkout_url": checkout_url,
                 "tx_ref": tx_ref,
@@ -304,11 +372,33 @@ class WishlistCheckoutView(APIView):
                 ]
             })
 
+        except ChapaError as e:
+            return Response(
+                {'error': f'Payment initiation failed: {str(e)}'}, status=503)
         except Exception as e:
             return Response(
                 {'error': f'Payment initiation failed: {str(e)}'}, status=500)
 
 
+# Payment webhooks are only recorded here and acknowledged with a 202; a
+# Celery worker verifies them with Chapa and creates the order (see
+# product_api/payments.py). Buyers poll the pending Transaction for the result.
+def receive_payment_webhook(request, cart):
+    tx_ref = request.data.get('tx_ref')
+
+    if not tx_ref:
+        return Response({'error': 'Missing tx_ref'}, status=400)
+    if not isinstance(tx_ref, str) or not TX_REF_PATTERN.match(tx_ref):
+        return Response({'error': 'Invalid tx_ref'}, status=400)
+
+    payload = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
+    webhook, created = receive_webhook(tx_ref, cart, payload)
+    if created:
+        logger.info("Payment webhook %s queued for settlement", tx_ref)
+    return Response({'tx_ref': tx_ref, 'status': webhook.status},
+                    status=status.HTTP_202_ACCEPTED)
+
+
 # ✅ Define request body schema
 verify_payment_schema = openapi.Schema(
     type=openapi.TYPE_OBJECT,
@@ -325,135 +415,19 @@ verify_payment_schema = openapi.Schema(
 @swagger_auto_schema(
     method='post',
     request_body=verify_payment_schema,
-    responses={200: "Payment verified and order created"}
+    responses={202: "Payment received; the order is settled in the background"}
 )
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def verify_payment(request):
-    tx_ref = request.data.get('tx_ref')
-
-    if not tx_ref:
-        return Response({'error': 'Missing tx_ref'}, status=400)
-
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET}",
-        "Content-Type": "application/json"
-    }
-
-    try:
-        # Verify payment with Chapa
-        response = requests.get(
-            f"{settings.CHAPA_API_URL}/v1/transaction/verify/{tx_ref}",
-            headers=headers)
-
-        result = response.json()
-
-        if result.get("status") != "success" or "data" not in result:
-            return Response({'error': 'Payment not successful'}, status=400)
-
-        data = result["data"]
-        email = data.get("customer", {}).get("email")
-        amount = Decimal(data.get("amount", "0"))
-
-        # Get user from tx_ref OR email
-        short_uuid = tx_ref.split("-")[1]
-        user = Users.objects.filter(user_id__startswith=short_uuid).first() \
-            or Users.objects.filter(email=email).first()
-
-        if not user:
-            return Response({'error': 'User not found'}, status=404)
-
-        wishlist_items = Wishlist.objects.select_related(
-            'product').filter(user=user)
-        if not wishlist_items.exists():
-            return Response({'error': 'Your wishlist is empty.'}, status=400)
-
-        with transaction.atomic():
-            # Check stock and reduce it atomically
-            for item in wishlist_items:
-                product = Product.objects.select_for_update().get(
-                    product_id=item.product.product_id)
-                if item.quantity > product.stock_quantity:
-                    return Response({
-                        'error': f"Product '{product.name}' only has {product.stock_quantity} items available"
-                    }, status=400)
-                print(f"Before reduction: {product.name} has {product.stock_quantity} quantity's")
-                product.stock_quantity -= item.quantity
-                product.save()
-                print(f"Stock reduced: {product.name} now {product.stock_quantity} quantity's")
-            
-            # Clear cache immediately after updating products
-                cache.delete('all_properties')
-                print('cached cleared')
-
-            # Create the order
-            order = Order.objects.create(
-                user=user,
-                tx_ref=tx_ref,
-                total_amount=amount,
-                created_at=timezone.now()
-            )
-            # create the Transaction
-            Transaction.objects.create(
-                user=user,
-                tx_ref=tx_ref,
-                amount=amount,
-                status=result.get("status", "unknown")
-
-            )
-
-            # Create order items
-            for item in wishlist_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    price=item.product.price,
-                    quantity=item.quantity
-                )
-
-            # Update global account
-            stock_sold = sum(item.quantity for item in wishlist_items)
-            account, _ = Account.objects.get_or_create(
-                account_id="00000000-0000-0000-0000-000000000001"
-            )
-            account.total_sales_amount += amount
-            account.total_transactions += 1
-            account.total_stock_sold += stock_sold
-            account.save()
-            print(f'{amount} has been added to Account')
-
-            # Clear wishlist
-            wishlist_items.delete()
-
-        # Send confirmation email
-        send_mail(
-            subject='Order Confirmation',
-            message=f'Thank you for your payment! Your order {order.order_id} has been confirmed.',
-            from_email='noreply@yourdomain.com',
-            recipient_list=[user.email],
-            fail_silently=True
-        )
-
-        logger.info(
-            f"User {user.email} verified payment {tx_ref}, order {order.order_id} created successfully.")
-
-        return Response({
-            'message': 'Payment verified and order created successfully',
-            'order_id': str(order.order_id),
-            'tx_ref': tx_ref,
-            'amount': str(amount)
-        })
-
-    except Exception as e:
-        logger.error(f"Payment verification failed for tx_ref {tx_ref}: {str(e)}")
-        return Response({'error': str(e)}, status=500)
+    return receive_payment_webhook(request, PaymentWebhook.WISHLIST)
 
 
 class GlobalAccountListView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = AccountSerializer
-    queryset = Account.objects.all()
+    queryset = Account.objects.with_totals()
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {
         'updated_at': ['gte', 'lte'],
@@ -474,17 +448,42 @@ class BlockedIPListView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
 
 
+# Hourly request counts; raw logs live in per-day partitions
 class RequestLogListView(generics.ListAPIView):
-    queryset = RequestLog.objects.all()
-    serializer_class = RequestlogSerializer
+    queryset = RequestLogRollup.objects.all()
+    serializer_class = RequestLogRollupSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = RequestLogPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        'ip_address': ['exact'],
+        'country': ['exact'],
+        'hour': ['gte', 'lte'],
+    }
+    ordering_fields = ['hour', 'count']
+
+
+# Per-endpoint latency percentiles collected by PerformanceMiddleware. They
+# are kept per process, so with several workers each request shows the
+# partial distribution of whichever worker (pid) answered it.
+class PerformanceStatsView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
+    def get(self, request):
+        return Response({
+            'scope': 'process',
+            'pid': os.getpid(),
+            'endpoints': endpoint_stats.summary(),
+            'payment_gateway': get_chapa_client().summary(),
+        })
+
 
 # SuspiciousIPList View
 class SuspiciousIPListView(generics.ListAPIView):
     queryset = SuspiciousIP.objects.all()
     serializer_class = SupiciousIPSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = SuspiciousIPPagination
 
 
 # Reserve Payment Checkout View
@@ -523,21 +522,18 @@ class ReservationCheckoutView(APIView):
             }
         }
 
-        headers = {
-            "Authorization": f"Bearer {settings.CHAPA_SECRET}",
-            "Content-Type": "application/json"
-        }
         logger.info("Chapa payload: %s", payload)
         try:
-            response = requests.post(
-                f"{settings.CHAPA_API_URL}/v1/transaction/initialize", json=payload, headers=headers)
-            data = response.json()
+            data = get_chapa_client().initialize(payload)
 
             if data.get("status") != "success":
                 return Response({'error': data.get(
                     "message", "Failed to initiate payment")}, status=500)
 
             checkout_url = data["data"]["checkout_url"]
+            # Polled through TransactionListView until the webhook settles it
+            Transaction.objects.create(
+                user=user, tx_ref=tx_ref, amount=total_amount, status="pending")
             return Response({
                 "checkout_url": checkout_url,
                 "tx_ref": tx_ref,
@@ -549,6 +545,9 @@ class ReservationCheckoutView(APIView):
                 ]
             })
 
+        except ChapaError as e:
+            return Response(
+                {'error': f'Payment initiation failed: {str(e)}'}, status=503)
         except Exception as e:
             return Response(
                 {'error': f'Payment initiation failed: {str(e)}'}, status=500)
@@ -570,130 +569,13 @@ verify_reserve_schema = openapi.Schema(
 @swagger_auto_schema(
     method='post',
     request_body=verify_reserve_schema,
-    responses={200: "Reserve payment verified and order created"}
+    responses={202: "Reserve payment received; the order is settled in the background"}
 )
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def verify_Reserve_payment(request):
-    tx_ref = request.data.get('tx_ref')
-
-    if not tx_ref:
-        return Response({'error': 'Missing tx_ref'}, status=400)
-
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET}",
-        "Content-Type": "application/json"
-    }
-
-    try:
-        # Verify payment with Chapa
-        response = requests.get(
-            f"{settings.CHAPA_API_URL}/v1/transaction/verify/{tx_ref}",
-            headers=headers
-        )
-        result = response.json()
-
-        if result.get("status") != "success" or "data" not in result:
-            return Response({'error': 'Payment not successful'}, status=400)
-
-        data = result["data"]
-        email = data.get("customer", {}).get("email")
-        amount = Decimal(data.get("amount", "0"))
-
-        # Get user from tx_ref OR email
-        short_uuid = tx_ref.split("-")[1]
-        user = Users.objects.filter(user_id__startswith=short_uuid).first() \
-            or Users.objects.filter(email=email).first()
-
-        if not user:
-            return Response({'error': 'User not found'}, status=404)
-
-        reserve_items = Reservation.objects.select_related(
-            'product').filter(user=user)
-        if not reserve_items.exists():
-            return Response(
-                {'error': 'Your Reserve list is empty.'}, status=400)
-
-        with transaction.atomic():
-            # Check stock and reduce it atomically
-            for item in reserve_items:
-                product = Product.objects.select_for_update().get(
-                    product_id=item.product.product_id)
-                if item.quantity > product.stock_quantity:
-                    return Response({
-                        'error': f"Product '{product.name}' only has {product.stock_quantity} items available"
-                    }, status=400)
-                print(f"Before reduction: {product.name} has {product.stock_quantity} quantity's")
-                product.stock_quantity -= item.quantity
-                product.save()
-                print(f"Stock reduced: {product.name} now {product.stock_quantity} quantity's")
-
-                # Clear cache immediately after updating products
-                cache.delete('all_properties')
-
-            # Create the order
-            order = Order.objects.create(
-                user=user,
-                tx_ref=tx_ref,
-                total_amount=amount,
-                created_at=timezone.now()
-            )
-            # create Transation
-            Transaction.objects.create(
-                user=user,
-                tx_ref=tx_ref,
-                amount=amount,
-                status=result.get("status", "unknown")
-
-            )
-
-            # Create order items
-            for item in reserve_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    price=item.product.price,
-                    quantity=item.quantity
-                )
-
-            # Update global account
-            stock_sold = sum(item.quantity for item in reserve_items)
-            account, _ = Account.objects.get_or_create(
-                account_id="00000000-0000-0000-0000-000000000001"
-            )
-            account.total_sales_amount += amount
-            account.total_transactions += 1
-            account.total_stock_sold += stock_sold
-            account.save()
-            print(f'{amount} has been added to Account')
-
-            # Clear reservelist
-            reserve_items.delete()
-
-        # Send confirmation email
-        send_mail(
-            subject='Order Confirmation',
-            message=f'Thank you for your payment! Your order {order.order_id} has been confirmed.',
-            from_email='noreply@yourdomain.com',
-            recipient_list=[user.email],
-            fail_silently=True
-        )
-
-        logger.info(
-            f"User {user.email} verified payment {tx_ref}, order {order.order_id} created successfully.")
-
-        return Response({
-            'message': 'Payment verified and order created successfully',
-            'order_id': str(order.order_id),
-            'tx_ref': tx_ref,
-            'amount': str(amount)
-        })
-
-    except Exception as e:
-        logger.error(
-            f"Payment verification failed for tx_ref {tx_ref}: {str(e)}")
-        return Response({'error': str(e)}, status=500)
+    return receive_payment_webhook(request, PaymentWebhook.RESERVATION)
 
 
 class RelatedProductViews(generics.GenericAPIView):
@@ -701,21 +583,25 @@ class RelatedProductViews(generics.GenericAPIView):
     serializer_class = ProductSerializer
 
     def get(self, request, pk):
+        payload = cached_payload('related', str(pk), lambda: self.related_payload(pk))
+        return Response(payload, status=status.HTTP_200_OK)
+
+    def related_payload(self, pk):
         # fetch the current product
         product = get_object_or_404(Product, pk=pk)
 
-        # Get related products from the same category (excluding self)
-        related_product = Product.objects.filter(
-            category=product.category).exclude(pk=product.pk)[:6]
-
-        if not related_product.exists():
-            return Response(
-                {
-                    "message": "No related products found in this category.",
-                    "results": []
-                },
-                status=status.HTTP_200_OK
-            )
+        # Co-purchased products first, then the category's best sellers
+        related_product = list(recommended_products(product.pk))
+        if len(related_product) < RELATED_PRODUCTS_LIMIT:
+            related_product += category_best_sellers(
+                product, [p.pk for p in related_product],
+                RELATED_PRODUCTS_LIMIT - len(related_product))
+
+        if not related_product:
+            return {
+                "message": "No related products found in this category.",
+                "results": []
+            }
 
         serializer = self.get_serializer(related_product, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return serializer.data